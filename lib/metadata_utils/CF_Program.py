@@ -1,5 +1,6 @@
 import json
 import logging
+import re
 import unicodedata
 from json import JSONDecodeError
 from pathlib import Path
@@ -18,9 +19,10 @@ from mutagen.id3 import (
     TRCK,
     ID3NoHeaderError,
 )
-from mutagen.mp3 import MP3
 
 from .engraver import get_content_from_tags
+from .scanner import iter_mp3
+from .snapshots import SnapshotStore
 
 logger = logging.getLogger(__name__)
 
@@ -84,8 +86,7 @@ def get_all_mp3_as_obj(directory: str) -> list[Song]:
     """
     Returns as Song objects all mp3 files from a directory and it's sub-directories.
     """
-    p = Path(directory)
-    return [(Song(f)) for f in p.rglob('*.mp3') if f.is_file()]
+    return [Song(path) for path in sorted(iter_mp3(directory))]
 
 # if user input is %title, replace with title
 def _substitution(new_filename_pattern: str, song_data: dict[str, str]) -> str: 
@@ -97,6 +98,9 @@ def _substitution(new_filename_pattern: str, song_data: dict[str, str]) -> str:
     return new_value
 
 def get_song_data(song_path: str | Path) -> tuple[str, dict[str, str], ID3]:
+    # deferred, mutagen.mp3 is only needed once a song is opened
+    from mutagen.mp3 import MP3
+
     song_payload = None
     song_data = {}
 
@@ -121,63 +125,8 @@ def get_song_data(song_path: str | Path) -> tuple[str, dict[str, str], ID3]:
     
     return song_payload, song_data, audio.tags
 
-def set_tags(path: str, song: Song, image_type: (str | None), image_data: (bytes | None) = None) -> None:
-
-    audio = MP3(path, ID3=ID3)
-    
-    if audio.tags is None:
-        audio.add_tags()
-
-    if not isinstance(audio.tags, ID3):
-        msg = "Program unable to initialize ID3 tags for song"
-        logger.error(msg)
-        raise TypeError(msg)
-
-    audio.tags.delall("TXXX")
-    audio.tags.add(TPE1(encoding=3, text=[song.artist]))
-    audio.tags.add(TALB(encoding=3, text=[song.album]))
-    audio.tags.add(TIT2(encoding=3, text=[song.title]))
-    audio.tags.add(TRCK(encoding=3, text=[song.track]))
-    audio.tags.add(TPE2(encoding=3, text=["QueenPb + vedal987"]))
-    audio.tags.add(TDRC(encoding=3, text=[song.comment[:4]]))
-    audio.tags.add(TPOS(encoding=3, text=[song.album.replace("Disc ", "")]))
-
-    NEW_COMM_ENG_FRAME = COMM(encoding=2,lang='eng', desc='',text=[song.comment])
-    audio.tags.add(NEW_COMM_ENG_FRAME)
-    NEW_COMM_V1_ENG_FRAME = COMM(encoding=2,lang='eng', desc='ID3v1 Comment',text=[song.comment])
-    audio.tags.add(NEW_COMM_V1_ENG_FRAME)
-    
-    if image_data and image_type and (image_type.lower() in ("jpeg", "png")):
-
-        audio.tags.delall('APIC') 
-            
-        audio.tags.add(
-            APIC(
-                encoding=3,       
-                mime=f'image/{image_type}', 
-                type=3, 
-                desc='Cover (Front)', 
-                data=image_data
-            )
-        )
-        logger.debug("Image added to APIC frame")
-    # else:
-        # logger.debug(
-        #     f"image_data: {image_data[:10] if isinstance(image_data, bytes) else None}; "
-        #     f"image_type: {image_type};\n"
-        #     "No image was added to song"
-        # )
-
-    audio.save()
-    
-def set_tags_fast(path: str, song: Song, image_type: (str | None), image_data: (bytes | None) = None) -> None:
-
-    try:
-        tags = ID3(path)
-    except ID3NoHeaderError:
-        # If no tags exist, create a blank ID3 object
-        tags = ID3()
- 
+def apply_tags(tags: ID3, song: Song, image_type: (str | None), image_data: (bytes | None) = None) -> None:
+    """Sets the archive tags on an ID3 object, saving it is up to the caller."""
     tags.delall("TXXX")
     tags.add(TPE1(encoding=3, text=[song.artist]))
     tags.add(TALB(encoding=3, text=[song.album]))
@@ -213,27 +162,60 @@ def set_tags_fast(path: str, song: Song, image_type: (str | None), image_data: (
         #     "No image was added to song"
         # )
 
+def set_tags(path: str, song: Song, image_type: (str | None), image_data: (bytes | None) = None,
+             snapshot_store: (SnapshotStore | None) = None) -> None:
+    from mutagen.mp3 import MP3
+
+    if snapshot_store is not None:
+        snapshot_store.snapshot(path)
+
+    audio = MP3(path, ID3=ID3)
+    
+    if audio.tags is None:
+        audio.add_tags()
+
+    if not isinstance(audio.tags, ID3):
+        msg = "Program unable to initialize ID3 tags for song"
+        logger.error(msg)
+        raise TypeError(msg)
+
+    apply_tags(audio.tags, song, image_type, image_data)
+
+    audio.save()
+    
+def set_tags_fast(path: str, song: Song, image_type: (str | None), image_data: (bytes | None) = None,
+                  snapshot_store: (SnapshotStore | None) = None) -> None:
+
+    if snapshot_store is not None:
+        snapshot_store.snapshot(path)
+
+    try:
+        tags = ID3(path)
+    except ID3NoHeaderError:
+        # If no tags exist, create a blank ID3 object
+        tags = ID3()
+ 
+    apply_tags(tags, song, image_type, image_data)
+
     tags.save(path)
 
 
+FORBIDDEN_CHARS = str.maketrans({
+    '\\': ' backslash ',
+    '/': ' slash ',
+    ':': ' ', 
+    '*': '_', 
+    '?': ' ',
+    '"': "'",
+    '<': '[',
+    '>': ']',
+    '|': '_'
+})
+
+REPEATED_SPACES = re.compile(" {2,}")
+
 def sanitize_filename(filename: str) -> str:
-    FORBIDDEN_CHARS = {
-        '\\': ' backslash ',
-        '/': ' slash ',
-        ':': ' ', 
-        '*': '_', 
-        '?': ' ',
-        '"': "'",
-        '<': '[',
-        '>': ']',
-        '|': '_'
-    }
-
-    for char in FORBIDDEN_CHARS:
-        filename = filename.replace(char, FORBIDDEN_CHARS[char])
-
-    while("  " in filename):
-        filename = filename.replace("  ", " ")
+    filename = REPEATED_SPACES.sub(" ", filename.translate(FORBIDDEN_CHARS))
 
     ## some kanji were getting divided into two symbols: ヴ -> ウ  ゙
     filename = unicodedata.normalize('NFC', filename)
@@ -0,0 +1,324 @@
+import csv
+import json
+import logging
+import os
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from json import JSONDecodeError
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, TextIO
+
+from .engraver import get_raw_json
+from .hash_mutagen import get_audio_hash_fast
+from .scanner import iter_files
+from .stream_info import StreamInfo, StreamInfoError, read_stream_info
+
+logger = logging.getLogger(__name__)
+
+PAYLOAD_FIELDS = (
+    "Date", "Title", "Artist", "CoverArtist", "Version",
+    "Discnumber", "Track", "Comment", "Special", "xxHash"
+)
+
+CATALOGUE_COLUMNS = ("Path", *PAYLOAD_FIELDS, "Duration", "Bitrate")
+
+CACHE_FILENAME = ".song_adder_cache.json"
+
+EXPORT_FORMATS = ("csv", "jsonl", "parquet", "arrow")
+
+# rows per Arrow record batch, so columnar exports never hold the whole catalogue
+ARROW_BATCH_SIZE = 4096
+
+
+class PayloadCache:
+    """
+    File-level cache of raw payloads and stream info, keyed by path and validated by
+    mtime and size, so unchanged files are never reopened. Walks of the whole archive prune
+    the entries of deleted files.
+    """
+    def __init__(self, cache_path: (Path | str | None) = None):
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.entries: dict[str, dict[str, Any]] = {}
+        self.hits = 0
+        self.misses = 0
+
+        if self.cache_path and self.cache_path.exists():
+            try:
+                with open(self.cache_path, "r", encoding="utf-8") as file:
+                    self.entries = json.load(file)
+            except (OSError, JSONDecodeError) as e:
+                logger.warning(f"Ignoring unreadable payload cache {self.cache_path}")
+                logger.debug(e)
+
+    @staticmethod
+    def _signature(stat: os.stat_result) -> tuple[int, int]:
+        return stat.st_mtime_ns, stat.st_size
+
+    def get(self, path: str, stat: os.stat_result) -> (dict[str, Any] | None):
+        entry = self.entries.get(path)
+        if entry is not None and (entry["mtime_ns"], entry["size"]) == self._signature(stat):
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def put(self, path: str, stat: os.stat_result, **values: Any) -> None:
+        """Values are added to those already cached for the same file version."""
+        mtime_ns, size = self._signature(stat)
+        entry = self.entries.get(path)
+        if entry is None or (entry["mtime_ns"], entry["size"]) != (mtime_ns, size):
+            entry = self.entries[path] = {"mtime_ns": mtime_ns, "size": size}
+        entry.update(values)
+
+    def prune(self, paths: Iterable[str]) -> int:
+        """Drops the entries of files not in paths, the files of a complete walk. Returns how many."""
+        current = set(paths)
+        removed = [path for path in self.entries if path not in current]
+        for path in removed:
+            del self.entries[path]
+        if removed:
+            logger.debug(f"Pruned {len(removed)} payload cache entries of deleted files")
+        return len(removed)
+
+    def save(self) -> None:
+        if not self.cache_path:
+            return
+        temp_path = self.cache_path.with_name(self.cache_path.name + ".tmp")
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(self.entries, file, ensure_ascii=False)
+        os.replace(temp_path, self.cache_path)
+        logger.debug(f"Payload cache saved: {self.hits} hits, {self.misses} misses")
+
+
+def default_cache_path(directory: Path | str) -> Path:
+    return Path(directory) / CACHE_FILENAME
+
+# readers return None when a file couldn't be read, those values aren't cached and are read again next time
+
+def _read_payload(path: str) -> (str | None):
+    try:
+        return get_raw_json(path)
+    except Exception as e:
+        logger.error(f"Failed reading the payload of {path}")
+        logger.debug(e)
+        return None
+
+def _read_stream(path: str) -> (dict[str, Any] | None):
+    try:
+        return read_stream_info(path).as_dict()
+    except (OSError, StreamInfoError) as e:
+        logger.warning(f"Failed reading the stream info of {path}")
+        logger.debug(e)
+        return None
+
+def _read_audio_hash(path: str) -> (str | None):
+    return get_audio_hash_fast(path)
+
+def _read_fields(path: str, readers: dict[str, Callable[[str], Any]]) -> dict[str, Any]:
+    return {field: reader(path) for field, reader in readers.items()}
+
+def iter_cached(paths: Iterable[str | os.DirEntry[str]], readers: dict[str, Callable[[str], Any]],
+                cache: (PayloadCache | None) = None, workers: int = 8) -> Iterator[tuple[str, dict[str, Any]]]:
+    """
+    Yields (path, values) with one value per reader, in input order. Values missing from
+    the cache are read in a thread pool with a bounded number of files in flight.
+    Scanner entries reuse the stat of the listing.
+    """
+    max_in_flight = max(1, workers) * 4
+    pending: deque[tuple[str, os.stat_result, dict[str, Any], (Future[dict[str, Any]] | None)]] = deque()
+
+    def drain_one() -> tuple[str, dict[str, Any]]:
+        path, stat, values, future = pending.popleft()
+        if future is not None:
+            read_values = future.result()
+            if cache is not None:
+                cache.put(path, stat, **{field: value for field, value in read_values.items() if value is not None})
+            values = {**values, **read_values}
+        return path, values
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for item in paths:
+            path = item if isinstance(item, str) else item.path
+            try:
+                stat = os.stat(path) if isinstance(item, str) else item.stat()
+            except OSError as e:
+                logger.warning(f"Skipping {path}, it couldn't be read")
+                logger.debug(e)
+                continue
+
+            entry = (cache.get(path, stat) if cache is not None else None) or {}
+            values = {field: entry[field] for field in readers if field in entry}
+            missing = {field: reader for field, reader in readers.items() if field not in entry}
+            future = executor.submit(_read_fields, path, missing) if missing else None
+            pending.append((path, stat, values, future))
+
+            while len(pending) > max_in_flight:
+                yield drain_one()
+
+        while pending:
+            yield drain_one()
+
+def _decode_payload(path: str, raw_json: (str | None)) -> (dict[str, str] | None):
+    if not raw_json:
+        return None
+    try:
+        return json.loads(raw_json)
+    except JSONDecodeError:
+        logger.warning(f"Skipping {path}, the payload couldn't be decoded")
+        return None
+
+def iter_payloads(paths: Iterable[str | os.DirEntry[str]], cache: (PayloadCache | None) = None,
+                  workers: int = 8) -> Iterator[tuple[str, dict[str, str]]]:
+    """Yields (path, song_data) for every file with a payload, in input order."""
+    for path, values in iter_cached(paths, {"payload": _read_payload}, cache, workers):
+        song_data = _decode_payload(path, values["payload"])
+        if song_data is not None:
+            yield path, song_data
+
+def _walk(directory: Path | str, walked: set[str]) -> Iterator[os.DirEntry[str]]:
+    for entry in iter_files(directory):
+        walked.add(entry.path)
+        yield entry
+
+def iter_archive(directory: Path | str, cache: (PayloadCache | None) = None,
+                 workers: int = 8) -> Iterator[tuple[str, dict[str, str]]]:
+    walked: set[str] = set()
+    yield from iter_payloads(_walk(directory, walked), cache=cache, workers=workers)
+    if cache is not None:
+        # the whole archive was listed, so songs missing from it were deleted
+        cache.prune(walked)
+
+def iter_catalogue(directory: Path | str, cache: (PayloadCache | None) = None,
+                   workers: int = 8) -> Iterator[tuple[str, dict[str, str], (StreamInfo | None)]]:
+    """Like iter_archive, with the stream info of every song read from the same cache, sorted by path."""
+    readers = {"payload": _read_payload, "stream": _read_stream}
+    # the listing is only a fraction of the reads, sorting it keeps exports comparable between runs
+    entries = sorted(iter_files(directory), key=lambda entry: entry.path)
+    for path, values in iter_cached(entries, readers, cache, workers):
+        song_data = _decode_payload(path, values["payload"])
+        if song_data is not None:
+            stream = values["stream"]
+            yield path, song_data, StreamInfo.from_dict(stream) if stream else None
+    if cache is not None:
+        cache.prune(entry.path for entry in entries)
+
+
+def _catalogue_row(path: str, song_data: dict[str, str], stream: (StreamInfo | None)) -> dict[str, str]:
+    row = {"Path": path}
+    for field in PAYLOAD_FIELDS:
+        row[field] = str(song_data.get(field, ""))
+    row["Duration"] = f"{stream.duration:.3f}" if stream else ""
+    row["Bitrate"] = str(stream.bitrate) if stream else ""
+    return row
+
+def _write_csv(rows: Iterator[dict[str, str]], file: TextIO) -> int:
+    writer = csv.DictWriter(file, fieldnames=CATALOGUE_COLUMNS)
+    writer.writeheader()
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+def _write_jsonl(rows: Iterator[dict[str, str]], file: TextIO) -> int:
+    count = 0
+    for row in rows:
+        file.write(json.dumps(row, ensure_ascii=False))
+        file.write("\n")
+        count += 1
+    return count
+
+def _write_arrow(rows: Iterator[dict[str, str]], output: Path, export_format: str) -> int:
+    try:
+        import pyarrow as pa
+    except ImportError as e:
+        raise RuntimeError(f"Exporting to {export_format} requires the optional 'pyarrow' package, the 'parquet' extra") from e
+
+    schema = pa.schema([(column, pa.string()) for column in CATALOGUE_COLUMNS])
+
+    if export_format == "parquet":
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(output, schema)
+    else:
+        writer = pa.ipc.new_file(str(output), schema)
+
+    count = 0
+    batch: list[dict[str, str]] = []
+    try:
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= ARROW_BATCH_SIZE:
+                writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=schema))
+                count += len(batch)
+                batch.clear()
+        if batch:
+            writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=schema))
+            count += len(batch)
+    finally:
+        writer.close()
+
+    return count
+
+def export_catalogue(directory: Path | str, output: Path | str, export_format: (str | None) = None,
+                     workers: int = 8, cache_path: (Path | str | None) = None) -> int:
+    """
+    Streams every payload of the archive into a catalogue file and returns the number of rows.
+    The format is inferred from the output suffix when not given.
+    """
+    output = Path(output)
+    if export_format is None:
+        export_format = output.suffix.lstrip(".").lower()
+        if export_format in ("feather", "ipc"):
+            export_format = "arrow"
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {export_format!r}")
+
+    cache = PayloadCache(cache_path)
+    rows = (_catalogue_row(path, song_data, stream) for path, song_data, stream in iter_catalogue(directory, cache, workers))
+
+    if export_format in ("parquet", "arrow"):
+        count = _write_arrow(rows, output, export_format)
+    else:
+        with open(output, "w", encoding="utf-8", newline="") as file:
+            if export_format == "csv":
+                count = _write_csv(rows, file)
+            else:
+                count = _write_jsonl(rows, file)
+
+    cache.save()
+    logger.info(f"Exported {count} songs to {output}")
+    return count
+
+def runtime_totals(directory: Path | str, workers: int = 8,
+                   cache_path: (Path | str | None) = None) -> dict[str, tuple[int, float]]:
+    """(songs, seconds) per disc. Only new or changed songs are opened, the rest comes from the cache."""
+    cache = PayloadCache(cache_path)
+    totals: dict[str, tuple[int, float]] = {}
+    for _, song_data, stream in iter_catalogue(directory, cache, workers):
+        disc = str(song_data.get("Discnumber") or "Unknown")
+        songs, seconds = totals.get(disc, (0, 0.0))
+        totals[disc] = (songs + 1, seconds + (stream.duration if stream else 0.0))
+    cache.save()
+    return totals
+
+
+class HashCheck:
+    def __init__(self, path: str, expected: (str | None), actual: (str | None)):
+        self.path = path
+        # xxHash of the payload, None when the song has no payload
+        self.expected = expected
+        self.actual = actual
+
+    @property
+    def ok(self) -> bool:
+        return self.expected is not None and self.expected == self.actual
+
+
+def iter_hash_checks(paths: Iterable[str | os.DirEntry[str]], cache: (PayloadCache | None) = None,
+                     workers: int = 8) -> Iterator[HashCheck]:
+    """Compares the xxHash of every payload with the audio, hashes of unchanged files come from the cache."""
+    readers = {"payload": _read_payload, "audio_hash": _read_audio_hash}
+    for path, values in iter_cached(paths, readers, cache, workers):
+        song_data = _decode_payload(path, values["payload"])
+        expected = song_data.get("xxHash") if song_data else None
+        yield HashCheck(path, expected, values["audio_hash"])
@@ -1,5 +1,6 @@
 import re
 from datetime import date, datetime
+from typing import Any, Callable, Iterable
 
 V1_VERSION_START = date(2023, 1, 3)
 V1_VERSION_END = date(2023, 5, 17)
@@ -29,7 +30,7 @@ def _validate_track(payload: dict[str, str]) -> None:
         raise ValidationError("Missing track number!")
     
     if '/' in track:
-        track_number, total_track = track.split('/')
+        track_number, _, total_track = track.partition('/')
         if not (track_number.isdigit() and total_track.isdigit()):
             raise ValidationError("Invalid track number!")
         elif int(track_number) > int(total_track):
@@ -70,7 +71,7 @@ def _validate_version(payload: dict[str, str]) -> tuple[str, str | None]:
         raise ValidationError("No version!")
 
     if '.' in version:
-        major_version, minor_version = version.split('.')
+        major_version, _, minor_version = version.partition('.')
     else:
         major_version = version
 
@@ -94,6 +95,64 @@ def _validate_version_in_timeframe(payload: dict[str, str], major_version: str,
     elif major_version == '3' and (date_input < V3_VERSION_START):
         raise ValidationError("Neuro V3 started 2023-06-21!")
 
+def _validate_cover_artist(payload: dict[str, str]) -> None:
+    if payload['cover_artist'] == "Evil & Neuro":
+        raise ValidationError("Wrong twin order!")
+
+def _validate_special(payload: dict[str, str]) -> None:
+    if payload['special'] not in ('0', '1'):
+        raise ValidationError("Invalid Special! It must be either a '0' or an '1'!")
+
+# payload field -> the check of that field alone, the others aren't validated
+FIELD_VALIDATORS: dict[str, Callable[[dict[str, str]], Any]] = {
+    "disc_number": _validate_disc_number,
+    "track": _validate_track,
+    "date": _validate_date,
+    "version": _validate_version,
+    "cover_artist": _validate_cover_artist,
+    "special": _validate_special,
+}
+
+# fields read by the version-in-timeframe check, it's error is reported on the version
+TIMEFRAME_FIELDS = frozenset(("date", "version", "cover_artist"))
+
+def validate_fields(payload: dict[str, str], fields: Iterable[str]) -> dict[str, (str | None)]:
+    """
+    Validates only the given fields and the checks depending on them, for validating while a
+    payload is edited. Returns the error message of every checked field, None when it's valid.
+    A payload without any error passes validate_payload.
+    """
+    fields = set(fields)
+    if fields & TIMEFRAME_FIELDS:
+        fields.add("version")
+
+    errors: dict[str, (str | None)] = {}
+    for field in fields:
+        errors[field] = None
+        validator = FIELD_VALIDATORS.get(field)
+        if validator is None:
+            continue
+        try:
+            validator(payload)
+        except ValidationError as e:
+            errors[field] = str(e)
+        except Exception:
+            # input a check doesn't expect is still an error of that field, not of the preview
+            errors[field] = f"Invalid {field.replace('_', ' ')}!"
+
+    if fields & TIMEFRAME_FIELDS and errors["version"] is None:
+        try:
+            input_date = _validate_date(payload)
+        except ValidationError:
+            # already reported on the date
+            return errors
+        try:
+            _validate_version_in_timeframe(payload, _validate_version(payload)[0], input_date)
+        except ValidationError as e:
+            errors["version"] = str(e)
+
+    return errors
+
 def validate_payload(payload: dict[str, str]) -> bool:
 
     _validate_disc_number(payload)
@@ -106,10 +165,8 @@ def validate_payload(payload: dict[str, str]) -> bool:
 
     _validate_version_in_timeframe(payload, version_info[0], input_date)
 
-    if payload['cover_artist'] == "Evil & Neuro":
-        raise ValidationError("Wrong twin order!")
+    _validate_cover_artist(payload)
 
-    if payload['special'] not in ('0', '1'):
-        raise ValidationError("Invalid Special! It must be either a '0' or an '1'!")
+    _validate_special(payload)
 
     return True
\ No newline at end of file
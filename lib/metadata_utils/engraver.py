@@ -1,3 +1,4 @@
+import logging
 from pathlib import Path
 from typing import cast
 
@@ -6,13 +7,17 @@ from mutagen.id3 import COMM, ID3, Frame, ID3NoHeaderError
 # from mutagen.mp3 import MP3
 from tinytag import TinyTag
 
+from .scanner import iter_mp3
+from .snapshots import SnapshotStore
+
+logger = logging.getLogger(__name__)
+
 
 def get_all_mp3(directory: Path | str) -> list[str]: 
     """
     Function that gathers all mp3 files from a directory.
     """
-    p = Path(directory)
-    return [(str(f)) for f in p.rglob('*.mp3') if f.is_file()]
+    return sorted(iter_mp3(directory))
 
 def get_tag_value(tags: ID3, tag: str) -> (str | None) :
     frame = cast(Frame | None, tags.get(tag))
@@ -99,13 +104,19 @@ def build_payload(filename: str, date: str, title: str, artist: str,
 
 #     audio.save()
 
-def engrave_payload(path: str, song_data: str) -> None:
+def add_payload_frame(tags: ID3, song_data: str) -> None:
+    tags.add(COMM(encoding=3, lang='ved', desc='', text=[song_data]))
+
+def engrave_payload(path: str, song_data: str, snapshot_store: (SnapshotStore | None) = None) -> None:
+    if snapshot_store is not None:
+        snapshot_store.snapshot(path)
+
     try:
         tags = ID3(path)
     except ID3NoHeaderError:
         tags = ID3()
 
-    tags.add(COMM(encoding=3, lang='ved', desc='', text=[song_data]))
+    add_payload_frame(tags, song_data)
     
     tags.save(path)
 
@@ -115,7 +126,7 @@ def get_raw_json(path: Path | str) -> str:
 
     path = Path(path)
 
-    if path.suffix != '.mp3':
+    if path.suffix.lower() != '.mp3':
         return ""
 
     tags = TinyTag.get(path, tags=True, image=False)
@@ -125,7 +136,7 @@ def get_raw_json(path: Path | str) -> str:
         texts.append(tags.comment)
 
     if not texts:
-        print("No comments found")
+        logger.debug(f"No comments found in {path}")
         return ""
     
     for text in texts:
@@ -0,0 +1,143 @@
+import logging
+import os
+import threading
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+# 'rename' numbers the new song, 'fail' rejects it, 'overwrite' replaces the archive file.
+# Two songs of the same batch never get the same name, whatever the policy.
+COLLISION_POLICIES = ("rename", "fail", "overwrite")
+
+# MAX_PATH of the Windows mirrors, in UTF-16 code units with the terminating NUL
+WINDOWS_MAX_PATH = 260
+
+# longest file name of NTFS (UTF-16 code units) and ext4 (bytes), bytes being the stricter
+MAX_NAME_BYTES = 255
+
+# the pipeline writes '.<name>.<pid>.<thread id>.part' before renaming it into place
+TEMP_NAME_OVERHEAD = 38
+
+
+class FilenameConflictError(Exception):
+    pass
+
+
+def name_key(filename: str) -> str:
+    """The name as a case-insensitive filesystem sees it, NFC first since macOS lists names as NFD."""
+    return unicodedata.normalize("NFC", filename).casefold()
+
+def numbered_filename(filename: str, count: int) -> str:
+    stem, suffix = os.path.splitext(filename)
+    return f"{stem} ({count}){suffix}"
+
+def _utf16_length(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+class FilenamePlanner:
+    """
+    Hands out the target names of the songs written to an archive folder before any of them
+    is written. A name is taken when an archive file or a song already planned has it in any
+    case, except for the file the same source produced last time, which it may replace.
+    Thread safe, so the watcher can plan songs while others are being written.
+    """
+    def __init__(self, save_folder: str, on_collision: str = "rename", max_path: int = WINDOWS_MAX_PATH):
+        if on_collision not in COLLISION_POLICIES:
+            raise ValueError(f"Unknown collision policy '{on_collision}', expected one of {', '.join(COLLISION_POLICIES)}")
+        self.save_folder = os.path.abspath(save_folder)
+        self.on_collision = on_collision
+        # 0 disables the path length check
+        self.max_path = max_path
+        self._lock = threading.Lock()
+        self._existing: dict[str, str] = {}
+        # name key -> source planned to be written there, and back
+        self._reserved: dict[str, str] = {}
+        self._reserved_by_source: dict[str, str] = {}
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Lists the archive again, songs written since the last listing then count as existing."""
+        existing: dict[str, str] = {}
+        try:
+            with os.scandir(self.save_folder) as entries:
+                for entry in entries:
+                    # hidden files are the temporary files, caches and journals of the pipeline
+                    if not entry.name.startswith("."):
+                        existing[name_key(entry.name)] = entry.name
+        except OSError as e:
+            logger.warning(f"Unable to list {self.save_folder}, only collisions within the batch are checked")
+            logger.debug(e)
+
+        with self._lock:
+            self._existing = existing
+
+    def existing_name(self, filename: str) -> (str | None):
+        """The archive file that has filename in another case or normalization, or exactly."""
+        with self._lock:
+            return self._existing.get(name_key(filename))
+
+    def length_error(self, filename: str) -> (str | None):
+        temp_name = "." * TEMP_NAME_OVERHEAD + filename
+        if len(temp_name.encode("utf-8")) > MAX_NAME_BYTES:
+            return f"'{filename}' is too long, names are limited to {MAX_NAME_BYTES - TEMP_NAME_OVERHEAD} bytes"
+
+        if self.max_path:
+            path_length = _utf16_length(os.path.join(self.save_folder, temp_name))
+            if path_length >= self.max_path:
+                return f"'{filename}' would exceed the Windows path limit of {self.max_path} characters by {path_length - self.max_path + 1}"
+        return None
+
+    def _conflict(self, source: str, key: str, owned_key: (str | None)) -> (str | None):
+        holder = self._reserved.get(key)
+        if holder is not None and holder != source:
+            return f"{holder} has the same name"
+        if key in self._existing and key != owned_key and self.on_collision != "overwrite":
+            return f"{self._existing[key]} is already in the archive"
+        return None
+
+    def reserve(self, source: str, filename: str, owned: (str | None) = None) -> str:
+        """
+        Plans where source is written and returns the name, numbered ' (2)', ' (3)', ...
+        when the policy is to rename. owned is the name source was written to last time.
+        Raises FilenameConflictError when the name is unusable.
+        """
+        owned_key = name_key(owned) if owned else None
+
+        with self._lock:
+            self._release(source)
+            candidate = filename
+            count = 1
+            first_conflict = None
+            while True:
+                error = self.length_error(candidate)
+                if error:
+                    raise FilenameConflictError(error)
+
+                key = name_key(candidate)
+                conflict = self._conflict(source, key, owned_key)
+                if conflict is None:
+                    break
+                if self.on_collision == "fail":
+                    raise FilenameConflictError(f"'{candidate}' is taken: {conflict}")
+
+                first_conflict = first_conflict or conflict
+                count += 1
+                candidate = numbered_filename(filename, count)
+
+            self._reserved[key] = source
+            self._reserved_by_source[source] = key
+
+        if first_conflict:
+            logger.info(f"Saving {source} as '{candidate}', '{filename}' is taken: {first_conflict}")
+        return candidate
+
+    def _release(self, source: str) -> None:
+        key = self._reserved_by_source.pop(source, None)
+        if key is not None and self._reserved.get(key) == source:
+            del self._reserved[key]
+
+    def release(self, source: str) -> None:
+        """Frees the name of a song that won't be written after all."""
+        with self._lock:
+            self._release(source)
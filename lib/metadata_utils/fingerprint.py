@@ -0,0 +1,311 @@
+import logging
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import ModuleType
+from typing import TYPE_CHECKING, Any
+
+from .scanner import iter_files
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_FILENAME = ".song_adder_fingerprints.npz"
+
+# Sub-fingerprints follow Haitsma & Kalker: 32 bits per frame, the sign of the energy
+# difference between neighbouring bands, differentiated over time.
+SAMPLE_RATE = 11025
+FRAME_SIZE = 2048
+HOP_SIZE = 512
+BAND_COUNT = 33
+BAND_RANGE_HZ = (300.0, 2000.0)
+
+# frames transformed per FFT call, bounds the memory of long songs
+FRAME_BATCH = 4096
+
+# sub-fingerprints found in more songs than this (silence, fades) say nothing about a song
+MAX_BUCKET_SIZE = 64
+# (song, offset) pairs need this many exact sub-fingerprint hits to be compared at all
+MIN_VOTES = 2
+MAX_CANDIDATES = 50
+MIN_OVERLAP_SECONDS = 10.0
+
+# bit error rate, unrelated songs sit around 0.5
+MATCH_THRESHOLD = 0.35
+
+
+class FingerprintError(Exception):
+    pass
+
+
+def _numpy() -> ModuleType:
+    try:
+        import numpy
+    except ImportError as e:
+        raise RuntimeError("Fingerprinting requires the optional 'numpy' package, the 'analysis' extra") from e
+    return numpy
+
+def decode_pcm(path: str) -> "np.ndarray":
+    """Decodes the first audio stream to mono float samples at SAMPLE_RATE through an ffmpeg pipe."""
+    np = _numpy()
+
+    # hides the console on Windows
+    cf_flag = 0x08000000 if sys.platform == "win32" else 0
+
+    try:
+        result = subprocess.run(
+            [
+                "ffmpeg", "-v", "error", "-nostdin",
+                "-i", path,
+                "-map", "0:a:0",
+                "-ac", "1",
+                "-ar", str(SAMPLE_RATE),
+                "-f", "s16le", "-"
+            ],
+            shell=False,
+            capture_output=True,
+            creationflags=cf_flag
+        )
+    except OSError as e:
+        raise FingerprintError(f"ffmpeg couldn't be run for {path}") from e
+
+    if result.returncode != 0:
+        raise FingerprintError(f"ffmpeg failed decoding {path}: {result.stderr.decode(errors='replace').strip()}")
+
+    return np.frombuffer(result.stdout, dtype="<i2").astype(np.float32) / 32768
+
+def _band_matrix() -> "np.ndarray":
+    np = _numpy()
+    frequencies = np.fft.rfftfreq(FRAME_SIZE, 1 / SAMPLE_RATE)
+    edges = np.geomspace(*BAND_RANGE_HZ, BAND_COUNT + 1)
+    band_of_bin = np.searchsorted(edges, frequencies, side="right") - 1
+
+    matrix = np.zeros((len(frequencies), BAND_COUNT), dtype=np.float32)
+    in_range = (band_of_bin >= 0) & (band_of_bin < BAND_COUNT)
+    matrix[np.nonzero(in_range)[0], band_of_bin[in_range]] = 1
+    return matrix
+
+def compute_fingerprint(samples: "np.ndarray") -> "np.ndarray":
+    """One uint32 sub-fingerprint per HOP_SIZE samples."""
+    np = _numpy()
+    if len(samples) < FRAME_SIZE + HOP_SIZE:
+        return np.zeros(0, dtype=np.uint32)
+
+    frames = np.lib.stride_tricks.sliding_window_view(samples, FRAME_SIZE)[::HOP_SIZE]
+    window = np.hanning(FRAME_SIZE).astype(np.float32)
+    bands = _band_matrix()
+
+    energies = np.empty((len(frames), BAND_COUNT), dtype=np.float32)
+    for start in range(0, len(frames), FRAME_BATCH):
+        spectrum = np.fft.rfft(frames[start:start + FRAME_BATCH] * window, axis=1)
+        energies[start:start + FRAME_BATCH] = (spectrum.real ** 2 + spectrum.imag ** 2) @ bands
+
+    band_difference = energies[:, :-1] - energies[:, 1:]
+    bits = (band_difference[1:] - band_difference[:-1]) > 0
+    return (bits.astype(np.uint32) << np.arange(32, dtype=np.uint32)).sum(axis=1, dtype=np.uint32)
+
+def fingerprint_file(path: str) -> "np.ndarray":
+    return compute_fingerprint(decode_pcm(path))
+
+def bit_error_rate(first: "np.ndarray", second: "np.ndarray", offset: int) -> tuple[float, int]:
+    """Bit error rate and overlap in frames, with frame i of first aligned to frame i + offset of second."""
+    np = _numpy()
+    first_start = max(0, -offset)
+    second_start = max(0, offset)
+    length = min(len(first) - first_start, len(second) - second_start)
+    if length <= 0:
+        return 1.0, 0
+
+    difference = np.bitwise_xor(first[first_start:first_start + length], second[second_start:second_start + length])
+    errors = int(np.unpackbits(difference.view(np.uint8)).sum())
+    return errors / (32 * length), length
+
+def default_fingerprint_path(directory: Path | str) -> Path:
+    return Path(directory) / FINGERPRINT_FILENAME
+
+
+class Match:
+    def __init__(self, path: str, score: float, offset: int):
+        self.path = path
+        self.score = score
+        # frames the match starts after the queried song
+        self.offset = offset
+
+    @property
+    def offset_seconds(self) -> float:
+        return self.offset * HOP_SIZE / SAMPLE_RATE
+
+
+class FingerprintIndex:
+    """
+    Fingerprints of every song of an archive, kept in a .npz next to the songs and refreshed
+    by mtime and size. Lookups go through an inverted index of the exact sub-fingerprints
+    (a sorted array), and only the songs with enough hits at a consistent offset are compared
+    bit by bit, so a query doesn't scale with the size of the archive.
+    """
+    def __init__(self, index_path: (Path | str | None) = None):
+        self.index_path = Path(index_path) if index_path else None
+        # path -> ((mtime_ns, size), fingerprint)
+        self.entries: dict[str, tuple[tuple[int, int], "np.ndarray"]] = {}
+        self._lookup: (tuple[list[str], Any, Any, Any] | None) = None
+
+        if self.index_path and self.index_path.exists():
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _load(self) -> None:
+        np = _numpy()
+        assert self.index_path is not None
+        try:
+            with np.load(self.index_path, allow_pickle=False) as data:
+                paths, stats, starts, fingerprints = data["paths"], data["stats"], data["starts"], data["fingerprints"]
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable fingerprint index {self.index_path}")
+            logger.debug(e)
+            return
+
+        for i, path in enumerate(paths):
+            self.entries[str(path)] = ((int(stats[i][0]), int(stats[i][1])), fingerprints[starts[i]:starts[i + 1]])
+
+    def save(self) -> None:
+        if not self.index_path:
+            return
+        np = _numpy()
+
+        paths = list(self.entries)
+        fingerprints = [self.entries[path][1] for path in paths]
+        starts = np.zeros(len(paths) + 1, dtype=np.int64)
+        np.cumsum([len(fingerprint) for fingerprint in fingerprints], out=starts[1:])
+
+        temp_path = self.index_path.with_name(self.index_path.name + ".tmp")
+        with open(temp_path, "wb") as file:
+            np.savez(
+                file,
+                paths=np.array(paths, dtype=str),
+                stats=np.array([self.entries[path][0] for path in paths], dtype=np.int64).reshape(-1, 2),
+                starts=starts,
+                fingerprints=np.concatenate(fingerprints) if fingerprints else np.zeros(0, dtype=np.uint32)
+            )
+        os.replace(temp_path, self.index_path)
+
+    def update(self, directory: Path | str, workers: int = 4) -> tuple[int, int]:
+        """Fingerprints new and changed songs, forgets removed ones. Returns (updated, removed)."""
+        current: dict[str, tuple[int, int]] = {}
+        # absolute paths, so songs given on the command line are recognised
+        for entry in iter_files(os.path.abspath(directory)):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            current[entry.path] = (stat.st_mtime_ns, stat.st_size)
+
+        removed = self.entries.keys() - current.keys()
+        for path in removed:
+            del self.entries[path]
+
+        changed = [path for path, signature in current.items()
+                   if path not in self.entries or self.entries[path][0] != signature]
+
+        updated = 0
+        if changed:
+            logger.info(f"Fingerprinting {len(changed)} songs...")
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            for path, fingerprint in zip(changed, executor.map(self._fingerprint_or_none, changed)):
+                if fingerprint is not None:
+                    self.entries[path] = (current[path], fingerprint)
+                    updated += 1
+
+        if updated or removed:
+            self._lookup = None
+        return updated, len(removed)
+
+    @staticmethod
+    def _fingerprint_or_none(path: str) -> "np.ndarray | None":
+        try:
+            return fingerprint_file(path)
+        except FingerprintError as e:
+            logger.error(f"Failed fingerprinting {path}")
+            logger.debug(e)
+            return None
+
+    def _get_lookup(self) -> tuple[list[str], Any, Any, Any]:
+        if self._lookup is None:
+            np = _numpy()
+            paths = list(self.entries)
+            fingerprints = [self.entries[path][1] for path in paths]
+            lengths = np.array([len(fingerprint) for fingerprint in fingerprints], dtype=np.int64)
+
+            values = np.concatenate(fingerprints) if fingerprints else np.zeros(0, dtype=np.uint32)
+            song_ids = np.repeat(np.arange(len(paths)), lengths)
+            frame_ids = np.arange(len(values)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+            order = np.argsort(values, kind="stable")
+            self._lookup = (paths, values[order], song_ids[order], frame_ids[order])
+        return self._lookup
+
+    def fingerprint_of(self, path: str) -> "np.ndarray":
+        """The indexed fingerprint when the song didn't change, a fresh one otherwise."""
+        entry = self.entries.get(path)
+        if entry is not None:
+            stat = os.stat(path)
+            if entry[0] == (stat.st_mtime_ns, stat.st_size):
+                return entry[1]
+        return fingerprint_file(path)
+
+    def query(self, fingerprint: "np.ndarray", limit: int = 10, exclude: (str | None) = None,
+              threshold: float = MATCH_THRESHOLD) -> list[Match]:
+        np = _numpy()
+        paths, keys, song_ids, frame_ids = self._get_lookup()
+        if not len(fingerprint) or not len(keys):
+            return []
+
+        low = np.searchsorted(keys, fingerprint, side="left")
+        counts = np.searchsorted(keys, fingerprint, side="right") - low
+        query_frames = np.nonzero((counts > 0) & (counts <= MAX_BUCKET_SIZE))[0]
+        if not len(query_frames):
+            return []
+
+        # every hit as (song, offset between the songs)
+        hits = counts[query_frames]
+        positions = np.arange(hits.sum()) - np.repeat(np.cumsum(hits) - hits, hits) + np.repeat(low[query_frames], hits)
+        offsets = frame_ids[positions] - np.repeat(query_frames, hits)
+        pairs, votes = np.unique(np.stack([song_ids[positions], offsets], axis=1), axis=0, return_counts=True)
+
+        # best offset of every song, most voted songs first
+        order = np.argsort(-votes, kind="stable")
+        _, first = np.unique(pairs[order, 0], return_index=True)
+        best = order[first]
+        best = best[np.argsort(-votes[best], kind="stable")]
+
+        min_overlap = int(MIN_OVERLAP_SECONDS * SAMPLE_RATE / HOP_SIZE)
+        matches: list[Match] = []
+        for song_id, offset in pairs[best[votes[best] >= MIN_VOTES][:MAX_CANDIDATES]]:
+            path = paths[song_id]
+            if path == exclude:
+                continue
+
+            candidate = self.entries[path][1]
+            error_rate, overlap = bit_error_rate(fingerprint, candidate, int(offset))
+            if error_rate <= threshold and overlap >= min(min_overlap, len(fingerprint), len(candidate)):
+                matches.append(Match(path, 1 - error_rate, int(offset)))
+
+        matches.sort(key=lambda match: -match.score)
+        return matches[:limit]
+
+    def similar_to(self, path: str, limit: int = 10, threshold: float = MATCH_THRESHOLD) -> list[Match]:
+        return self.query(self.fingerprint_of(path), limit=limit, exclude=path, threshold=threshold)
+
+    def duplicates(self, threshold: float = MATCH_THRESHOLD) -> list[tuple[str, Match]]:
+        """Every pair of near-duplicate songs of the index, once."""
+        pairs: list[tuple[str, Match]] = []
+        for path, (_, fingerprint) in self.entries.items():
+            for match in self.query(fingerprint, limit=MAX_CANDIDATES, exclude=path, threshold=threshold):
+                if path < match.path:
+                    pairs.append((path, match))
+        return pairs
@@ -1,11 +1,20 @@
 
 import mmap
 import os
+from types import ModuleType
 
-import xxhash
 from mutagen.id3 import ID3, ID3NoHeaderError
 
 
+def _xxhash() -> ModuleType:
+    # deferred so importing the hashing helpers doesn't load the extension at startup
+    import xxhash
+    return xxhash
+
+def hash_bytes(data: bytes) -> str:
+    return _xxhash().xxh64(data).hexdigest()
+
+
 def get_audio_hash(file_path: str) -> (str | None):
     try:
         try:
@@ -22,7 +31,7 @@ def get_audio_hash(file_path: str) -> (str | None):
         end_index = len(file_data) - footer_size
         raw_audio = file_data[header_size:end_index]
 
-        return xxhash.xxh64(raw_audio).hexdigest()
+        return _xxhash().xxh64(raw_audio).hexdigest()
 
     except Exception as e:
         print(f"Error processing {file_path}: {e}")
@@ -48,7 +57,7 @@ def get_audio_hash_optimized(file_path: str, chunk_size: int = 65536) -> (str |
                     footer_size = 128
 
             # 2. Stream the audio data to the hasher
-            hasher = xxhash.xxh64()
+            hasher = _xxhash().xxh64()
             f.seek(header_size)
             
             # Calculate how many bytes we actually need to hash
@@ -97,12 +106,20 @@ def get_audio_hash_fast(file_path: str) -> (str | None):
             with mmap.mmap(f.fileno(), length=0, access=mmap.ACCESS_READ) as mm:
                 # Slice the mmap (this is a memory view, not a copy)
                 raw_audio_view = mm[header_size : file_size - footer_size]
-                return xxhash.xxh64(raw_audio_view).hexdigest()
+                return _xxhash().xxh64(raw_audio_view).hexdigest()
 
     except Exception as e:
         print(f"Error processing {file_path}: {e}")
         return None
 
+def hash_file_range(file_path: str, start: int, end: int) -> str:
+    """xxHash of file_path[start:end], the audio of a source before it's written out."""
+    with open(file_path, 'rb') as f:
+        if end <= start:
+            return _xxhash().xxh64(b"").hexdigest()
+        with mmap.mmap(f.fileno(), length=0, access=mmap.ACCESS_READ) as mm:
+            return _xxhash().xxh64(mm[start:end]).hexdigest()
+
 def get_audio_hash_short(file_path: str) -> (str | None):
     try:
         with open(file_path, 'rb') as f:
@@ -113,7 +130,7 @@ def get_audio_hash_short(file_path: str) -> (str | None):
         end_index = len(file_data) - footer_size
         raw_audio = file_data[end_index-500:end_index]
 
-        return xxhash.xxh64(raw_audio).hexdigest()
+        return _xxhash().xxh64(raw_audio).hexdigest()
 
     except Exception as e:
         print(f"Error processing {file_path}: {e}")
@@ -132,7 +149,7 @@ def get_audio_hash_short_fast(file_path: str) -> (str | None):
             f.seek(-1000, os.SEEK_END-footer_size)
             data = f.read(1000)
 
-        return xxhash.xxh64(data).hexdigest()
+        return _xxhash().xxh64(data).hexdigest()
 
     except Exception as e:
         print(f"Error processing {file_path}: {e}")
@@ -0,0 +1,171 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+import hjson
+
+from .catalogue import PAYLOAD_FIELDS, PayloadCache, default_cache_path, iter_payloads
+from .scanner import iter_files
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = ".song_adder_extract_manifest.json"
+
+
+class ExtractReport:
+    def __init__(self) -> None:
+        self.songs = 0
+        self.written = 0
+        self.skipped = 0
+        self.failed: list[str] = []
+
+    def summary(self) -> str:
+        lines = [
+            f"Songs: {self.songs}",
+            f"Payloads written: {self.written}",
+            f"Payloads skipped (unchanged): {self.skipped}",
+            f"Failed: {len(self.failed)}",
+        ]
+        lines.extend(f"  {path}" for path in self.failed)
+        return "\n".join(lines)
+
+
+def payload_to_record(song_path: str, song_data: dict[str, str]) -> dict[str, Any]:
+    """Inverse of create_payload_from_dict, 'Filename' lets the import match the record back."""
+    record: dict[str, Any] = {"Filename": os.path.basename(song_path)}
+    for field in PAYLOAD_FIELDS:
+        record[field] = song_data.get(field, "")
+    return record
+
+def _write_sidecar(sidecar_path: Path, content: (dict[str, Any] | list[dict[str, Any]])) -> None:
+    sidecar_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = sidecar_path.with_name(f".{sidecar_path.name}.tmp")
+    with open(temp_path, "w", encoding="utf-8") as file:
+        file.write(hjson.dumps(content, ensure_ascii=False))
+        file.write("\n")
+    os.replace(temp_path, sidecar_path)
+
+def _song_sidecar_path(song_path: str, archive: Path, output: Path) -> Path:
+    return (output / os.path.relpath(song_path, archive)).with_suffix(".hjson")
+
+def _disc_sidecar_path(song_data: dict[str, str], output: Path) -> Path:
+    return output / f"Disc {song_data.get('Discnumber') or 'Unknown'}.hjson"
+
+def _track_key(record: dict[str, Any]) -> tuple[int, str]:
+    track = str(record.get("Track", "")).split("/")[0]
+    return (int(track) if track.isdigit() else 0, record["Filename"])
+
+def extract_sidecars(archive: Path | str, output: Path | str, per_disc: bool = False,
+                     workers: int = 8, force: bool = False) -> ExtractReport:
+    """
+    Writes the payload of every song of the archive as HJSON, one file per song
+    (mirroring the archive folders) or one file per disc.
+    Songs whose mtime and size didn't change since the last extraction are skipped.
+    """
+    archive = Path(archive)
+    output = Path(output)
+    output.mkdir(parents=True, exist_ok=True)
+
+    report = ExtractReport()
+    manifest = PayloadCache(output / MANIFEST_FILENAME)
+    if force:
+        manifest.entries.clear()
+
+    previous_manifest = dict(manifest.entries)
+    changed_paths: list[str] = []
+    unchanged_paths: list[str] = []
+    listed_paths: set[str] = set()
+
+    # sorted, songs sharing a disc and a track number keep their order in the disc sidecar
+    for entry in sorted(iter_files(archive), key=lambda entry: entry.path):
+        song_path = entry.path
+        listed_paths.add(song_path)
+        report.songs += 1
+        try:
+            stat = entry.stat()
+        except OSError as e:
+            logger.warning(f"Skipping {song_path}, it couldn't be read")
+            logger.debug(e)
+            continue
+
+        entry = manifest.get(song_path, stat)
+        if entry is not None and os.path.exists(entry["sidecar"]):
+            unchanged_paths.append(song_path)
+        else:
+            changed_paths.append(song_path)
+
+    payload_cache = PayloadCache(default_cache_path(archive))
+    # every song of the archive was listed, the payloads of deleted ones are dropped
+    payload_cache.prune(changed_paths + unchanged_paths)
+
+    # the sidecars of songs removed from the archive
+    removed_sidecars: set[Path] = set()
+    for song_path, entry in previous_manifest.items():
+        if song_path not in listed_paths:
+            removed_sidecars.add(Path(entry["sidecar"]))
+            manifest.entries.pop(song_path, None)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        if not per_disc:
+            # before the writes, a song added under the removed one's name reuses it's sidecar
+            current_sidecars = {_song_sidecar_path(song_path, archive, output) for song_path in listed_paths}
+            for sidecar_path in removed_sidecars - current_sidecars:
+                logger.debug(f"Removing {sidecar_path}, it's song was removed from the archive")
+                sidecar_path.unlink(missing_ok=True)
+
+            futures = []
+            for song_path, song_data in iter_payloads(changed_paths, cache=payload_cache, workers=workers):
+                sidecar_path = _song_sidecar_path(song_path, archive, output)
+                record = payload_to_record(song_path, song_data)
+                futures.append((song_path, sidecar_path, executor.submit(_write_sidecar, sidecar_path, record)))
+            report.skipped = len(unchanged_paths)
+
+        else:
+            # a disc is rewritten when any of it's songs changed or moved to another disc
+            discs: dict[Path, list[dict[str, Any]]] = {}
+            members: dict[Path, list[str]] = {}
+            changed = set(changed_paths)
+            # songs removed from the archive also change their disc
+            dirty: set[Path] = set(removed_sidecars)
+
+            for song_path, song_data in iter_payloads(changed_paths + unchanged_paths, cache=payload_cache, workers=workers):
+                sidecar_path = _disc_sidecar_path(song_data, output)
+                discs.setdefault(sidecar_path, []).append(payload_to_record(song_path, song_data))
+                members.setdefault(sidecar_path, []).append(song_path)
+                previous_sidecar = previous_manifest.get(song_path, {}).get("sidecar")
+                if song_path in changed or previous_sidecar != str(sidecar_path):
+                    dirty.add(sidecar_path)
+                if previous_sidecar is not None and previous_sidecar != str(sidecar_path):
+                    # the disc it moved from loses it's record
+                    dirty.add(Path(previous_sidecar))
+
+            for sidecar_path in dirty - discs.keys():
+                logger.debug(f"Removing {sidecar_path}, the disc has no songs left")
+                sidecar_path.unlink(missing_ok=True)
+
+            futures = []
+            for sidecar_path, records in discs.items():
+                if sidecar_path not in dirty:
+                    report.skipped += len(records)
+                    continue
+                records.sort(key=_track_key)
+                future = executor.submit(_write_sidecar, sidecar_path, records)
+                futures.extend((song_path, sidecar_path, future) for song_path in members[sidecar_path])
+
+        for song_path, sidecar_path, future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                report.failed.append(song_path)
+                logger.error(f"Failed writing {sidecar_path}")
+                logger.debug(e)
+            else:
+                report.written += 1
+                manifest.put(song_path, os.stat(song_path), sidecar=str(sidecar_path))
+
+    payload_cache.save()
+    manifest.save()
+    logger.info(f"Extracted {report.written} payloads to {output}")
+    return report
@@ -0,0 +1,237 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Iterator
+
+import hjson
+
+from .catalogue import PayloadCache, default_cache_path, iter_payloads
+from .create_hjsons import create_payload_from_dict
+from .engraver import engrave_payload, get_raw_json
+from .hash_mutagen import get_audio_hash
+from .scanner import iter_files, iter_mp3
+from .snapshots import SnapshotStore
+
+logger = logging.getLogger(__name__)
+
+SIDECAR_SUFFIXES = (".hjson", ".json")
+
+HJSON_CACHE_FILENAME = ".song_adder_hjson_cache.json"
+
+
+class SidecarRecord:
+    def __init__(self, sidecar_path: str, position: int, data: dict[str, Any]):
+        self.sidecar_path = sidecar_path
+        self.position = position
+        self.data = data
+        self.song_path: (str | None) = None
+        self.payload: (str | None) = None
+        self.error: (str | None) = None
+
+    def __str__(self) -> str:
+        return f"{self.sidecar_path}[{self.position}]" if self.position else self.sidecar_path
+
+
+class ImportReport:
+    def __init__(self) -> None:
+        self.records = 0
+        self.unmatched: list[SidecarRecord] = []
+        self.invalid: list[SidecarRecord] = []
+        self.unchanged = 0
+        self.engraved = 0
+        self.failed: list[SidecarRecord] = []
+
+    def summary(self) -> str:
+        lines = [
+            f"Records read: {self.records}",
+            f"Engraved: {self.engraved}",
+            f"Already up to date: {self.unchanged}",
+            f"Unmatched: {len(self.unmatched)}",
+            f"Invalid: {len(self.invalid)}",
+            f"Failed: {len(self.failed)}",
+        ]
+        for record in (*self.unmatched, *self.invalid, *self.failed):
+            lines.append(f"  {record}: {record.error}")
+        return "\n".join(lines)
+
+
+def _load_sidecar(path: str, cache: PayloadCache) -> list[dict[str, Any]]:
+    stat = os.stat(path)
+    entry = cache.get(path, stat)
+    if entry is not None:
+        return entry["records"]
+
+    with open(path, "r", encoding="utf-8") as file:
+        content = hjson.load(file)
+
+    records = content if isinstance(content, list) else [content]
+    # plain dicts, so the cache can be stored as JSON, other items are reported per record
+    records = [dict(record) if isinstance(record, dict) else record for record in records]
+    cache.put(path, stat, records=records)
+    return records
+
+def iter_sidecar_records(source: Path | str, cache: (PayloadCache | None) = None) -> Iterator[SidecarRecord]:
+    """
+    Lazily yields the records of a directory of HJSON sidecars, or of a single HJSON file
+    holding one record or an array of them.
+    """
+    source = Path(source)
+    cache = cache if cache is not None else PayloadCache()
+
+    if source.is_dir():
+        # hidden files are skipped, they hold the parse cache
+        sidecars = sorted(entry.path for entry in iter_files(source, SIDECAR_SUFFIXES, include_hidden=False))
+    else:
+        sidecars = [str(source)]
+
+    for sidecar_path in sidecars:
+        try:
+            records = _load_sidecar(sidecar_path, cache)
+        except (OSError, hjson.HjsonDecodeError) as e:
+            record = SidecarRecord(sidecar_path, 0, {})
+            record.error = f"Couldn't parse sidecar: {e}"
+            yield record
+            continue
+
+        for position, data in enumerate(records):
+            if not isinstance(data, dict):
+                record = SidecarRecord(sidecar_path, position, {})
+                record.error = "Record is not an object"
+            else:
+                record = SidecarRecord(sidecar_path, position, data)
+            yield record
+
+    if source.is_dir():
+        # the cache belongs to the folder, sidecars missing from it's listing were deleted
+        cache.prune(sidecars)
+
+
+def _expected_filename(record: SidecarRecord) -> str:
+    filename = record.data.get("Filename")
+    if filename:
+        return str(filename)
+    return Path(record.sidecar_path).with_suffix(".mp3").name
+
+def _prepare_record(record: SidecarRecord) -> SidecarRecord:
+    """Hashes the matched song and builds its validated payload."""
+    assert record.song_path is not None
+
+    audio_hash = get_audio_hash(record.song_path)
+    if audio_hash is None:
+        record.error = "Unable to hash the song"
+        return record
+
+    declared_hash = record.data.get("xxHash")
+    if declared_hash and str(declared_hash) != audio_hash:
+        record.error = f"xxHash {declared_hash} doesn't match the audio ({audio_hash})"
+        return record
+
+    try:
+        record.payload = create_payload_from_dict({**record.data, "xxHash": audio_hash}, record.song_path)
+    except KeyError as e:
+        record.error = f"Missing field {e}"
+    except Exception as e:
+        record.error = str(e)
+
+    return record
+
+def _engrave_record(record: SidecarRecord, snapshot_store: (SnapshotStore | None) = None) -> bool:
+    assert record.song_path is not None and record.payload is not None
+    if get_raw_json(record.song_path) == record.payload:
+        return False
+    engrave_payload(record.song_path, record.payload, snapshot_store)
+    return True
+
+def default_hjson_cache_path(source: Path | str) -> Path:
+    source = Path(source)
+    folder = source if source.is_dir() else source.parent
+    return folder / HJSON_CACHE_FILENAME
+
+def import_sidecars(source: Path | str, archive: Path | str, workers: int = 8,
+                    dry_run: bool = False, cache_path: (Path | str | None) = None,
+                    snapshot_store: (SnapshotStore | None) = None) -> ImportReport:
+    """
+    Matches every sidecar record to an MP3 of the archive, by filename first and by the
+    engraved xxHash second, validates all of them and then engraves the valid payloads.
+    """
+    report = ImportReport()
+    cache = PayloadCache(cache_path)
+
+    songs_by_name: dict[str, str] = {}
+    # sorted, names differing only by case or folder match the same song on every run
+    for song_path in sorted(iter_mp3(archive)):
+        songs_by_name.setdefault(os.path.basename(song_path).casefold(), song_path)
+
+    records: list[SidecarRecord] = []
+    needs_hash_match: list[SidecarRecord] = []
+
+    for record in iter_sidecar_records(source, cache):
+        report.records += 1
+        if record.error:
+            report.invalid.append(record)
+            continue
+
+        record.song_path = songs_by_name.get(_expected_filename(record).casefold())
+        if record.song_path is not None:
+            records.append(record)
+        elif record.data.get("xxHash"):
+            needs_hash_match.append(record)
+        else:
+            record.error = f"No song named {_expected_filename(record)}"
+            report.unmatched.append(record)
+
+    cache.save()
+
+    if needs_hash_match:
+        songs_by_hash = {
+            str(song_data.get("xxHash")): song_path
+            for song_path, song_data in iter_payloads(
+                songs_by_name.values(), cache=PayloadCache(default_cache_path(archive)), workers=workers
+            )
+        }
+        for record in needs_hash_match:
+            record.song_path = songs_by_hash.get(str(record.data["xxHash"]))
+            if record.song_path is None:
+                record.error = f"No song named {_expected_filename(record)} or engraved with xxHash {record.data['xxHash']}"
+                report.unmatched.append(record)
+            else:
+                records.append(record)
+
+    claimed: set[str] = set()
+    unique_records: list[SidecarRecord] = []
+    for record in records:
+        assert record.song_path is not None
+        if record.song_path in claimed:
+            record.error = f"{record.song_path} is matched by more than one record"
+            report.invalid.append(record)
+        else:
+            claimed.add(record.song_path)
+            unique_records.append(record)
+    records = unique_records
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        prepared = list(executor.map(_prepare_record, records))
+
+        valid = [record for record in prepared if record.error is None]
+        report.invalid.extend(record for record in prepared if record.error is not None)
+
+        if dry_run:
+            logger.info(f"Dry run, {len(valid)} payloads would be engraved")
+            return report
+
+        futures = [(record, executor.submit(_engrave_record, record, snapshot_store)) for record in valid]
+        for record, future in futures:
+            try:
+                if future.result():
+                    report.engraved += 1
+                else:
+                    report.unchanged += 1
+            except Exception as e:
+                record.error = str(e)
+                report.failed.append(record)
+                logger.error(f"Failed engraving {record.song_path}")
+                logger.debug(e)
+
+    logger.info(f"Import finished, {report.engraved} payloads engraved")
+    return report
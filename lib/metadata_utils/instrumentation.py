@@ -0,0 +1,159 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator
+
+# Spans are only recorded once enable_instrumentation was called,
+# otherwise span() costs a global lookup.
+_recorder: "Recorder | None" = None
+_local = threading.local()
+
+
+class Span:
+    def __init__(self, name: str, song: (str | None), args: dict[str, Any]):
+        self.name = name
+        self.song = song
+        self.args = args
+        self.thread_id = threading.get_ident()
+        self.start_ns = time.perf_counter_ns()
+        self.end_ns = self.start_ns
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1_000_000
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "song": self.song,
+            "start_ns": self.start_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "thread": self.thread_id,
+            **self.args,
+        }
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.spans: list[Span] = []
+        self._lock = threading.Lock()
+        self.origin_ns = time.perf_counter_ns()
+
+    def add(self, finished_span: Span) -> None:
+        with self._lock:
+            self.spans.append(finished_span)
+
+    def stage_totals(self, spans: (list[Span] | None) = None) -> dict[str, dict[str, float]]:
+        totals: dict[str, dict[str, float]] = {}
+        for s in spans if spans is not None else self.spans:
+            stage = totals.setdefault(s.name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "bytes_read": 0, "bytes_written": 0})
+            stage["count"] += 1
+            stage["total_ms"] += s.duration_ms
+            stage["max_ms"] = max(stage["max_ms"], s.duration_ms)
+            stage["bytes_read"] += s.bytes_read
+            stage["bytes_written"] += s.bytes_written
+        return totals
+
+    def songs(self) -> dict[str, list[Span]]:
+        by_song: dict[str, list[Span]] = {}
+        for s in self.spans:
+            if s.song:
+                by_song.setdefault(s.song, []).append(s)
+        return by_song
+
+    def report(self) -> str:
+        lines = ["Per song:"]
+        for song, spans in self.songs().items():
+            stages = ", ".join(f"{name} {stage['total_ms']:.1f}ms" for name, stage in self.stage_totals(spans).items())
+            lines.append(f"  {song}: {stages}")
+
+        lines.append("Per batch:")
+        lines.append(f"  {'stage':<20}{'count':>7}{'total ms':>12}{'mean ms':>10}{'max ms':>10}{'MB read':>10}{'MB written':>12}")
+        for name, stage in sorted(self.stage_totals().items(), key=lambda item: -item[1]["total_ms"]):
+            lines.append(
+                f"  {name:<20}{stage['count']:>7}{stage['total_ms']:>12.1f}"
+                f"{stage['total_ms'] / stage['count']:>10.1f}{stage['max_ms']:>10.1f}"
+                f"{stage['bytes_read'] / 1_048_576:>10.2f}{stage['bytes_written'] / 1_048_576:>12.2f}"
+            )
+        return "\n".join(lines)
+
+    def write_jsonl(self, path: Path | str) -> None:
+        with open(path, "w", encoding="utf-8") as file:
+            for s in self.spans:
+                file.write(json.dumps(s.as_dict(), ensure_ascii=False) + "\n")
+
+    def write_chrome_trace(self, path: Path | str) -> None:
+        """Trace Event Format, opens in chrome://tracing or Perfetto."""
+        events = [
+            {
+                "name": s.name,
+                "cat": "song_adder",
+                "ph": "X",
+                "ts": (s.start_ns - self.origin_ns) / 1000,
+                "dur": (s.end_ns - s.start_ns) / 1000,
+                "pid": os.getpid(),
+                "tid": s.thread_id,
+                "args": {"song": s.song, "bytes_read": s.bytes_read, "bytes_written": s.bytes_written, **s.args},
+            }
+            for s in self.spans
+        ]
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file, ensure_ascii=False)
+
+    def write(self, path: Path | str) -> None:
+        """Chrome trace for .json files, JSON lines otherwise."""
+        if str(path).endswith(".json"):
+            self.write_chrome_trace(path)
+        else:
+            self.write_jsonl(path)
+
+
+def enable_instrumentation() -> Recorder:
+    global _recorder
+    if _recorder is None:
+        _recorder = Recorder()
+    return _recorder
+
+def get_recorder() -> (Recorder | None):
+    return _recorder
+
+@contextmanager
+def song_scope(song: str) -> Iterator[None]:
+    """Attributes the spans of the current thread to a song for the per-song report."""
+    previous = getattr(_local, "song", None)
+    _local.song = song
+    try:
+        yield
+    finally:
+        _local.song = previous
+
+@contextmanager
+def span(name: str, **args: Any) -> Iterator[(Span | None)]:
+    """
+    Times the block with a monotonic clock. The yielded span (None when disabled)
+    takes bytes_read/bytes_written counters.
+    """
+    recorder = _recorder
+    if recorder is None:
+        yield None
+        return
+
+    current = Span(name, getattr(_local, "song", None), args)
+    try:
+        yield current
+    finally:
+        current.end_ns = time.perf_counter_ns()
+        recorder.add(current)
+
+def file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
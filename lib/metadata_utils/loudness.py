@@ -0,0 +1,400 @@
+import json
+import logging
+import os
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+from json import JSONDecodeError
+from pathlib import Path
+from types import ModuleType
+from typing import TYPE_CHECKING, Any
+
+from mutagen.id3 import ID3, TXXX, ID3NoHeaderError
+
+from .catalogue import PayloadCache, default_cache_path, iter_archive
+from .snapshots import SnapshotStore
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+LOUDNESS_CACHE_FILENAME = ".song_adder_loudness.json"
+
+# bump whenever the analysis changes, cached results are then recomputed
+LOUDNESS_VERSION = 1
+
+# ReplayGain 2.0 reference level
+REFERENCE_LOUDNESS = -18.0
+
+# BS.1770 K-weighting is specified at 48 kHz, ffmpeg resamples everything to it
+SAMPLE_RATE = 48000
+SEGMENT_FRAMES = SAMPLE_RATE // 10
+# frames decoded and analysed at once, a whole number of 100 ms segments
+BLOCK_FRAMES = SEGMENT_FRAMES * 64
+
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+# block loudness histogram resolution, used to gate albums without keeping every block
+HISTOGRAM_STEP = 0.1
+
+# BS.1770-4 K-weighting: a high shelf followed by a high pass, 48 kHz coefficients
+SHELF_B = (1.53512485958697, -2.69169618940638, 1.19839281085285)
+SHELF_A = (1.0, -1.69065929318241, 0.73248077421585)
+HIGH_PASS_B = (1.0, -2.0, 1.0)
+HIGH_PASS_A = (1.0, -1.99004745483398, 0.99007225036621)
+# the impulse response decays below 1e-9 well within this many taps
+K_WEIGHTING_TAPS = 8192
+
+# true peak: 4x oversampling through a 49 tap windowed sinc, BS.1770 annex 2
+OVERSAMPLING = 4
+INTERPOLATION_TAPS = 12 * OVERSAMPLING + 1
+
+
+class LoudnessError(Exception):
+    pass
+
+
+def _numpy() -> ModuleType:
+    try:
+        import numpy
+    except ImportError as e:
+        raise RuntimeError("Loudness analysis requires the optional 'numpy' package, the 'analysis' extra") from e
+    return numpy
+
+def _biquad_impulse(b: tuple[float, float, float], a: tuple[float, float, float], signal: list[float]) -> list[float]:
+    out: list[float] = []
+    x1 = x2 = y1 = y2 = 0.0
+    for x in signal:
+        y = b[0] * x + b[1] * x1 + b[2] * x2 - a[1] * y1 - a[2] * y2
+        out.append(y)
+        x1, x2, y1, y2 = x, x1, y, y1
+    return out
+
+@lru_cache(maxsize=1)
+def _k_weighting_response() -> "np.ndarray":
+    """The K-weighting filter as an FIR, so it can be applied to whole blocks with FFTs."""
+    np = _numpy()
+    impulse = [1.0] + [0.0] * (K_WEIGHTING_TAPS - 1)
+    response = _biquad_impulse(HIGH_PASS_B, HIGH_PASS_A, _biquad_impulse(SHELF_B, SHELF_A, impulse))
+    return np.array(response)
+
+@lru_cache(maxsize=4)
+def _k_weighting_spectrum(size: int) -> "np.ndarray":
+    np = _numpy()
+    return np.fft.rfft(_k_weighting_response(), size)[:, None]
+
+@lru_cache(maxsize=1)
+def _interpolation_phases() -> list["np.ndarray"]:
+    np = _numpy()
+    n = np.arange(INTERPOLATION_TAPS) - INTERPOLATION_TAPS // 2
+    taps = np.sinc(n / OVERSAMPLING) * np.kaiser(INTERPOLATION_TAPS, 8.0)
+    # phase 0 lands on the original samples
+    return [taps[phase::OVERSAMPLING].astype(np.float32) for phase in range(1, OVERSAMPLING)]
+
+def _channel_weights(channels: int) -> "np.ndarray":
+    np = _numpy()
+    if channels == 6:
+        # L R C LFE Ls Rs, the LFE is ignored and the surrounds weighted +1.5 dB
+        return np.array([1.0, 1.0, 1.0, 0.0, 1.41, 1.41])
+    return np.ones(channels)
+
+def _channel_count(path: str) -> int:
+    from mutagen import File
+
+    try:
+        audio = File(path)
+        channels = getattr(getattr(audio, "info", None), "channels", 0)
+    except Exception:
+        channels = 0
+    return channels or 2
+
+def _k_weight(block: "np.ndarray", tail: "np.ndarray") -> tuple["np.ndarray", "np.ndarray"]:
+    """Overlap-add FFT convolution, tail carries the filter output past the previous block."""
+    np = _numpy()
+    taps = K_WEIGHTING_TAPS
+    length = len(block) + taps - 1
+    size = 1 << (length - 1).bit_length()
+
+    filtered = np.fft.irfft(np.fft.rfft(block, size, axis=0) * _k_weighting_spectrum(size), size, axis=0)[:length]
+    filtered[:taps - 1] += tail
+    return filtered[:len(block)], filtered[len(block):]
+
+def _true_peak(block: "np.ndarray", history: "np.ndarray") -> float:
+    np = _numpy()
+    peak = float(np.abs(block).max()) if len(block) else 0.0
+    samples = np.concatenate([history, block])
+    for phase in _interpolation_phases():
+        for channel in range(samples.shape[1]):
+            if len(samples) >= len(phase):
+                peak = max(peak, float(np.abs(np.convolve(samples[:, channel], phase, mode="valid")).max()))
+    return peak
+
+def _block_loudness(power: "np.ndarray") -> "np.ndarray":
+    np = _numpy()
+    with np.errstate(divide="ignore"):
+        return -0.691 + 10 * np.log10(power)
+
+def analyse_file(path: str) -> dict[str, Any]:
+    """
+    EBU R128 integrated loudness (LUFS), true peak (linear) and the histogram of gated block
+    loudness, streaming the decoded audio from an ffmpeg pipe one block at a time.
+    """
+    np = _numpy()
+    channels = _channel_count(path)
+    frame_bytes = 4 * channels
+
+    # hides the console on Windows
+    cf_flag = 0x08000000 if sys.platform == "win32" else 0
+
+    try:
+        process = subprocess.Popen(
+            [
+                "ffmpeg", "-v", "error", "-nostdin",
+                "-i", path,
+                "-map", "0:a:0",
+                "-ac", str(channels),
+                "-ar", str(SAMPLE_RATE),
+                "-f", "f32le", "-"
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            creationflags=cf_flag
+        )
+    except OSError as e:
+        raise LoudnessError(f"ffmpeg couldn't be run for {path}") from e
+
+    assert process.stdout is not None and process.stderr is not None
+    tail = np.zeros((K_WEIGHTING_TAPS - 1, channels))
+    history = np.zeros((INTERPOLATION_TAPS // OVERSAMPLING, channels), dtype=np.float32)
+    segments: list["np.ndarray"] = []
+    peak = 0.0
+
+    try:
+        while True:
+            data = process.stdout.read(BLOCK_FRAMES * frame_bytes)
+            if not data:
+                break
+            block = np.frombuffer(data[:len(data) - len(data) % frame_bytes], dtype=np.float32).reshape(-1, channels)
+
+            peak = max(peak, _true_peak(block, history))
+            history = np.concatenate([history, block])[-len(history):]
+
+            filtered, tail = _k_weight(block, tail)
+            # a trailing partial segment can't complete a gating block anyway
+            full = len(filtered) // SEGMENT_FRAMES * SEGMENT_FRAMES
+            segments.append((filtered[:full].reshape(-1, SEGMENT_FRAMES, channels) ** 2).mean(axis=1))
+    finally:
+        stderr = process.stderr.read()
+        process.wait()
+
+    if process.returncode != 0:
+        raise LoudnessError(f"ffmpeg failed decoding {path}: {stderr.decode(errors='replace').strip()}")
+
+    mean_squares = np.concatenate(segments) if segments else np.zeros((0, channels))
+    result: dict[str, Any] = {"loudness": None, "peak": peak, "histogram": []}
+    if len(mean_squares) < 4:
+        return result
+
+    # 400 ms gating blocks overlapping by 75%
+    blocks = (mean_squares[:-3] + mean_squares[1:-2] + mean_squares[2:-1] + mean_squares[3:]) / 4
+    power = blocks @ _channel_weights(channels)
+    loudness = _block_loudness(power)
+
+    audible = loudness > ABSOLUTE_GATE
+    if not audible.any():
+        return result
+
+    relative_gate = float(_block_loudness(power[audible].mean())) + RELATIVE_GATE
+    gated = audible & (loudness > relative_gate)
+    result["loudness"] = float(_block_loudness(power[gated].mean()))
+
+    # [bin, blocks, summed power], the power keeps album loudness exact apart from the gate position
+    bins = np.floor((loudness[audible] - ABSOLUTE_GATE) / HISTOGRAM_STEP).astype(np.int64)
+    counts = np.bincount(bins)
+    powers = np.bincount(bins, weights=power[audible])
+    result["histogram"] = [[int(index), int(counts[index]), float(powers[index])] for index in np.nonzero(counts)[0]]
+    return result
+
+def album_loudness(histograms: list[list[list[float]]]) -> (float | None):
+    """Integrated loudness of several songs as one programme, gated on their merged block histograms."""
+    np = _numpy()
+    merged: dict[int, list[float]] = {}
+    for histogram in histograms:
+        for index, count, power in histogram:
+            totals = merged.setdefault(int(index), [0, 0.0])
+            totals[0] += count
+            totals[1] += power
+    if not merged:
+        return None
+
+    indexes = np.array(list(merged))
+    counts, powers = np.array(list(merged.values())).T
+    # a bin is kept when its centre passes the relative gate
+    centers = ABSOLUTE_GATE + (indexes + 0.5) * HISTOGRAM_STEP
+
+    relative_gate = float(_block_loudness(powers.sum() / counts.sum())) + RELATIVE_GATE
+    gated = centers > relative_gate
+    return float(_block_loudness(powers[gated].sum() / counts[gated].sum()))
+
+def _format_gain(loudness: float) -> str:
+    return f"{REFERENCE_LOUDNESS - loudness:+.2f} dB"
+
+def _format_peak(peak: float) -> str:
+    return f"{peak:.6f}"
+
+def write_replaygain(path: str, values: dict[str, str], snapshot_store: (SnapshotStore | None) = None) -> bool:
+    """Writes the ReplayGain TXXX frames, returns False when they already held these values."""
+    try:
+        tags = ID3(path)
+    except ID3NoHeaderError:
+        tags = ID3()
+
+    if all(str(getattr(tags.get(f"TXXX:{desc}"), "text", [""])[0]) == value for desc, value in values.items()):
+        return False
+
+    if snapshot_store is not None:
+        snapshot_store.snapshot(path)
+    for desc, value in values.items():
+        tags.delall(f"TXXX:{desc}")
+        tags.add(TXXX(encoding=3, desc=desc, text=[value]))
+    tags.save(path)
+    return True
+
+def default_loudness_cache_path(directory: Path | str) -> Path:
+    return Path(directory) / LOUDNESS_CACHE_FILENAME
+
+
+class LoudnessCache:
+    """Analysis results keyed by the engraved xxHash, so retagged or moved songs aren't analysed again."""
+    def __init__(self, cache_path: (Path | str | None) = None):
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.results: dict[str, dict[str, Any]] = {}
+
+        if self.cache_path and self.cache_path.exists():
+            try:
+                with open(self.cache_path, "r", encoding="utf-8") as file:
+                    content = json.load(file)
+                if content.get("version") == LOUDNESS_VERSION:
+                    self.results = content["songs"]
+            except (OSError, JSONDecodeError, AttributeError, KeyError) as e:
+                logger.warning(f"Ignoring unreadable loudness cache {self.cache_path}")
+                logger.debug(e)
+
+    def save(self) -> None:
+        if not self.cache_path:
+            return
+        temp_path = self.cache_path.with_name(self.cache_path.name + ".tmp")
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump({"version": LOUDNESS_VERSION, "songs": self.results}, file)
+        os.replace(temp_path, self.cache_path)
+
+
+class LoudnessReport:
+    def __init__(self) -> None:
+        self.analysed = 0
+        self.cached = 0
+        self.tagged = 0
+        self.unchanged = 0
+        self.silent: list[str] = []
+        self.failed: dict[str, str] = {}
+        # path -> ReplayGain values
+        self.values: dict[str, dict[str, str]] = {}
+
+    def summary(self) -> str:
+        lines = [
+            f"Analysed: {self.analysed}",
+            f"Reused from cache: {self.cached}",
+            f"Tagged: {self.tagged}",
+            f"Already tagged: {self.unchanged}",
+            f"Silent (skipped): {len(self.silent)}",
+            f"Failed: {len(self.failed)}",
+        ]
+        lines.extend(f"  {path}: {error}" for path, error in self.failed.items())
+        return "\n".join(lines)
+
+
+def replaygain_archive(archive: Path | str, workers: (int | None) = None, dry_run: bool = False,
+                       cache_path: (Path | str | None) = None, save_every: int = 25,
+                       snapshot_store: (SnapshotStore | None) = None) -> LoudnessReport:
+    """
+    Analyses every song with an engraved payload and writes ReplayGain track tags, and album
+    tags computed over each disc. Analysis runs in a process pool and results are cached by
+    xxHash, saved every save_every songs so an interrupted run resumes where it stopped.
+    """
+    report = LoudnessReport()
+    cache = LoudnessCache(cache_path)
+    payload_cache = PayloadCache(default_cache_path(archive))
+
+    songs: dict[str, tuple[str, str]] = {}
+    for path, song_data in iter_archive(archive, cache=payload_cache):
+        audio_hash = song_data.get("xxHash")
+        if not audio_hash:
+            logger.warning(f"Skipping {path}, it's payload has no xxHash")
+            continue
+        songs[path] = (audio_hash, str(song_data.get("Discnumber") or os.path.dirname(path)))
+    payload_cache.save()
+
+    # one analysis per audio, copies of a song share it
+    missing: dict[str, str] = {}
+    queued: set[str] = set()
+    for path, (audio_hash, _) in songs.items():
+        if audio_hash in cache.results:
+            report.cached += 1
+        elif audio_hash not in queued:
+            missing[path] = audio_hash
+            queued.add(audio_hash)
+
+    if missing:
+        logger.info(f"Analysing {len(missing)} songs...")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(analyse_file, path): path for path in missing}
+            for done, future in enumerate(as_completed(futures), 1):
+                path = futures[future]
+                try:
+                    cache.results[missing[path]] = future.result()
+                except Exception as e:
+                    report.failed[path] = str(e)
+                    logger.error(f"Failed analysing {path}: {e}")
+                else:
+                    report.analysed += 1
+                if done % save_every == 0:
+                    cache.save()
+        cache.save()
+
+    discs: dict[str, list[str]] = {}
+    for path, (audio_hash, disc) in songs.items():
+        if audio_hash in cache.results:
+            discs.setdefault(disc, []).append(path)
+
+    for disc, paths in discs.items():
+        results = [cache.results[songs[path][0]] for path in paths]
+        disc_loudness = album_loudness([result["histogram"] for result in results])
+        disc_peak = max(result["peak"] for result in results)
+
+        for path, result in zip(paths, results):
+            if result["loudness"] is None or disc_loudness is None:
+                report.silent.append(path)
+                continue
+
+            values = {
+                "REPLAYGAIN_TRACK_GAIN": _format_gain(result["loudness"]),
+                "REPLAYGAIN_TRACK_PEAK": _format_peak(result["peak"]),
+                "REPLAYGAIN_ALBUM_GAIN": _format_gain(disc_loudness),
+                "REPLAYGAIN_ALBUM_PEAK": _format_peak(disc_peak),
+            }
+            report.values[path] = values
+            if dry_run:
+                continue
+
+            try:
+                if write_replaygain(path, values, snapshot_store):
+                    report.tagged += 1
+                else:
+                    report.unchanged += 1
+            except Exception as e:
+                report.failed[path] = str(e)
+                logger.error(f"Failed tagging {path}: {e}")
+
+    return report
@@ -0,0 +1,107 @@
+import errno
+import io
+import logging
+import os
+from typing import BinaryIO, Callable
+
+from mutagen.id3 import ID3
+
+logger = logging.getLogger(__name__)
+
+COPY_CHUNK_SIZE = 1 << 20
+
+# errors meaning the kernel can't copy between these two files, not that the copy failed
+_UNSUPPORTED = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTSOCK, errno.EBADF}
+
+
+def serialize_tags(tags: ID3) -> bytes:
+    """The ID3v2 block mutagen would write at the start of a file, padding included."""
+    buffer = io.BytesIO()
+    tags.save(buffer, v1=0)
+    return buffer.getvalue()
+
+def _copy_file_range(src_fd: int, dst_fd: int, src_offset: int, dst_offset: int, count: int) -> int:
+    copied = 0
+    while copied < count:
+        try:
+            written = os.copy_file_range(src_fd, dst_fd, count - copied, src_offset + copied, dst_offset + copied)
+        except OSError as e:
+            if copied == 0 and e.errno in _UNSUPPORTED:
+                return 0
+            raise
+        if written == 0:
+            break
+        copied += written
+    return copied
+
+def _sendfile(src_fd: int, dst_fd: int, src_offset: int, dst_offset: int, count: int) -> int:
+    copied = 0
+    os.lseek(dst_fd, dst_offset, os.SEEK_SET)
+    while copied < count:
+        try:
+            written = os.sendfile(dst_fd, src_fd, src_offset + copied, count - copied)
+        except OSError as e:
+            if copied == 0 and e.errno in _UNSUPPORTED:
+                return 0
+            raise
+        if written == 0:
+            break
+        copied += written
+    return copied
+
+def _chunked_copy(src_fd: int, dst_fd: int, src_offset: int, dst_offset: int, count: int) -> int:
+    copied = 0
+    os.lseek(dst_fd, dst_offset, os.SEEK_SET)
+    while copied < count:
+        chunk = _read_at(src_fd, src_offset + copied, min(COPY_CHUNK_SIZE, count - copied))
+        if not chunk:
+            break
+        view = memoryview(chunk)
+        while view:
+            view = view[os.write(dst_fd, view):]
+        copied += len(chunk)
+    return copied
+
+def _read_at(fd: int, offset: int, size: int) -> bytes:
+    if hasattr(os, "pread"):
+        return os.pread(fd, size, offset)
+    # Windows has no pread
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.read(fd, size)
+
+def _copy_methods() -> list[Callable[[int, int, int, int, int], int]]:
+    methods: list[Callable[[int, int, int, int, int], int]] = []
+    if hasattr(os, "copy_file_range"):
+        methods.append(_copy_file_range)
+    if hasattr(os, "sendfile"):
+        methods.append(_sendfile)
+    methods.append(_chunked_copy)
+    return methods
+
+def copy_range(src: BinaryIO, dst: BinaryIO, start: int, end: int) -> None:
+    """
+    Appends src[start:end] to dst. copy_file_range lets the filesystem share the blocks
+    (reflinks on btrfs/XFS) or copy them in the kernel, sendfile stays in the kernel too,
+    and the chunked copy is the fallback everywhere else.
+    """
+    dst.flush()
+    src_fd, dst_fd = src.fileno(), dst.fileno()
+    dst_offset = dst.tell()
+    count = end - start
+    copied = 0
+
+    for method in _copy_methods():
+        copied += method(src_fd, dst_fd, start + copied, dst_offset + copied, count - copied)
+        if copied >= count:
+            break
+        logger.debug(f"{method.__name__} stopped after {copied} of {count} bytes, falling back")
+
+    if copied != count:
+        raise OSError(f"Copied {copied} of {count} bytes")
+    dst.seek(dst_offset + count)
+
+def write_output(target: str, tag_block: bytes, source: str, start: int, end: int) -> None:
+    """Writes a song as a freshly serialized ID3v2 block followed by the audio range of another file."""
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        dst.write(tag_block)
+        copy_range(src, dst, start, end)
@@ -0,0 +1,70 @@
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Iterator
+
+logger = logging.getLogger(__name__)
+
+# listings of a network share are dominated by round trips, so folders are listed in parallel
+SCAN_WORKERS = 8
+
+
+def _scan_folder(folder: str, suffixes: tuple[str, ...], include_hidden: bool) -> tuple[list[os.DirEntry[str]], list[str]]:
+    files: list[os.DirEntry[str]] = []
+    folders: list[str] = []
+    try:
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if not include_hidden and entry.name.startswith("."):
+                    continue
+                try:
+                    # symlinked folders aren't followed, they could loop
+                    if entry.is_dir(follow_symlinks=False):
+                        folders.append(entry.path)
+                    elif entry.name.lower().endswith(suffixes) and entry.is_file():
+                        files.append(entry)
+                except OSError:
+                    continue
+    except OSError as e:
+        logger.warning(f"Skipping {folder}, it couldn't be listed")
+        logger.debug(e)
+    return files, folders
+
+def iter_files(directory: Path | str, suffixes: tuple[str, ...] = (".mp3",), workers: int = SCAN_WORKERS,
+               include_hidden: bool = True) -> Iterator[os.DirEntry[str]]:
+    """
+    Yields the files of a directory tree whose extension matches one of suffixes, in any case.
+    The entries keep the stat information of the listing, on Windows .stat() costs no extra call.
+    Files are yielded as soon as their folder is listed, in no particular order, callers whose
+    output must not change between runs sort them.
+    """
+    suffixes = tuple(suffix.lower() for suffix in suffixes)
+
+    if workers <= 1:
+        stack = [str(directory)]
+        while stack:
+            files, folders = _scan_folder(stack.pop(), suffixes, include_hidden)
+            yield from files
+            stack.extend(folders)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending: set[Future[tuple[list[os.DirEntry[str]], list[str]]]] = {
+            executor.submit(_scan_folder, str(directory), suffixes, include_hidden)
+        }
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    files, folders = future.result()
+                    pending.update(executor.submit(_scan_folder, folder, suffixes, include_hidden) for folder in folders)
+                    yield from files
+        finally:
+            # the caller stopped early
+            for future in pending:
+                future.cancel()
+
+def iter_mp3(directory: Path | str, workers: int = SCAN_WORKERS) -> Iterator[str]:
+    for entry in iter_files(directory, (".mp3",), workers):
+        yield entry.path
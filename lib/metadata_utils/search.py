@@ -0,0 +1,183 @@
+import bisect
+import heapq
+import logging
+import re
+import unicodedata
+from pathlib import Path
+from typing import Iterable
+
+from .catalogue import PayloadCache, iter_archive
+
+logger = logging.getLogger(__name__)
+
+# Payload fields that are searchable as free text
+TEXT_FIELDS = ("Title", "Artist", "CoverArtist")
+
+# Prefixes longer than this are resolved by filtering the candidates of the
+# capped prefix, which keeps the prefix index small for long titles.
+MAX_PREFIX_LENGTH = 12
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def normalize_text(text: str) -> str:
+    ## same NFC normalization as sanitize_filename, so ヴ and ウ + ゙ match
+    folded = unicodedata.normalize('NFC', text).casefold()
+    return unicodedata.normalize('NFC', folded)
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN_PATTERN.findall(normalize_text(text))
+
+
+class IndexedSong:
+    def __init__(self, path: str, song_data: dict[str, str]):
+        self.path = path
+        self.song_data = song_data
+
+    def sort_key(self) -> tuple[str, str, str]:
+        return (self.song_data.get("Date", ""), normalize_text(self.song_data.get("Title", "")), self.path)
+
+
+class SongIndex:
+    """
+    In-memory inverted index over the COMM::ved payloads of an archive.
+    """
+    def __init__(self) -> None:
+        self.songs: list[IndexedSong] = []
+        self._ids_by_path: dict[str, int] = {}
+        # field -> token -> song ids ("*" holds every text field)
+        self._tokens: dict[str, dict[str, set[int]]] = {field: {} for field in (*TEXT_FIELDS, "*")}
+        self._prefixes: dict[str, dict[str, set[int]]] = {field: {} for field in (*TEXT_FIELDS, "*")}
+        self._field_tokens: dict[str, list[set[str]]] = {field: [] for field in (*TEXT_FIELDS, "*")}
+        self._versions: dict[str, set[int]] = {}
+        # (date, id) pairs, sorted on first use since ISO dates sort lexicographically
+        self._dates: list[tuple[str, int]] = []
+        # position of every song in the result order, rebuilt on first use after an add
+        self._ranks: list[int] = []
+        self._is_sorted = True
+
+    def __len__(self) -> int:
+        return len(self.songs)
+
+    def add(self, path: str, song_data: dict[str, str]) -> None:
+        if path in self._ids_by_path:
+            logger.debug(f"{path} is already indexed")
+            return
+
+        song_id = len(self.songs)
+        self.songs.append(IndexedSong(path, song_data))
+        self._ids_by_path[path] = song_id
+
+        all_tokens: set[str] = set()
+        for field in TEXT_FIELDS:
+            tokens = set(tokenize(song_data.get(field, "")))
+            self._index_tokens(field, song_id, tokens)
+            all_tokens |= tokens
+        self._index_tokens("*", song_id, all_tokens)
+
+        self._versions.setdefault(song_data.get("Version", ""), set()).add(song_id)
+        self._dates.append((song_data.get("Date", ""), song_id))
+        self._is_sorted = False
+
+    def _index_tokens(self, field: str, song_id: int, tokens: set[str]) -> None:
+        self._field_tokens[field].append(tokens)
+        token_index = self._tokens[field]
+        prefix_index = self._prefixes[field]
+
+        for token in tokens:
+            token_index.setdefault(token, set()).add(song_id)
+            for i in range(1, min(len(token), MAX_PREFIX_LENGTH) + 1):
+                prefix_index.setdefault(token[:i], set()).add(song_id)
+
+    def _match_text(self, field: str, query: str) -> set[int]:
+        """
+        Every query token must match a token of the field. Complete words are looked up
+        in the token index, the last word is treated as a prefix (the user may still be typing).
+        """
+        query_tokens = tokenize(query)
+        if not query_tokens:
+            return set(range(len(self.songs)))
+
+        *words, last_token = query_tokens
+        candidate_sets = [self._tokens[field].get(word, set()) for word in words]
+        candidate_sets.append(self._prefixes[field].get(last_token[:MAX_PREFIX_LENGTH], set()))
+
+        candidate_sets.sort(key=len)
+        matches = candidate_sets[0].intersection(*candidate_sets[1:])
+
+        if len(last_token) > MAX_PREFIX_LENGTH:
+            field_tokens = self._field_tokens[field]
+            matches = {i for i in matches if any(t.startswith(last_token) for t in field_tokens[i])}
+
+        return matches
+
+    def _sort(self) -> None:
+        if self._is_sorted:
+            return
+        self._dates.sort()
+        order = sorted(range(len(self.songs)), key=lambda i: self.songs[i].sort_key())
+        self._ranks = [0] * len(order)
+        for rank, song_id in enumerate(order):
+            self._ranks[song_id] = rank
+        self._is_sorted = True
+
+    def _match_dates(self, date_from: (str | None), date_to: (str | None)) -> set[int]:
+        start = bisect.bisect_left(self._dates, (date_from, -1)) if date_from else 0
+        end = bisect.bisect_right(self._dates, (date_to, len(self.songs))) if date_to else len(self._dates)
+        return {song_id for _, song_id in self._dates[start:end]}
+
+    def _filter_dates(self, ids: set[int], date_from: (str | None), date_to: (str | None)) -> set[int]:
+        # cheaper than materializing a wide date range when other filters already narrowed it down
+        songs = self.songs
+        return {
+            i for i in ids
+            if (not date_from or songs[i].song_data.get("Date", "") >= date_from)
+            and (not date_to or songs[i].song_data.get("Date", "") <= date_to)
+        }
+
+    def search(self, text: (str | None) = None, title: (str | None) = None,
+               artist: (str | None) = None, cover_artist: (str | None) = None,
+               date_from: (str | None) = None, date_to: (str | None) = None,
+               version: (str | None) = None, limit: (int | None) = None
+               ) -> list[IndexedSong]:
+
+        self._sort()
+        filters: list[set[int]] = []
+
+        for field, query in (("*", text), ("Title", title), ("Artist", artist), ("CoverArtist", cover_artist)):
+            if query:
+                filters.append(self._match_text(field, query))
+
+        if version:
+            filters.append(self._versions.get(version.strip(), set()))
+
+        if filters:
+            filters.sort(key=len)
+            ids: Iterable[int] = filters[0].intersection(*filters[1:])
+            if date_from or date_to:
+                ids = self._filter_dates(ids, date_from, date_to)
+        elif date_from or date_to:
+            ids = self._match_dates(date_from, date_to)
+        else:
+            ids = range(len(self.songs))
+
+        ranks = self._ranks
+        if limit is not None:
+            ordered = heapq.nsmallest(limit, ids, key=ranks.__getitem__)
+        else:
+            ordered = sorted(ids, key=ranks.__getitem__)
+        return [self.songs[i] for i in ordered]
+
+def build_index(directory: Path | str, cache_path: (Path | str | None) = None, workers: int = 8) -> SongIndex:
+    """
+    Builds a SongIndex from every payload found in a directory and it's sub-directories.
+    """
+    index = SongIndex()
+    cache = PayloadCache(cache_path)
+
+    for path, song_data in iter_archive(directory, cache=cache, workers=workers):
+        index.add(path, song_data)
+
+    cache.save()
+    logger.info(f"Indexed {len(index)} songs from {directory}")
+    return index
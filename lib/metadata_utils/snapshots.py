@@ -0,0 +1,212 @@
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Iterable
+
+from .hash_mutagen import hash_file_range
+from .output_writer import write_output
+from .stream_info import read_audio_bounds
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOTS_FOLDER = ".song_adder_snapshots"
+
+BLOCK_SUFFIX = ".id3"
+
+
+def _xxh3_128(data: bytes) -> str:
+    import xxhash
+    return xxhash.xxh3_128(data).hexdigest()
+
+def default_snapshot_path(archive: Path | str) -> Path:
+    return Path(archive) / SNAPSHOTS_FOLDER
+
+def new_label(operation: str) -> str:
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{operation}"
+
+
+class SnapshotEntry:
+    def __init__(self, path: str, block: str, audio_hash: str, size: int, taken: float):
+        # relative to the archive when the song is inside it
+        self.path = path
+        # content hash of the ID3v2 tag block, "" when the song had none
+        self.block = block
+        self.audio_hash = audio_hash
+        self.size = size
+        self.taken = taken
+
+    def as_dict(self) -> dict[str, Any]:
+        return dict(vars(self))
+
+
+class RestoreReport:
+    def __init__(self) -> None:
+        self.restored: list[str] = []
+        self.unchanged: list[str] = []
+        self.failed: dict[str, str] = {}
+
+    def summary(self) -> str:
+        lines = [
+            f"Restored: {len(self.restored)}",
+            f"Already as snapshotted: {len(self.unchanged)}",
+            f"Failed: {len(self.failed)}",
+        ]
+        lines.extend(f"  {path}: {error}" for path, error in self.failed.items())
+        return "\n".join(lines)
+
+
+class SnapshotStore:
+    """
+    Undo history of in-place tag writes. Before a song's tags are rewritten, only it's original
+    ID3v2 tag block is stored, together with the xxHash of the audio proving the restore puts it
+    back on the same audio. Blocks are content addressed, so songs and snapshots sharing a block
+    store it once, and a labelled snapshot of a whole archive costs megabytes instead of gigabytes.
+    """
+    def __init__(self, archive: Path | str, label: (str | None) = None, root: (Path | str | None) = None):
+        self.archive = os.path.abspath(archive)
+        self.root = Path(root) if root else default_snapshot_path(self.archive)
+        self.label = label or new_label("snapshot")
+        self._lock = threading.Lock()
+        # the first snapshot of a song within a label is the state to go back to
+        self._taken: set[str] = set()
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.root / "manifests" / f"{self.label}.jsonl"
+
+    def _block_path(self, block: str) -> Path:
+        return self.root / "blocks" / block[:2] / f"{block}{BLOCK_SUFFIX}"
+
+    def _relative(self, path: str) -> str:
+        path = os.path.abspath(path)
+        if os.path.commonpath([path, self.archive]) == self.archive:
+            return os.path.relpath(path, self.archive)
+        return path
+
+    def _absolute(self, path: str) -> str:
+        return os.path.join(self.archive, path)
+
+    def _store_block(self, data: bytes) -> str:
+        block = _xxh3_128(data)
+        block_path = self._block_path(block)
+        if block_path.exists():
+            return block
+
+        block_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = block_path.with_name(f".{block_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(temp_path, "wb") as file:
+            file.write(data)
+        os.replace(temp_path, block_path)
+        return block
+
+    def snapshot(self, path: str) -> (SnapshotEntry | None):
+        """Stores the current tag block of a song, once per label. None when it was already taken."""
+        relative = self._relative(path)
+        with self._lock:
+            if relative in self._taken:
+                return None
+            self._taken.add(relative)
+
+        start, end = read_audio_bounds(path)
+        with open(path, "rb") as file:
+            data = file.read(start)
+
+        entry = SnapshotEntry(
+            relative,
+            self._store_block(data) if data else "",
+            hash_file_range(path, start, end),
+            os.path.getsize(path),
+            time.time()
+        )
+        with self._lock:
+            self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.manifest_path, "a", encoding="utf-8") as file:
+                file.write(json.dumps(entry.as_dict(), ensure_ascii=False) + "\n")
+        return entry
+
+    def snapshot_all(self, paths: Iterable[str]) -> int:
+        count = 0
+        for path in paths:
+            try:
+                if self.snapshot(path) is not None:
+                    count += 1
+            except OSError as e:
+                logger.error(f"Failed snapshotting {path}: {e}")
+        return count
+
+    def labels(self) -> list[str]:
+        manifests = self.root / "manifests"
+        if not manifests.is_dir():
+            return []
+        # oldest first, labels may be named freely
+        return [path.stem for path in sorted(manifests.glob("*.jsonl"), key=lambda path: path.stat().st_mtime_ns)]
+
+    def entries(self, label: (str | None) = None) -> list[SnapshotEntry]:
+        """The first snapshot of every song of a label, the one holding it's state before the operation."""
+        manifest_path = self.root / "manifests" / f"{label or self.label}.jsonl"
+        entries: dict[str, SnapshotEntry] = {}
+        with open(manifest_path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    entry = SnapshotEntry(**json.loads(line))
+                except (json.JSONDecodeError, TypeError):
+                    # a torn last line from an interrupted operation
+                    logger.debug(f"Ignoring corrupted snapshot line: {line!r}")
+                    continue
+                entries.setdefault(entry.path, entry)
+        return list(entries.values())
+
+    def restore_entry(self, entry: SnapshotEntry) -> bool:
+        """
+        Puts a song's snapshotted tag block back in front of it's audio, which must be unchanged.
+        Returns False when the song already has that block.
+        """
+        path = self._absolute(entry.path)
+        start, end = read_audio_bounds(path)
+        audio_hash = hash_file_range(path, start, end)
+        if audio_hash != entry.audio_hash:
+            raise ValueError(f"The audio changed since the snapshot ({entry.audio_hash} -> {audio_hash})")
+
+        block = b""
+        if entry.block:
+            block = self._block_path(entry.block).read_bytes()
+            if _xxh3_128(block) != entry.block:
+                raise ValueError(f"Snapshot block {entry.block} is corrupted")
+
+        with open(path, "rb") as file:
+            if file.read(start) == block:
+                return False
+
+        # the audio and an ID3v1 tag after it are kept as they are
+        temp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{os.getpid()}.restore")
+        try:
+            write_output(temp_path, block, path, start, os.path.getsize(path))
+            with open(temp_path, "rb+") as file:
+                os.fsync(file.fileno())
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return True
+
+    def restore(self, label: (str | None) = None, paths: (Iterable[str] | None) = None) -> RestoreReport:
+        """Restores every song of a label, or only those of paths."""
+        report = RestoreReport()
+        wanted = {self._relative(path) for path in paths} if paths else None
+
+        for entry in self.entries(label):
+            if wanted is not None and entry.path not in wanted:
+                continue
+            try:
+                if self.restore_entry(entry):
+                    report.restored.append(entry.path)
+                else:
+                    report.unchanged.append(entry.path)
+            except (OSError, ValueError) as e:
+                report.failed[entry.path] = str(e)
+                logger.error(f"Failed restoring {entry.path}: {e}")
+        return report
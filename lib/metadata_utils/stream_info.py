@@ -0,0 +1,248 @@
+import logging
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+# bytes searched after the ID3v2 tag for the first frame
+SEARCH_BYTES = 65536
+
+# kbps, by (MPEG-1, layer)
+BITRATES = {
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+# by the version bits: MPEG-2.5, reserved, MPEG-2, MPEG-1
+SAMPLE_RATES = {0: (11025, 12000, 8000), 2: (22050, 24000, 16000), 3: (44100, 48000, 32000)}
+
+
+class StreamInfoError(Exception):
+    pass
+
+
+class Frame:
+    def __init__(self, version: int, layer: int, bitrate: int, sample_rate: int, padding: int, channels: int):
+        self.version = version
+        self.layer = layer
+        self.bitrate = bitrate
+        self.sample_rate = sample_rate
+        self.channels = channels
+
+        mpeg1 = version == 3
+        if layer == 1:
+            self.samples = 384
+        elif layer == 3 and not mpeg1:
+            self.samples = 576
+        else:
+            self.samples = 1152
+        self.length = self.samples // 8 * bitrate // sample_rate + padding * (4 if layer == 1 else 1)
+
+    @property
+    def side_info_size(self) -> int:
+        """Bytes between the header and a Xing/Info header."""
+        if self.version == 3:
+            return 17 if self.channels == 1 else 32
+        return 9 if self.channels == 1 else 17
+
+
+def parse_header(header: int) -> (Frame | None):
+    if header >> 21 != 0x7FF:
+        return None
+    version = (header >> 19) & 3
+    layer = 4 - ((header >> 17) & 3)
+    bitrate_index = (header >> 12) & 15
+    sample_rate_index = (header >> 10) & 3
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    bitrate = BITRATES[(version == 3, layer)][bitrate_index] * 1000
+    sample_rate = SAMPLE_RATES[version][sample_rate_index]
+    padding = (header >> 9) & 1
+    channels = 1 if (header >> 6) & 3 == 3 else 2
+    return Frame(version, layer, bitrate, sample_rate, padding, channels)
+
+
+class StreamInfo:
+    def __init__(self, duration: float, bitrate: int, frames: int, sample_rate: int, channels: int, source: str):
+        self.duration = duration
+        # bits per second, the average for VBR
+        self.bitrate = bitrate
+        self.frames = frames
+        self.sample_rate = sample_rate
+        self.channels = channels
+        # 'xing', 'info', 'vbri' or 'scan'
+        self.source = source
+
+    def as_dict(self) -> dict[str, Any]:
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, values: dict[str, Any]) -> "StreamInfo":
+        return cls(**values)
+
+
+def _audio_bounds(file: Any, file_size: int) -> tuple[int, int]:
+    """Start and end of the audio, past the ID3v2 tag and before an ID3v1 tag."""
+    start = 0
+    head = file.read(10)
+    if len(head) == 10 and head[:3] == b"ID3":
+        size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+        start = 10 + size + (10 if head[5] & 0x10 else 0)
+
+    end = file_size
+    if file_size >= 128:
+        file.seek(file_size - 128)
+        if file.read(3) == b"TAG":
+            end = file_size - 128
+    return start, end
+
+def read_audio_bounds(path: Path | str) -> tuple[int, int]:
+    """(start, end) of the audio of a file: the end of it's ID3v2 tag and the start of an ID3v1 tag or the end."""
+    with open(path, "rb") as file:
+        return _audio_bounds(file, os.fstat(file.fileno()).st_size)
+
+def _find_first_frame(data: bytes) -> tuple[int, Frame]:
+    """First frame whose successor also starts with a valid header, so a stray sync isn't taken."""
+    position = data.find(b"\xff")
+    while 0 <= position <= len(data) - 4:
+        frame = parse_header(struct.unpack_from(">I", data, position)[0])
+        if frame is not None:
+            following = position + frame.length
+            if following > len(data) - 4 or parse_header(struct.unpack_from(">I", data, following)[0]) is not None:
+                return position, frame
+        position = data.find(b"\xff", position + 1)
+    raise StreamInfoError("No MPEG frame found")
+
+def _scan_frames(file: Any, start: int, end: int) -> tuple[int, int, int, bool]:
+    """
+    Walks every frame header, returns (frames, samples, bytes, uniform), uniform being
+    False when the MPEG version, layer, sample rate or channels change along the stream.
+    """
+    frames = samples = 0
+    position = start
+    # frame layouts by header without the private, mode extension, copyright, original and
+    # emphasis bits, the mode bits stay since the channels come from them
+    layouts: dict[int, (Frame | None)] = {}
+    formats: set[tuple[int, int, int, int]] = set()
+
+    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        while position + 4 <= end:
+            header = struct.unpack_from(">I", data, position)[0]
+            key = header & 0xFFFFFEC0
+            if key not in layouts:
+                layouts[key] = parsed = parse_header(header)
+                if parsed is not None:
+                    formats.add((parsed.version, parsed.layer, parsed.sample_rate, parsed.channels))
+            frame = layouts[key]
+            if frame is None or frame.length <= 0:
+                break
+            frames += 1
+            samples += frame.samples
+            position += frame.length
+
+    return frames, samples, position - start, len(formats) == 1
+
+
+class _Probe:
+    """The audio range of a file and what the header of it's first frame says."""
+    def __init__(self, file: Any):
+        file_size = os.fstat(file.fileno()).st_size
+        self.start, self.end = _audio_bounds(file, file_size)
+        file.seek(self.start)
+        data = file.read(min(SEARCH_BYTES, max(0, self.end - self.start)))
+
+        offset, self.frame = _find_first_frame(data)
+        self.junk = offset
+        self.audio_start = self.start + offset
+        xing = offset + 4 + self.frame.side_info_size
+        vbri = offset + 36
+
+        # 'xing', 'info', 'vbri' or '' when there's no header
+        self.header = ""
+        self.frames = self.audio_bytes = 0
+        try:
+            if data[xing:xing + 4] in (b"Xing", b"Info"):
+                self.header = data[xing:xing + 4].decode().lower()
+                flags = struct.unpack_from(">I", data, xing + 4)[0]
+                field = xing + 8
+                if flags & 1:
+                    self.frames = struct.unpack_from(">I", data, field)[0]
+                    field += 4
+                if flags & 2:
+                    self.audio_bytes = struct.unpack_from(">I", data, field)[0]
+            elif data[vbri:vbri + 4] == b"VBRI":
+                self.header = "vbri"
+                self.audio_bytes, self.frames = struct.unpack_from(">II", data, vbri + 10)
+        except struct.error:
+            raise StreamInfoError(f"The file ends inside it's {self.header} header")
+
+
+def read_stream_info(path: Path | str) -> StreamInfo:
+    """
+    Duration and bitrate from the Xing/Info or VBRI header of the first frame, a few KB of I/O.
+    Files without one have every frame header walked instead.
+    """
+    with open(path, "rb") as file:
+        probe = _Probe(file)
+        frame = probe.frame
+        source = probe.header
+        frames = probe.frames
+
+        if frames:
+            samples = frames * frame.samples
+            audio_bytes = probe.audio_bytes or (probe.end - probe.audio_start)
+        else:
+            source = "scan"
+            frames, samples, audio_bytes, _ = _scan_frames(file, probe.audio_start, probe.end)
+
+    duration = samples / frame.sample_rate
+    if source == "info":
+        bitrate = frame.bitrate
+    else:
+        bitrate = round(audio_bytes * 8 / duration) if duration else 0
+    return StreamInfo(duration, bitrate, frames, frame.sample_rate, frame.channels, source)
+
+
+class SourceInspection:
+    def __init__(self, needs_remux: bool, reason: str, audio_start: int = 0, audio_end: int = 0):
+        self.needs_remux = needs_remux
+        self.reason = reason
+        # the frames, without the ID3v2 tag before them or an ID3v1 tag after them
+        self.audio_start = audio_start
+        self.audio_end = audio_end
+
+
+def inspect_source(path: Path | str) -> SourceInspection:
+    """
+    Decides whether a source needs the ffmpeg remux, or is already what it would produce:
+    a Xing/Info header whose frame count matches the stream, frames following the ID3v2 tag
+    without junk, and one format from the first frame to the end of the file.
+    """
+    try:
+        with open(path, "rb") as file:
+            probe = _Probe(file)
+            if probe.junk:
+                return SourceInspection(True, f"{probe.junk} bytes of junk before the first frame")
+            if probe.header not in ("xing", "info"):
+                return SourceInspection(True, "no Xing/Info header")
+
+            frames, _, audio_bytes, uniform = _scan_frames(file, probe.audio_start, probe.end)
+    except (OSError, StreamInfoError) as e:
+        return SourceInspection(True, str(e))
+
+    if not uniform:
+        return SourceInspection(True, "the format changes along the stream")
+    if probe.audio_start + audio_bytes != probe.end:
+        return SourceInspection(True, f"{probe.end - probe.audio_start - audio_bytes} bytes after the last frame")
+    # the header frame doesn't count itself
+    if frames != probe.frames + 1:
+        return SourceInspection(True, f"the header announces {probe.frames} frames, the stream has {frames - 1}")
+    return SourceInspection(False, "clean", probe.audio_start, probe.end)
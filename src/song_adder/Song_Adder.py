@@ -1,43 +1,93 @@
+import atexit
 import io
 import json
 import logging
 import os
 import sys
+import threading
 import tkinter as tk
+from collections import deque
 from logging import Logger, LogRecord
 from pathlib import Path
-from tkinter import Tk, filedialog
-from typing import Any, Callable, cast
+from tkinter import Tk, filedialog, messagebox
+from types import TracebackType
+from typing import TYPE_CHECKING, Any, Callable, Iterable, cast
 
 from metadata_utils.CF_Program import (
     Song,
     get_song_data,
     process_new_tags,
-    set_tags,
 )
-from metadata_utils.data_verification import ValidationError, validate_payload
-from metadata_utils.engraver import build_payload, engrave_payload
-from metadata_utils.hash_mutagen import get_audio_hash
-from mutagen.id3 import APIC, ID3
-from PIL import Image, ImageTk, UnidentifiedImageError
-from PIL.ImageFile import ImageFile
+from metadata_utils.data_verification import validate_fields
+from metadata_utils.instrumentation import song_scope, span
 
-from .remuxer import remux_song
+from .transcoder import SOURCE_SUFFIXES, TRANSCODE_SUFFIXES, needs_transcode
+
+# PIL, the search index and the add pipeline are imported on first use to keep startup fast
+if TYPE_CHECKING:
+    from metadata_utils.search import IndexedSong, SongIndex
+    from mutagen.id3 import APIC, ID3
+    from PIL.Image import Image
+    from PIL.ImageFile import ImageFile
+
+    from .prefetch import Prefetcher
 
 logger = logging.getLogger(__name__)
 
+# entry field -> payload field
+ARG_MAP = {
+    "Date": "date",
+    "Title": "title",
+    "Artist": "artist",
+    "CoverArtist": "cover_artist",
+    "Version": "version",
+    "Discnumber": "disc_number",
+    "Track": "track",
+    "Comment": "comment",
+    "Special": "special",
+}
+
+
+def _preload_modules() -> None:
+    """Imports the modules deferred at startup in the background, so the first song opens without the wait."""
+    try:
+        import mutagen.mp3
+        import xxhash
+        from PIL import Image
+    except Exception:
+        logger.debug("Preloading modules failed, they'll be imported on first use", exc_info=True)
+
 
 class App():
+    # songs of the folder queue parsed ahead of the current one
+    PREFETCH_AHEAD = 4
+    # keystrokes closer together than this are previewed at once
+    PREVIEW_DEBOUNCE_MS = 150
+
     def __init__(self, script_dir: Path):
 
         sys.stderr = StreamToLogger(logger, logging.CRITICAL)
 
         self.main_window = tk.Tk()
+        self.main_window.report_callback_exception = self.report_callback_exception
         self.colors: dict[str, str] = self.load_colors(script_dir)
         self.song_path: (str | None) = None
         self.song_obj: (Song | None) = None
         self.new_song_data: dict[str, str] | None = None
         self.save_folder: (str | None) = None
+        self.song_index: (SongIndex | None) = None
+        self.search_window: (Search_Window | None) = None
+        self.queue_window: (Queue_Window | None) = None
+        self.queue_paths: list[str] = []
+        self.queue_position: int = -1
+        self.prefetcher: (Prefetcher | None) = None
+        # live preview state, only the fields edited since the last refresh are revalidated
+        self.preview_payload: dict[str, str] = {}
+        self.field_errors: dict[str, (str | None)] = {}
+        self._pending_fields: set[str] = set()
+        self._preview_job: (str | None) = None
+        # the song being added, remuxes and transcodes run off the Tk thread
+        self._adding: (threading.Thread | None) = None
 
     def main(self) -> None:
         self.build_ui()
@@ -45,7 +95,10 @@ class App():
         self.main_window.minsize(1100, 600)
         self.main_window.title("Song Adder")
         self.main_window.protocol("WM_DELETE_WINDOW", self.closing_protocol)
-        logger.info(f"{'-'*30} Program Start {'-'*30}")
+
+        # show the window first, the rest is built once it's on screen
+        self.main_window.update_idletasks()
+        self.main_window.after_idle(self.build_deferred_ui)
         self.main_window.mainloop()
 
     def build_ui(self) -> None:
@@ -55,7 +108,8 @@ class App():
             master=self.main_window,
             colors=self.colors,
             load_preview_callback=self.load_preview,
-            generate_callback=self.generate_file)
+            generate_callback=self.generate_file,
+            field_changed_callback=self.on_field_changed)
 
         self.preview_frame = Preview_Frame(master=self.main_window, colors=self.colors)
 
@@ -63,22 +117,29 @@ class App():
             master=self.main_window, 
             colors=self.colors,
             load_file_callback=self.load_file,
-            folder_callback=self.folder_selection_dialog)
+            folder_callback=self.folder_selection_dialog,
+            search_callback=self.open_search_window,
+            queue_callback=self.load_folder_queue)
 
         self.separator = tk.Frame(master=self.main_window, bg=self.colors['secondary text'])
 
         self.image_frame = Image_Frame(
             master=self.main_window, colors=self.colors)
 
-        self.info_frame = Info_Frame(master=self.main_window, colors=self.colors)
-
         self.options_frame.grid(row=0, column=0, columnspan=3, sticky = 'w')
         self.separator.grid(row=1, column=0, columnspan=3, sticky='we', pady=(0, 10))
         self.adder_frame.grid(row=2, column=0,rowspan=2, sticky='nw')
         self.image_frame.grid(row=2, column=1, sticky='nw')
         self.preview_frame.grid(row=2, column=2, sticky='n')
+
+    def build_deferred_ui(self) -> None:
+        self.info_frame = Info_Frame(master=self.main_window, colors=self.colors)
         self.info_frame.grid(row=3, column=1, columnspan=2, sticky='nw')
 
+        logger.info(f"{'-'*30} Program Start {'-'*30}")
+
+        threading.Thread(target=_preload_modules, daemon=True).start()
+
     def load_colors(self, script_dir: Path) -> dict[str, str]:
 
         DEFAULT_COLORS = {
@@ -128,107 +189,156 @@ class App():
             return True
 
     def load_file(self) -> None:
-        self.song_path = self.open_file_dialog()
-        song_data = audio_tags = self.new_song_data = None
+        self.load_song(self.open_file_dialog())
+
+    def load_song(self, song_path: (str | None)) -> None:
+        self.song_path = song_path
+        song_data = audio_tags = self.new_song_data = self.song_obj = None
+        self.preview_payload = {}
+        self.field_errors = {}
         self.options_frame.update_selected_file(self.song_path)
 
         if self.song_path:
-            _, song_data, audio_tags = get_song_data(self.song_path)
-            self.preview_frame.clear()
-
-            if audio_tags:
-                self.image_frame.load_image_binary(audio_tags)
-            else:
-                self.image_frame.clear_image()
+            # songs of the folder queue are usually already parsed by the prefetcher
+            prefetched = self.prefetcher.get(self.song_path) if self.prefetcher is not None else None
+
+            with song_scope(os.path.basename(self.song_path)), span("load_file", prefetched=prefetched is not None):
+                if prefetched is not None:
+                    song_data, audio_tags = prefetched.song_data, prefetched.audio_tags
+                elif needs_transcode(self.song_path):
+                    # no tags to read, the payload comes from a sidecar or the entries
+                    song_data = self._load_sidecar(self.song_path)
+                else:
+                    with span("get_song_data"):
+                        _, song_data, audio_tags = get_song_data(self.song_path)
+                self.preview_frame.clear()
+
+                with span("image_decode"):
+                    if prefetched is not None and prefetched.thumbnail is not None:
+                        self.image_frame.load_thumbnail(prefetched.thumbnail)
+                    elif audio_tags:
+                        self.image_frame.load_image_binary(audio_tags)
+                    else:
+                        self.image_frame.clear_image()
 
         if song_data is not None:
             self.adder_frame.update_entries(song_data)
 
+        # a song without payload is previewed with the entries as they are
+        self.schedule_preview(self.adder_frame.FIELD_NAMES)
+
+    @staticmethod
+    def _load_sidecar(song_path: str) -> (dict[str, str] | None):
+        from .pipeline import PipelineError, load_source_song_data
+
+        try:
+            song_data = load_source_song_data(song_path)
+        except PipelineError as e:
+            logger.info(f"{e}, fill in the payload")
+            return None
+        return {field: str(value) for field, value in song_data.items() if field in ARG_MAP}
+
     @staticmethod
     def _truncate_string(string: str, width: int) -> str:
         return ((string[:width-2] + '...') if len(string) > width else string)
 
     def load_tags_preview(self) -> None:
-        new_data = self.adder_frame.get_entries_dict()
-
         if not self.song_path:
             return
 
         self.song_obj = Song(self.song_path)
-        process_new_tags(self.song_obj, new_data)
-
-        broken_title = self.song_obj.filename.replace(" - ", "\n                                ")
+        process_new_tags(self.song_obj, {field: self.preview_payload[arg] for field, arg in ARG_MAP.items()})
+
+        broken_title = self.song_obj.filename.replace(" - ", "\n                        ")
+
+        self.preview_frame.update_tags({
+            "Filename": f"Filename: {broken_title if len(self.song_obj.filename) > 70 else self.song_obj.filename}",
+            "TIT2": f"[TIT2] {self.song_obj.title}",
+            "TPE1": f"[TPE1] {self.song_obj.artist}",
+            "COMM": f"[COMM::eng] {App._truncate_string(self.song_obj.comment, 50)}",
+            "TDRC": f"[TDRC] {self.song_obj.comment[:4]}",
+            "TPE2": "[TPE2] QueenPb + Vedal987",
+            "TRCK": f"[TRCK] {self.song_obj.track}",
+            "TALB": f"[TALB] {self.song_obj.album}",
+            "TPOS": f"[TPOS] {self.song_obj.album.replace('Disc ', '')}",
+        })
+
+    def on_field_changed(self, field: str) -> None:
+        self.schedule_preview((field,))
+
+    def schedule_preview(self, fields: Iterable[str]) -> None:
+        """Previews the fields once the typing pauses, edits until then are previewed together."""
+        self._pending_fields.update(fields)
+        if self._preview_job is not None:
+            self.main_window.after_cancel(self._preview_job)
+        self._preview_job = self.main_window.after(self.PREVIEW_DEBOUNCE_MS, self.refresh_preview)
+
+    def refresh_preview(self) -> None:
+        """
+        Revalidates the fields edited since the last refresh, and the checks depending on them,
+        then re-renders the preview lines that changed. The payload is only kept once all of it's
+        fields are valid.
+        """
+        if self._preview_job is not None:
+            self.main_window.after_cancel(self._preview_job)
+            self._preview_job = None
+        changed, self._pending_fields = self._pending_fields, set()
+
+        if not self.song_path or not changed:
+            return
 
-        preview_content = f"""\
-        Filename: {broken_title if len(self.song_obj.filename) > 70 else self.song_obj.filename}
-        [TIT2] {self.song_obj.title}
-        [TPE1] {self.song_obj.artist}
-        [COMM::eng] {App._truncate_string(self.song_obj.comment, 50)}
-        [TDRC] {self.song_obj.comment[:4]}
-        [TPE2] QueenPb + Vedal987
-        [TRCK] {self.song_obj.track}
-        [TALB] {self.song_obj.album}
-        [TPOS] {self.song_obj.album.replace("Disc ", "")}"""
+        with span("live_preview", fields=len(changed)):
+            for field in changed:
+                self.preview_payload[ARG_MAP[field]] = self.adder_frame.entries[field].get()
+            self.preview_payload["filename"] = os.path.basename(self.song_path)
 
-        self.preview_frame.update_tags_label(preview_content)
+            errors = validate_fields(self.preview_payload, (ARG_MAP[field] for field in changed))
+            self.field_errors.update(errors)
+            for field, arg in ARG_MAP.items():
+                if arg in errors:
+                    self.adder_frame.show_error(field, errors[arg])
 
-        logger.debug(f"Tags Preview Loaded:\n\n{preview_content}")
-        
-    def load_preview(self) -> None:
+            self.preview_frame.update_new_payload(self.preview_payload, self.field_errors)
 
-        ARG_MAP = {
-            "Date": "date",
-            "Title": "title",
-            "Artist": "artist",
-            "CoverArtist": "cover_artist",
-            "Version": "version",
-            "Discnumber": "disc_number",
-            "Track": "track",
-            "Comment": "comment",
-            "Special": "special",
-        }
+            if any(self.field_errors.values()):
+                self.song_obj = self.new_song_data = None
+                self.preview_frame.update_tags(None)
+            else:
+                self.new_song_data = dict(self.preview_payload)
+                self.load_tags_preview()
 
+    def load_preview(self) -> None:
         if not self.song_path:
             logger.warning("No path selected!")
             return
 
-        self.song_obj = self.new_song_data = None
+        # a full refresh, in case the entries were changed without the traces firing
+        self._pending_fields.update(self.adder_frame.FIELD_NAMES)
+        self.refresh_preview()
 
-        payload_kwargs = {
-        ARG_MAP[field]: self.adder_frame.entries[field].get() for field in self.adder_frame.FIELD_NAMES
-        }
-    
-        payload_kwargs["filename"] = os.path.basename(self.song_path)
-
-        try:
-            validate_payload(payload_kwargs)
-
-        except ValidationError as e:
-            logger.warning(e)
-
-        except Exception:
-            logger.debug(payload_kwargs)
-            logger.exception
-
-        else:
-            self.preview_frame.update_new_payload(payload_kwargs)
-            self.new_song_data = payload_kwargs
-            self.load_tags_preview()
+        for field, arg in ARG_MAP.items():
+            if self.field_errors.get(arg):
+                logger.warning(f"{field}: {self.field_errors[arg]}")
 
     def generate_file(self) -> None:
+        if self._adding is not None:
+            logger.warning("A song is still being added, please wait for it to finish!")
+            return
+
+        if self._preview_job is not None:
+            # the last keystrokes weren't previewed yet
+            self.refresh_preview()
 
-        if (self.song_obj is None or self.new_song_data is None):
+        if any(self.field_errors.values()):
+            logger.warning("Please fix the fields marked in red first!")
+            return
+        elif (self.song_obj is None or self.new_song_data is None):
             logger.warning("Either no song selected or no preview!")
             return
         elif not self.save_folder:
             logger.warning("Please select a save folder!")
             return
 
-        new_path = os.path.join(self.save_folder, self.song_obj.filename)
-
-        remux_song(file_path=str(self.song_obj.path), new_path=new_path)
-        logger.debug(f"Remuxed song created at {new_path}")
-
         image_data = self.image_frame.read_image_data()
         image_type = None
 
@@ -240,22 +350,91 @@ class App():
             if image_type == "jpg":
                 image_type = "jpeg" 
 
-        set_tags(new_path, self.song_obj, image_type, image_data)
-        logger.debug("ID3v2 tags added")
+        from .pipeline import PipelineError, add_song
+        from .remuxer import RemuxError
 
-        temp_hash = get_audio_hash(new_path)
-        if temp_hash is None:
-            logger.critical("The program was unable to generate a hash!")
+        proceed, replaced = self.plan_filename()
+        if not proceed:
             return
-        else:
-            self.new_song_data["xxhash"] = temp_hash
 
-        new_payload = build_payload(**self.new_song_data)
-        engrave_payload(new_path, new_payload)
+        from .transcoder import TranscodeError
 
-        logger.debug("Json payload added")
+        # another song may be loaded while this one is written
+        song, song_data, save_folder = self.song_obj, self.new_song_data, self.save_folder
+        # written by the worker, read by the Tk thread on it's timer
+        state: dict[str, Any] = {"progress": None, "added": False}
 
-        logger.info(f"Finished processing of {self.song_obj.filename}!")
+        def progress(fraction: float) -> None:
+            state["progress"] = fraction
+
+        def worker() -> None:
+            try:
+                add_song(song, song_data, save_folder, image_type, image_data, progress)
+                state["added"] = True
+            except (RemuxError, TranscodeError, PipelineError) as e:
+                logger.error(e)
+            except Exception:
+                logger.exception("Failed generating the file, the save folder was left untouched")
+
+        # not a daemon, closing the window waits for the song to be written
+        self._adding = threading.Thread(target=worker)
+        self._adding.start()
+
+        def poll() -> None:
+            assert self._adding is not None
+            if self._adding.is_alive():
+                if state["progress"] is not None:
+                    self.main_window.title(f"Song Adder - transcoding {state['progress']:.0%}")
+                self.main_window.after(100, poll)
+                return
+
+            self._adding = None
+            self.main_window.title("Song Adder")
+            if state["added"]:
+                self._finish_generate(song, save_folder, replaced)
+
+        self.main_window.after(100, poll)
+
+    def _finish_generate(self, song: Song, save_folder: str, replaced: (str | None)) -> None:
+        from .pipeline import remove_case_variant
+
+        remove_case_variant(save_folder, replaced, song.filename)
+        logger.info(f"Finished processing of {song.filename}!")
+
+    def plan_filename(self) -> tuple[bool, (str | None)]:
+        """
+        Checks the target name before anything is written, numbering it if the user would rather
+        keep the archive file. Returns whether to go on and the name of the archive file replaced.
+        """
+        assert self.song_obj is not None and self.save_folder is not None
+        from metadata_utils.filename_planner import FilenameConflictError, FilenamePlanner
+
+        planner = FilenamePlanner(self.save_folder)
+        error = planner.length_error(self.song_obj.filename)
+        if error:
+            logger.error(error)
+            return False, None
+
+        existing = planner.existing_name(self.song_obj.filename)
+        if existing is None:
+            return True, None
+
+        overwrite = messagebox.askyesnocancel(
+            "Song already in the archive",
+            f"{existing} is already in the save folder.\n\n"
+            "Yes replaces it, No saves the new song with a number after it's name."
+        )
+        if overwrite is None:
+            return False, None
+        if overwrite:
+            return True, existing
+
+        try:
+            self.song_obj.filename = planner.reserve(str(self.song_obj.path), self.song_obj.filename)
+        except FilenameConflictError as e:
+            logger.error(e)
+            return False, None
+        return True, None
 
     def open_file_dialog(self) -> str | None:
         """Opens a file selection dialog and returns the selected file path."""
@@ -264,7 +443,9 @@ class App():
             title="Choose a file",
             initialdir= os.path.dirname(self.song_path) if self.song_path else "/",
             filetypes=(
+                ("Audio files", " ".join(f"*{suffix}" for suffix in SOURCE_SUFFIXES)),
                 ("MP3 files", "*.MP3"),
+                ("Transcoded to MP3", " ".join(f"*{suffix}" for suffix in TRANSCODE_SUFFIXES)),
                 ("All files", "*.*")
             )
         )
@@ -288,15 +469,132 @@ class App():
 
         self.options_frame.update_selected_folder(folder_path)
 
+        # the index belongs to the previous folder
+        self.song_index = None
+
+    def load_folder_queue(self) -> None:
+        folder_path = filedialog.askdirectory(
+            title="Select a Folder to work through",
+            initialdir=os.path.dirname(self.song_path) if self.song_path else "/"
+        )
+        if not folder_path:
+            logger.debug("No folder path selected")
+            return
+
+        try:
+            with os.scandir(folder_path) as entries:
+                paths = [entry.path for entry in entries if entry.is_file() and entry.name.lower().endswith(SOURCE_SUFFIXES)]
+        except OSError as e:
+            logger.error(f"Failed listing {folder_path}")
+            logger.debug(e)
+            return
+
+        paths.sort(key=lambda path: os.path.basename(path).casefold())
+        logger.info(f"{len(paths)} songs queued from {folder_path}")
+
+        if self.prefetcher is None:
+            from .prefetch import Prefetcher
+            self.prefetcher = Prefetcher(capacity=self.PREFETCH_AHEAD * 2)
+
+        self.queue_paths = paths
+        self.queue_position = -1
+
+        if self.queue_window is not None and self.queue_window.winfo_exists():
+            self.queue_window.lift()
+        else:
+            self.queue_window = Queue_Window(
+                master=self.main_window,
+                colors=self.colors,
+                select_callback=self.load_queue_position)
+        self.queue_window.set_songs(paths)
+
+        if paths:
+            self.load_queue_position(0)
+
+    def load_queue_position(self, position: int) -> None:
+        if not 0 <= position < len(self.queue_paths):
+            return
+
+        self.queue_position = position
+        self.load_song(self.queue_paths[position])
+
+        if self.queue_window is not None and self.queue_window.winfo_exists():
+            self.queue_window.show_position(position)
+
+        if self.prefetcher is not None:
+            # songs that are transcoded have no tags to parse ahead
+            upcoming = self.queue_paths[position + 1:position + 1 + self.PREFETCH_AHEAD]
+            self.prefetcher.prefetch([path for path in upcoming if not needs_transcode(path)])
+
+    def open_search_window(self) -> None:
+        if not self.save_folder:
+            logger.warning("Please select a save folder to search the archive!")
+            return
+
+        if self.search_window is not None and self.search_window.winfo_exists():
+            self.search_window.lift()
+        else:
+            self.search_window = Search_Window(
+                master=self.main_window,
+                colors=self.colors,
+                select_callback=self.load_song)
+
+        if self.song_index is None:
+            self._start_indexing(self.save_folder)
+        else:
+            self.search_window.set_index(self.song_index)
+
+    def _start_indexing(self, folder: str) -> None:
+        result: dict[str, SongIndex] = {}
+
+        def worker() -> None:
+            from metadata_utils.catalogue import default_cache_path
+            from metadata_utils.search import build_index
+
+            try:
+                result["index"] = build_index(folder, cache_path=default_cache_path(folder))
+            except Exception:
+                logger.exception("Failed indexing the archive!")
+
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        logger.info(f"Indexing {folder}...")
+
+        def poll() -> None:
+            if thread.is_alive():
+                self.main_window.after(100, poll)
+                return
+            if "index" not in result or folder != self.save_folder:
+                return
+            self.song_index = result["index"]
+            logger.info(f"{len(self.song_index)} songs indexed")
+            if self.search_window is not None and self.search_window.winfo_exists():
+                self.search_window.set_index(self.song_index)
+
+        self.main_window.after(100, poll)
+
+    def report_callback_exception(self, exc_type: type[BaseException], exc_value: BaseException,
+                                  exc_traceback: (TracebackType | None)) -> None:
+        # one record per traceback instead of one per stderr line
+        logger.critical("Exception in Tkinter callback", exc_info=(exc_type, exc_value, exc_traceback))
+
     def closing_protocol(self) -> None:
+        if self.prefetcher is not None:
+            self.prefetcher.stop()
+        if isinstance(sys.stderr, StreamToLogger):
+            sys.stderr.flush()
         logger.debug("Closing program without issues")
         self.main_window.destroy()
 
 class Adder_Frame(tk.Frame):
+    # used when the theme has no "error" color
+    ERROR_COLOR = "#E0555C"
+
     def __init__(self, 
                 master: Tk, colors: dict[str, str], 
                 load_preview_callback: Callable[[], None],
                 generate_callback: Callable[[], None], 
+                field_changed_callback: Callable[[str], None],
                 **kwargs: Any
                 ):
         super().__init__(master ,width=350, height=520, padx=10, pady=10, bg=colors['primary'], **kwargs)
@@ -305,6 +603,11 @@ class Adder_Frame(tk.Frame):
         self.columnconfigure(0, weight=1)
 
         self.entries : dict[str, tk.Entry] = {}
+        self.labels: dict[str, tk.Label] = {}
+        self.variables: dict[str, tk.StringVar] = {}
+        self.text_color = colors['text']
+        self.error_color = colors.get('error', self.ERROR_COLOR)
+        self.field_changed_callback = field_changed_callback
 
         self.FIELD_NAMES = [
             "Date", "Title", "Artist", "CoverArtist", 
@@ -348,15 +651,24 @@ class Adder_Frame(tk.Frame):
                 )
             label.grid(row=i, column=0, sticky="w", padx=(15, 0), pady=1)
             i += 1
+            variable = tk.StringVar(master=self)
             entry = tk.Entry(
                 master=self,
                 width=50,
+                textvariable=variable,
                 fg=colors["secondary text"],
-                bg=colors["secondary"]
+                bg=colors["secondary"],
+                highlightthickness=1,
+                highlightbackground=colors["primary"],
+                highlightcolor=colors["primary"]
                 )
             entry.grid(row=i, column=0, sticky="w", padx=8, pady=1)
-            
+            # every edit, typed or loaded, goes to the live preview
+            variable.trace_add("write", lambda *_, name=name: self.field_changed_callback(name))
+
             self.entries[name] = entry
+            self.labels[name] = label
+            self.variables[name] = variable
 
             i += 1
 
@@ -367,15 +679,24 @@ class Adder_Frame(tk.Frame):
         for field in song_data:
             if field == "xxHash":
                 continue
-            self.entries[field].delete("0", tk.END)
-            self.entries[field].insert("0", song_data[field])
+            self.variables[field].set(song_data[field])
+
+    def show_error(self, field: str, error: (str | None)) -> None:
+        """Marks a field and shows it's error next to it's name, or clears the marker."""
+        text = f"{field}:  \u2716 {error}" if error else f"{field}:"
+        if self.labels[field]['text'] == text:
+            return
+        color = self.error_color if error else self.text_color
+        self.labels[field].configure(text=text, fg=color)
+        self.entries[field].configure(highlightbackground=color if error else self['bg'],
+                                      highlightcolor=color if error else self['bg'])
 
 class Options_Frame(tk.Frame):
 
     def __init__(
         self, master: Tk, colors: dict[str, str], 
         load_file_callback: Callable[[], None], folder_callback: Callable[[], None], 
-        **kwargs: Any
+        search_callback: Callable[[], None], queue_callback: Callable[[], None], **kwargs: Any
         ):
         super().__init__(master, padx=20, pady=10, bg=colors["primary"], **kwargs)
 
@@ -397,6 +718,24 @@ class Options_Frame(tk.Frame):
             )
         Save_folder_button.grid(row=0, column=1)
 
+        search_button = tk.Button(
+            master=self,
+            text="Search Archive",
+            command=search_callback,
+            fg=colors["secondary text"],
+            bg=colors["secondary"]
+            )
+        search_button.grid(row=1, column=0, sticky="we")
+
+        queue_button = tk.Button(
+            master=self,
+            text="Load Folder",
+            command=queue_callback,
+            fg=colors["secondary text"],
+            bg=colors["secondary"]
+            )
+        queue_button.grid(row=1, column=1, sticky="we")
+
         self.selected_file_label = tk.Label(
             master=self,
             text="Selected File: ",
@@ -439,51 +778,55 @@ class Options_Frame(tk.Frame):
         return string
 
 class Preview_Frame(tk.Frame):
+    TAG_LINES = ("Filename", "TIT2", "TPE1", "COMM", "TDRC", "TPE2", "TRCK", "TALB", "TPOS")
+
     def __init__(self, master: Tk, colors: dict[str, str], **kwargs: Any):
-        super().__init__(master, width=500, height=375, padx=5, pady=5, bg=colors['primary'], **kwargs)
+        super().__init__(master, width=500, height=420, padx=5, pady=5, bg=colors['primary'], **kwargs)
         
         self.grid_propagate(False)
         self.columnconfigure(0, weight=1)
 
-        self.new_payload_label = tk.Label(
-            self,
-            text="New Payload:\n",
-            justify="left",
-            bg=colors['primary'],
-            fg=colors['text'])
-
-        self.new_payload_label.grid(row=0, column=0, sticky='nw')
-
-        self.new_tags_label = tk.Label(self,
-        text="New Tags Preview:\n",
-        justify="left",
-        bg=colors['primary'],
-        fg=colors['text'])
-        self.new_tags_label.grid(row=1, column=0, sticky='nw')
-
-    def update_new_payload(self, new_payload_data: dict[str, str]) -> None:
-
-        self.new_payload_label['text'] = f"""\
-New Payload:\n
-        Date: {new_payload_data["date"]}        
-        Title: {new_payload_data["title"]}
-        Artist: {new_payload_data["artist"]}
-        CoverArtist: {new_payload_data["cover_artist"]}
-        Version: {new_payload_data["version"]}
-        Discnumber: {new_payload_data["disc_number"]}
-        Track: {new_payload_data["track"]}
-        Comment: {new_payload_data["comment"]}
-        Special: {new_payload_data["special"]}
-"""
-
-        logger.debug(f"Payload Preview Loaded: {self.new_payload_label['text']}")
-    
-    def update_tags_label(self, tags_text: str) -> None:
-        self.new_tags_label['text'] = f"New Tags Preview:\n{tags_text}"
+        self.text_color = colors['text']
+        self.error_color = colors.get('error', Adder_Frame.ERROR_COLOR)
+        # one label per line, so an edit only re-renders the lines it changes
+        self.lines: dict[str, tk.Label] = {}
+        self._rendered: dict[str, tuple[str, bool]] = {}
+
+        row = 0
+        for header, keys in (("New Payload:", ARG_MAP), ("New Tags Preview:", self.TAG_LINES)):
+            tk.Label(self, text=header, justify="left", bg=colors['primary'], fg=colors['text']).grid(
+                row=row, column=0, sticky='nw', pady=(0 if row == 0 else 8, 2))
+            row += 1
+            for key in keys:
+                self.lines[key] = tk.Label(self, text="", justify="left", pady=0, bg=colors['primary'], fg=colors['text'])
+                self.lines[key].grid(row=row, column=0, sticky='nw', padx=(30, 0))
+                row += 1
+
+    def _render(self, key: str, text: str, error: bool = False) -> bool:
+        if self._rendered.get(key) == (text, error):
+            return False
+        self._rendered[key] = (text, error)
+        self.lines[key].configure(text=text, fg=self.error_color if error else self.text_color)
+        return True
+
+    def update_new_payload(self, new_payload_data: dict[str, str], errors: (dict[str, (str | None)] | None) = None) -> None:
+        errors = errors or {}
+        changed = [
+            field for field, arg in ARG_MAP.items()
+            if self._render(field, f"{field}: {new_payload_data.get(arg, '')}", bool(errors.get(arg)))
+        ]
+        if changed:
+            logger.debug(f"Payload Preview Updated: {', '.join(changed)}")
+
+    def update_tags(self, tag_lines: (dict[str, str] | None)) -> None:
+        """Renders the new tags, None while the payload is invalid."""
+        changed = [key for key in self.TAG_LINES if self._render(key, tag_lines[key] if tag_lines else "")]
+        if changed and tag_lines:
+            logger.debug(f"Tags Preview Updated: {', '.join(tag_lines[key] for key in changed)}")
 
     def clear(self) -> None:
-        self.new_payload_label['text'] = "New Payload:\n"
-        self.new_tags_label['text'] = "New Tags Preview:\n"
+        for key in self.lines:
+            self._render(key, "")
 
 class Image_Frame(tk.Frame):
     def __init__(self, master: Tk, colors: dict[str, str], **kwargs: Any):
@@ -505,9 +848,11 @@ class Image_Frame(tk.Frame):
         self.image_label.pack(anchor="nw",fill="both", expand=True)
         self.image_label.bind("<Button-1>", self.on_image_click)
 
-    def load_image_binary(self, audio_tags: ID3) -> None:
+    def load_image_binary(self, audio_tags: "ID3") -> None:
+        from PIL import Image
+
         try:
-            apic_frames = cast(list[APIC], audio_tags.getall("APIC"))
+            apic_frames = cast("list[APIC]", audio_tags.getall("APIC"))
 
             if not apic_frames:
                 logger.debug("No image found")
@@ -525,13 +870,24 @@ class Image_Frame(tk.Frame):
         else:
             self._load_image(img_open)
 
-    def _load_image(self, img: ImageFile) -> None:
+    def _load_image(self, img: "ImageFile") -> None:
+        from PIL import ImageTk
+
         resized_img = img.resize((300, 300))
         tk_img = ImageTk.PhotoImage(resized_img)
 
         self.image_label.config(image=tk_img)
         setattr(self.image_label, "image", tk_img)
 
+    def load_thumbnail(self, img: "Image") -> None:
+        """Shows a cover already resized by the prefetcher, only the PhotoImage is made here."""
+        from PIL import ImageTk
+
+        tk_img = ImageTk.PhotoImage(img)
+
+        self.image_label.config(image=tk_img)
+        setattr(self.image_label, "image", tk_img)
+
     def _cover_selection_dialog(self) -> (str | None):
         """Opens a file selection dialog and returns the selected file path."""
 
@@ -555,6 +911,8 @@ class Image_Frame(tk.Frame):
         if not img_path:
             return
 
+        from PIL import Image, UnidentifiedImageError
+
         try:
             img_open = Image.open(img_path)
 
@@ -581,9 +939,169 @@ class Image_Frame(tk.Frame):
         self.image_label.config(image=self.placeholder)
         setattr(self.image_label, "image", self.placeholder)
 
+class Search_Window(tk.Toplevel):
+    MAX_RESULTS = 200
+
+    def __init__(self, master: Tk, colors: dict[str, str],
+                 select_callback: Callable[[str], None], **kwargs: Any):
+        super().__init__(master, padx=10, pady=10, bg=colors["primary"], **kwargs)
+
+        self.title("Search Archive")
+        self.index: (SongIndex | None) = None
+        self.results: list[IndexedSong] = []
+        self.select_callback = select_callback
+
+        self.query_entry = tk.Entry(
+            master=self,
+            width=80,
+            fg=colors["secondary text"],
+            bg=colors["secondary"]
+            )
+        self.query_entry.grid(row=0, column=0, sticky="we")
+        self.query_entry.bind("<KeyRelease>", lambda event: self.update_results())
+
+        self.status_label = tk.Label(
+            master=self,
+            text="Indexing...",
+            fg=colors["text"],
+            bg=colors["primary"]
+        )
+        self.status_label.grid(row=1, column=0, sticky="w")
+
+        self.results_list = tk.Listbox(
+            master=self,
+            width=110,
+            height=20,
+            fg=colors["secondary text"],
+            bg=colors["secondary"]
+        )
+        self.results_list.grid(row=2, column=0, sticky="nsew")
+        self.results_list.bind("<<ListboxSelect>>", self.on_select)
+
+        self.scrollbar = tk.Scrollbar(self, command=self.results_list.yview) # type: ignore
+        self.scrollbar.grid(row=2, column=1, sticky="ns")
+        self.results_list['yscrollcommand'] = self.scrollbar.set
+
+        self.query_entry.focus_set()
+
+    def set_index(self, index: "SongIndex") -> None:
+        self.index = index
+        self.update_results()
+
+    def update_results(self) -> None:
+        if self.index is None:
+            return
+
+        self.results = self.index.search(text=self.query_entry.get(), limit=self.MAX_RESULTS)
+
+        self.results_list.delete(0, tk.END)
+        for song in self.results:
+            data = song.song_data
+            self.results_list.insert(
+                tk.END,
+                f"{data.get('Date', '')}  {data.get('CoverArtist', '')} - {data.get('Artist', '')} - {data.get('Title', '')} (v{data.get('Version', '')})"
+            )
+
+        self.status_label['text'] = f"{len(self.results)} results shown out of {len(self.index)} songs"
+
+    def on_select(self, event: Any) -> None:
+        selection = self.results_list.curselection()
+        if not selection:
+            return
+        song = self.results[selection[0]]
+        logger.debug(f"Search result selected: {song.path}")
+        self.select_callback(song.path)
+
+class Queue_Window(tk.Toplevel):
+    def __init__(self, master: Tk, colors: dict[str, str],
+                 select_callback: Callable[[int], None], **kwargs: Any):
+        super().__init__(master, padx=10, pady=10, bg=colors["primary"], **kwargs)
+
+        self.title("Folder Queue")
+        self.select_callback = select_callback
+        self.position = -1
+
+        self.status_label = tk.Label(
+            master=self,
+            text="",
+            fg=colors["text"],
+            bg=colors["primary"]
+        )
+        self.status_label.grid(row=0, column=0, columnspan=2, sticky="w")
+
+        previous_button = tk.Button(
+            master=self,
+            text="Previous",
+            command=lambda: self.select_callback(self.position - 1),
+            fg=colors["secondary text"],
+            bg=colors["secondary"]
+            )
+        previous_button.grid(row=1, column=0, sticky="we")
+
+        next_button = tk.Button(
+            master=self,
+            text="Next",
+            command=lambda: self.select_callback(self.position + 1),
+            fg=colors["secondary text"],
+            bg=colors["secondary"]
+            )
+        next_button.grid(row=1, column=1, sticky="we")
+
+        self.songs_list = tk.Listbox(
+            master=self,
+            width=80,
+            height=25,
+            exportselection=False,
+            fg=colors["secondary text"],
+            bg=colors["secondary"]
+        )
+        self.songs_list.grid(row=2, column=0, columnspan=2, sticky="nsew")
+        self.songs_list.bind("<<ListboxSelect>>", self.on_select)
+
+        self.scrollbar = tk.Scrollbar(self, command=self.songs_list.yview) # type: ignore
+        self.scrollbar.grid(row=2, column=2, sticky="ns")
+        self.songs_list['yscrollcommand'] = self.scrollbar.set
+
+    def set_songs(self, paths: list[str]) -> None:
+        self.position = -1
+        self.songs_list.delete(0, tk.END)
+        for path in paths:
+            self.songs_list.insert(tk.END, os.path.basename(path))
+        self.status_label['text'] = f"{len(paths)} songs"
+
+    def show_position(self, position: int) -> None:
+        self.position = position
+        self.songs_list.selection_clear(0, tk.END)
+        self.songs_list.selection_set(position)
+        self.songs_list.see(position)
+        self.status_label['text'] = f"Song {position + 1} of {self.songs_list.size()}"
+
+    def on_select(self, event: Any) -> None:
+        selection = self.songs_list.curselection()
+        if not selection or selection[0] == self.position:
+            return
+        self.select_callback(selection[0])
+
 class Info_Frame(tk.Frame):
+    # records kept for filtering and copying, older ones are dropped
+    MAX_RECORDS = 5000
+    # the widget is trimmed by TRIM_CHUNK lines at once when it grows past MAX_LINES
+    MAX_LINES = 1000
+    TRIM_CHUNK = 250
+    COPIED_ERRORS = 20
+    FLUSH_INTERVAL_MS = 100
+
+    LEVELS = {"INFO": logging.INFO, "WARNING": logging.WARNING, "ERROR": logging.ERROR}
+
     def __init__(self, master: Tk, colors: dict[str, str], **kwargs: Any):
-        super().__init__(master, width=820, height=100, **kwargs)
+        super().__init__(master, width=820, height=100, bg=colors["primary"], **kwargs)
+
+        # (level, GUI text, raw text of errors for the clipboard)
+        self.records: deque[tuple[int, str, (str | None)]] = deque(maxlen=self.MAX_RECORDS)
+        self.min_level = logging.INFO
+        self._last_match = "end"
+
+        self._build_toolbar(colors)
 
         self.info_label = tk.Text(
             self,
@@ -594,21 +1112,147 @@ class Info_Frame(tk.Frame):
             fg=colors["secondary text"],
             bg=colors["secondary"])
 
-        self.info_label.grid(row=0, column=0, sticky='nw')
+        self.info_label.grid(row=1, column=0, sticky='nw')
+        self.info_label.tag_configure("match", background=colors["primary"], foreground=colors["text"])
 
         # --- Setup Scrollbar ---
         self.scrollbar = tk.Scrollbar(self, command=self.info_label.yview, bg=colors["secondary"]) # type: ignore
-        self.scrollbar.grid(row=0, column=1, sticky='ns')
+        self.scrollbar.grid(row=1, column=1, sticky='ns')
 
         # --- Link them together ---
         self.info_label['yscrollcommand'] = self.scrollbar.set
 
-        self.gui_handler = logging.StreamHandler(Redirector(self.info_label))
+        self.gui_handler = GuiLogHandler()
         self.gui_handler.setFormatter(GuiFormatter())
         self.gui_handler.setLevel(logging.INFO)
 
         logger.addHandler(self.gui_handler)
 
+        self.after(self.FLUSH_INTERVAL_MS, self.flush_log)
+
+    def _build_toolbar(self, colors: dict[str, str]) -> None:
+        toolbar = tk.Frame(self, bg=colors["primary"])
+        toolbar.grid(row=0, column=0, columnspan=2, sticky='we')
+
+        self.level_var = tk.StringVar(value="INFO")
+        level_menu = tk.OptionMenu(toolbar, self.level_var, *self.LEVELS, command=lambda _: self.on_level_change())
+        level_menu.configure(fg=colors["secondary text"], bg=colors["secondary"], highlightthickness=0)
+        level_menu.grid(row=0, column=0)
+
+        self.search_entry = tk.Entry(toolbar, width=30, fg=colors["secondary text"], bg=colors["secondary"])
+        self.search_entry.grid(row=0, column=1, padx=(10, 0))
+        self.search_entry.bind("<Return>", lambda event: self.find_next())
+
+        find_button = tk.Button(
+            toolbar, text="Find", command=self.find_next,
+            fg=colors["secondary text"], bg=colors["secondary"])
+        find_button.grid(row=0, column=2)
+
+        copy_button = tk.Button(
+            toolbar, text=f"Copy last {self.COPIED_ERRORS} errors", command=self.copy_last_errors,
+            fg=colors["secondary text"], bg=colors["secondary"])
+        copy_button.grid(row=0, column=3, padx=(10, 0))
+
+    def flush_log(self) -> None:
+        """Writes every record received since the last flush in a single widget update."""
+        new_records = self.gui_handler.drain()
+        if new_records:
+            self.records.extend(new_records)
+            self._append_lines([text for levelno, text, _ in new_records if levelno >= self.min_level])
+
+        self.after(self.FLUSH_INTERVAL_MS, self.flush_log)
+
+    def _append_lines(self, lines: list[str]) -> None:
+        if not lines:
+            return
+
+        self.info_label.configure(state='normal')
+        self.info_label.insert("end", "\n".join(lines) + "\n")
+
+        line_count = int(self.info_label.index("end-1c").split(".")[0])
+        if line_count > self.MAX_LINES:
+            # trimming in chunks keeps deletes rare, the widget never re-renders the history
+            excess = line_count - self.MAX_LINES + self.TRIM_CHUNK
+            self.info_label.delete("1.0", f"{excess + 1}.0")
+            self._last_match = "end"
+
+        self.info_label.see("end")
+        self.info_label.configure(state='disabled')
+
+    def on_level_change(self) -> None:
+        self.min_level = self.LEVELS[self.level_var.get()]
+
+        # only the tail that fits in the widget is rendered again
+        visible: list[str] = []
+        line_count = 0
+        for levelno, text, _ in reversed(self.records):
+            if levelno < self.min_level:
+                continue
+            visible.append(text)
+            line_count += text.count("\n") + 1
+            if line_count >= self.MAX_LINES:
+                break
+        visible.reverse()
+
+        self.info_label.configure(state='normal')
+        self.info_label.delete("1.0", "end")
+        self.info_label.configure(state='disabled')
+        self._last_match = "end"
+        self._append_lines(visible)
+
+    def find_next(self) -> None:
+        """Highlights the previous occurrence of the search text, wrapping around from the end."""
+        pattern = self.search_entry.get()
+        self.info_label.tag_remove("match", "1.0", "end")
+        if not pattern:
+            return
+
+        position = self.info_label.search(pattern, self._last_match, backwards=True, nocase=True)
+        if not position:
+            self._last_match = "end"
+            return
+
+        end = f"{position}+{len(pattern)}c"
+        self.info_label.tag_add("match", position, end)
+        self.info_label.see(position)
+        self._last_match = position
+
+    def copy_last_errors(self) -> None:
+        # the raw messages and tracebacks, the GUI text hides internal errors
+        errors = [raw for levelno, _, raw in self.records if raw is not None][-self.COPIED_ERRORS:]
+        self.clipboard_clear()
+        self.clipboard_append("\n".join(errors))
+        logger.info(f"Copied {len(errors)} errors to the clipboard")
+
+    def destroy(self) -> None:
+        logger.removeHandler(self.gui_handler)
+        super().destroy()
+
+class GuiLogHandler(logging.Handler):
+    """
+    Collects formatted records from any thread, the Info_Frame drains them on a Tk timer
+    since Tk widgets must only be touched from the main thread.
+    Errors also keep their raw message and traceback, for copying them into bug reports.
+    """
+    raw_formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def __init__(self, max_pending: int = 10_000):
+        super().__init__()
+        self.pending: deque[tuple[int, str, (str | None)]] = deque(maxlen=max_pending)
+
+    def emit(self, record: LogRecord) -> None:
+        try:
+            raw = self.raw_formatter.format(record) if record.levelno >= logging.ERROR else None
+            self.pending.append((record.levelno, self.format(record), raw))
+        except Exception:
+            self.handleError(record)
+
+    def drain(self) -> list[tuple[int, str, (str | None)]]:
+        records: list[tuple[int, str, (str | None)]] = []
+        while self.pending:
+            records.append(self.pending.popleft())
+        return records
+
 class GuiFormatter(logging.Formatter):
     def format(self, record: LogRecord):
         # 1. Handle your stderr redirection (CRITICAL level)
@@ -623,38 +1267,41 @@ class GuiFormatter(logging.Formatter):
         # This keeps the "LEVEL: message" format for important alerts
         return f"{record.levelname}: {record.getMessage()}"
 
-class Redirector:
-    def __init__(self, widget: tk.Text):
-        self.widget = widget
-
-    def write(self, string: str):
-        # 1. Enable editing so we can write to it
-        self.widget.configure(state='normal')
-        
-        # 2. Insert the text
-        self.widget.insert("end", string)
-        
-        # 3. Auto-scroll to the bottom
-        self.widget.see("end")
-        
-        # 4. Disable editing again so the user cannot type/delete
-        self.widget.configure(state='disabled')
-
-    def flush(self):
-        pass
-
 class StreamToLogger:
     """
     Fake file-like stream object that redirects writes to a logger instance.
+    Writes are buffered and logged as a single record once the stream stays quiet
+    for a moment, so a traceback printed line by line ends up in one record.
+    The buffer is also flushed at exit, the timer is a daemon and would lose a
+    traceback printed right before the interpreter stops.
     """
+    COALESCE_SECONDS = 0.05
+
     def __init__(self, logger: Logger, log_level: Any):
         self.logger = logger
         self.log_level = log_level
+        self._buffer: list[str] = []
+        self._lock = threading.Lock()
+        self._timer: (threading.Timer | None) = None
+        # registered after logging's own shutdown hook, so it runs while the handlers are open
+        atexit.register(self.flush)
 
     def write(self, buf: Any):
-        for line in buf.rstrip().splitlines():
-            self.logger.log(self.log_level, line.rstrip())
+        with self._lock:
+            self._buffer.append(str(buf))
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.COALESCE_SECONDS, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
 
     def flush(self):
-        pass
-
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            text = "".join(self._buffer).rstrip()
+            self._buffer.clear()
+
+        if text:
+            self.logger.log(self.log_level, text)
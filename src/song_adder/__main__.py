@@ -1,9 +1,12 @@
+import atexit
 import logging
+import os
+import queue
 import sys
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
 
-from song_adder.Song_Adder import App
+from metadata_utils.instrumentation import Recorder, enable_instrumentation
 
 
 def setup_logger(script_dir: Path):
@@ -22,17 +25,70 @@ def setup_logger(script_dir: Path):
     file_handler.setLevel(logging.DEBUG)
     file_handler.setFormatter(formatter)
 
-    logger.addHandler(file_handler)
+    # file writes happen on the listener thread, logging calls only enqueue the record
+    log_queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    logger.addHandler(QueueHandler(log_queue))
+
+def setup_tracing(trace_path: str) -> None:
+    """SONG_ADDER_TRACE=<file> records timing spans for the whole session, GUI included."""
+    recorder = enable_instrumentation()
+
+    def write_trace(recorder: Recorder = recorder) -> None:
+        recorder.write(trace_path)
+        logging.getLogger(__name__).info(f"Timing report:\n{recorder.report()}")
+
+    atexit.register(write_trace)
+
+
+def run_gui(script_dir: Path) -> int:
+    from song_adder.Song_Adder import App
+
+    app = App(script_dir)
+    app.main()
+    return 0
 
 
 if __name__ == "__main__":
 
     if getattr(sys, 'frozen', False):
+        # the process pool of the loudness analysis re-runs the executable for it's workers
+        import multiprocessing
+        multiprocessing.freeze_support()
+
         script_dir = Path(sys.executable).parent
     else:
         script_dir = Path(__file__).parent.absolute()
 
     setup_logger(script_dir)
-    
-    app = App(script_dir)
-    app.main()
+
+    if os.environ.get("SONG_ADDER_TRACE"):
+        setup_tracing(os.environ["SONG_ADDER_TRACE"])
+
+    argv = sys.argv[1:]
+
+    # SONG_ADDER_PROFILE=1 also works for the frozen build, where passing flags is awkward
+    profile = bool(os.environ.get("SONG_ADDER_PROFILE"))
+    if "--profile" in argv:
+        argv.remove("--profile")
+        profile = True
+
+    if argv:
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(logging.WARNING)
+        logging.getLogger().addHandler(console_handler)
+
+        def session() -> int:
+            from song_adder.cli import run_cli
+            return run_cli(argv)
+    else:
+        def session() -> int:
+            return run_gui(script_dir)
+
+    if profile:
+        from song_adder.profiling import run_profiled
+        sys.exit(run_profiled(session, script_dir))
+    sys.exit(session())
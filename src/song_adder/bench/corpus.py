@@ -0,0 +1,241 @@
+"""
+Synthetic MP3 corpus.
+
+    python -m song_adder.bench.corpus OUTPUT [--songs N] [--seconds S] [--seed N] ...
+
+Writes valid MPEG-1 Layer III files, silent frames with random ancillary data so every song
+has different audio, each with a '<name>.hjson' sidecar holding a valid payload. The mix of
+Xing/Info headers, ID3v2 sizes (large covers included) and ID3v1 tags is configurable, so the
+add pipeline takes both it's clean-source and it's remux paths.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import struct
+import sys
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import Any
+
+from mutagen.id3 import APIC, COMM, ID3, TALB, TIT2, TPE1, TRCK
+
+from metadata_utils.engraver import add_payload_frame, build_payload
+from metadata_utils.hash_mutagen import hash_bytes
+from metadata_utils.output_writer import serialize_tags
+
+SAMPLE_RATES = {44100: 0, 48000: 1, 32000: 2}
+
+# MPEG-1 Layer III, kbps -> bitrate index
+BITRATES = {32: 1, 40: 2, 48: 3, 56: 4, 64: 5, 80: 6, 96: 7, 112: 8, 128: 9, 160: 10, 192: 11, 224: 12, 256: 13, 320: 14}
+
+VBR_BITRATES = (128, 160, 192, 224, 256, 320)
+
+SAMPLES_PER_FRAME = 1152
+
+FIRST_DATE = date(2023, 7, 1)
+
+
+class CorpusOptions:
+    def __init__(self, songs: int = 50, seconds: float = 30.0, bitrate: int = 192, sample_rate: int = 44100,
+                 channels: int = 2, xing_ratio: float = 0.5, vbr_ratio: float = 0.2, id3v1_ratio: float = 0.2,
+                 max_cover_kb: int = 512, engraved_ratio: float = 0.0, seed: int = 0):
+        if bitrate not in BITRATES:
+            raise ValueError(f"Unsupported bitrate {bitrate}, expected one of {', '.join(map(str, BITRATES))}")
+        if sample_rate not in SAMPLE_RATES:
+            raise ValueError(f"Unsupported sample rate {sample_rate}, expected one of {', '.join(map(str, SAMPLE_RATES))}")
+        self.songs = songs
+        self.seconds = seconds
+        self.bitrate = bitrate
+        self.sample_rate = sample_rate
+        self.channels = channels
+        # share of songs with a Xing/Info header, those skip the remux
+        self.xing_ratio = xing_ratio
+        self.vbr_ratio = vbr_ratio
+        self.id3v1_ratio = id3v1_ratio
+        # covers are 0 to this many KB, a tenth of the songs get the largest
+        self.max_cover_kb = max_cover_kb
+        # share of songs that already carry a payload, for archive reads
+        self.engraved_ratio = engraved_ratio
+        self.seed = seed
+
+    def as_dict(self) -> dict[str, Any]:
+        return dict(vars(self))
+
+
+def frame_header(bitrate: int, sample_rate: int, channels: int, padding: int) -> bytes:
+    # sync, MPEG-1, Layer III, no CRC
+    header = 0xFFFB0000 | (BITRATES[bitrate] << 12) | (SAMPLE_RATES[sample_rate] << 10) | (padding << 9)
+    if channels == 1:
+        header |= 3 << 6
+    return struct.pack(">I", header)
+
+def side_info_size(channels: int) -> int:
+    return 17 if channels == 1 else 32
+
+def frame_length(bitrate: int, sample_rate: int, padding: int) -> int:
+    return 144 * bitrate * 1000 // sample_rate + padding
+
+def audio_frames(rng: random.Random, count: int, bitrates: list[int], sample_rate: int, channels: int) -> bytes:
+    """
+    Frames with zeroed side info, which decode to silence, and random ancillary data.
+    Padding follows the encoder rule so the average bitrate is exact.
+    """
+    frames = bytearray()
+    side_info = bytes(side_info_size(channels))
+    remainder = 0
+    for bitrate in bitrates[:count]:
+        remainder += 144 * bitrate * 1000 % sample_rate
+        padding = 1 if remainder >= sample_rate else 0
+        remainder -= sample_rate * padding
+        length = frame_length(bitrate, sample_rate, padding)
+        frames += frame_header(bitrate, sample_rate, channels, padding)
+        frames += side_info
+        frames += rng.randbytes(length - 4 - len(side_info))
+    return bytes(frames)
+
+def xing_frame(frames: int, audio_bytes: int, bitrate: int, sample_rate: int, channels: int, vbr: bool) -> bytes:
+    """The first frame of a LAME-style file, it's frame count excludes itself."""
+    length = frame_length(bitrate, sample_rate, 0)
+    body = bytearray(length)
+    body[:4] = frame_header(bitrate, sample_rate, channels, 0)
+    offset = 4 + side_info_size(channels)
+    # flags: frame count and byte count present
+    body[offset:offset + 16] = (b"Xing" if vbr else b"Info") + struct.pack(">III", 3, frames, audio_bytes + length)
+    return bytes(body)
+
+def id3v1_tag(title: str, artist: str) -> bytes:
+    def field(text: str, size: int) -> bytes:
+        return text.encode("latin-1", "replace")[:size].ljust(size, b"\0")
+    return b"TAG" + field(title, 30) + field(artist, 30) + field("Synthetic", 30) + b"2024" + bytes(30) + b"\xff"
+
+def song_data_for(index: int) -> dict[str, str]:
+    return {
+        "Date": (FIRST_DATE + timedelta(days=index % 500)).isoformat(),
+        "Title": f"Synthetic Song {index:05d}",
+        "Artist": f"Synthetic Artist {index % 40}",
+        "CoverArtist": ("Neuro", "Evil", "Neuro & Evil")[index % 3],
+        "Version": "3",
+        "Discnumber": str(index % 9 + 1),
+        "Track": str(index % 99 + 1),
+        "Comment": "",
+        "Special": "0",
+    }
+
+@lru_cache(maxsize=1)
+def _base_jpeg() -> bytes:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), (200, 120, 160)).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+def cover_jpeg(rng: random.Random, size: int) -> bytes:
+    """A decodable JPEG grown to about size bytes with comment segments of random data."""
+    base = _base_jpeg()
+    segments = bytearray()
+    remaining = max(0, size - len(base))
+    while remaining > 4:
+        length = min(remaining - 2, 65535)
+        segments += b"\xff\xfe" + struct.pack(">H", length) + rng.randbytes(length - 2)
+        remaining -= length + 2
+    # right after the start of image marker
+    return base[:2] + bytes(segments) + base[2:]
+
+def _cover_size(rng: random.Random, options: CorpusOptions) -> int:
+    if not options.max_cover_kb:
+        return 0
+    if rng.random() < 0.1:
+        return options.max_cover_kb * 1024
+    return rng.randint(0, options.max_cover_kb * 1024 // 4)
+
+def build_song(rng: random.Random, index: int, options: CorpusOptions) -> tuple[bytes, dict[str, str]]:
+    song_data = song_data_for(index)
+    count = max(1, round(options.seconds * options.sample_rate / SAMPLES_PER_FRAME))
+
+    vbr = rng.random() < options.vbr_ratio
+    bitrates = [rng.choice(VBR_BITRATES) for _ in range(count)] if vbr else [options.bitrate] * count
+    audio = audio_frames(rng, count, bitrates, options.sample_rate, options.channels)
+    if rng.random() < options.xing_ratio:
+        audio = xing_frame(count, len(audio), options.bitrate, options.sample_rate, options.channels, vbr) + audio
+
+    tags = ID3()
+    tags.add(TIT2(encoding=3, text=[song_data["Title"]]))
+    tags.add(TPE1(encoding=3, text=[song_data["Artist"]]))
+    tags.add(TALB(encoding=3, text=["Synthetic"]))
+    tags.add(TRCK(encoding=3, text=[song_data["Track"]]))
+    tags.add(COMM(encoding=3, lang="eng", desc="", text=[f"Synthetic song {index}"]))
+    cover_size = _cover_size(rng, options)
+    if cover_size:
+        tags.add(APIC(encoding=3, mime="image/jpeg", type=3, desc="Cover (Front)",
+                      data=cover_jpeg(rng, cover_size)))
+
+    # the audio hash skips the ID3 tags, so it's known before they're built
+    if rng.random() < options.engraved_ratio:
+        add_payload_frame(tags, build_payload(
+            filename=f"{index}.mp3",
+            date=song_data["Date"], title=song_data["Title"], artist=song_data["Artist"],
+            cover_artist=song_data["CoverArtist"], version=song_data["Version"],
+            disc_number=song_data["Discnumber"], track=song_data["Track"], comment="",
+            special=song_data["Special"], xxhash=hash_bytes(audio)
+        ))
+
+    data = serialize_tags(tags) + audio
+    if rng.random() < options.id3v1_ratio:
+        data += id3v1_tag(song_data["Title"], song_data["Artist"])
+    return data, song_data
+
+def generate_corpus(output: str, options: CorpusOptions) -> list[str]:
+    """Writes the corpus and returns the song paths. The same options always write the same files."""
+    os.makedirs(output, exist_ok=True)
+    rng = random.Random(options.seed)
+    paths: list[str] = []
+
+    for index in range(options.songs):
+        data, song_data = build_song(rng, index, options)
+        path = os.path.join(output, f"synthetic_{index:05d}.mp3")
+        with open(path, "wb") as file:
+            file.write(data)
+        with open(os.path.splitext(path)[0] + ".hjson", "w", encoding="utf-8") as file:
+            json.dump(song_data, file, ensure_ascii=False, indent=2)
+        paths.append(path)
+
+    return paths
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Write a synthetic MP3 corpus with HJSON sidecars")
+    parser.add_argument("output", help="Folder receiving the corpus")
+    parser.add_argument("--songs", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=30.0, help="Length of every song")
+    parser.add_argument("--bitrate", type=int, default=192, help="kbps of the CBR songs")
+    parser.add_argument("--sample-rate", type=int, default=44100)
+    parser.add_argument("--mono", action="store_true")
+    parser.add_argument("--xing-ratio", type=float, default=0.5, help="Share of songs with a Xing/Info header")
+    parser.add_argument("--vbr-ratio", type=float, default=0.2, help="Share of songs with a variable bitrate")
+    parser.add_argument("--id3v1-ratio", type=float, default=0.2, help="Share of songs ending with an ID3v1 tag")
+    parser.add_argument("--max-cover-kb", type=int, default=512, help="Largest embedded cover, 0 for none")
+    parser.add_argument("--engraved-ratio", type=float, default=0.0, help="Share of songs already carrying a payload")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    try:
+        options = CorpusOptions(
+            songs=args.songs, seconds=args.seconds, bitrate=args.bitrate, sample_rate=args.sample_rate,
+            channels=1 if args.mono else 2, xing_ratio=args.xing_ratio, vbr_ratio=args.vbr_ratio,
+            id3v1_ratio=args.id3v1_ratio, max_cover_kb=args.max_cover_kb,
+            engraved_ratio=args.engraved_ratio, seed=args.seed
+        )
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    paths = generate_corpus(args.output, options)
+    size = sum(os.path.getsize(path) for path in paths)
+    print(f"Wrote {len(paths)} songs, {size / 1_048_576:.1f} MB, to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+"""
+End-to-end benchmark.
+
+    python -m song_adder.bench.e2e [--songs N] [--seconds S] [--runs N] [--save-baseline] ...
+
+Adds a synthetic corpus to a fresh archive several times and reports the median time of every
+pipeline stage per song (validate_payload, process_new_tags, remux, set_tags, get_audio_hash,
+build_payload, engrave_payload, ...), of the whole batch, and of archive scans and payload reads.
+Results are compared with the baseline stored under --name, a stage slower by more than
+--threshold is a regression and makes the exit status 1.
+Without ffmpeg on the PATH the remux is replaced by a stand-in rewriting the frames behind a
+Xing/Info header, like the real remux, so the benchmark runs anywhere.
+
+Baselines are kept in baselines.json next to this file, by name. Timings only compare on the
+same machine, so every machine records it's own before changing the code:
+
+    python -m song_adder.bench.e2e --save-baseline
+
+and later runs without --save-baseline compare with it, the name defaulting to the host name.
+The committed 'reference' baseline was recorded with --standin-remux and the default settings,
+`--standin-remux --name reference` compares with it to spot large regressions on any machine.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import struct
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+from metadata_utils.catalogue import PayloadCache, iter_catalogue, iter_payloads
+from metadata_utils.instrumentation import Recorder, enable_instrumentation, span
+from metadata_utils.scanner import iter_files
+from metadata_utils.stream_info import parse_header, read_audio_bounds
+
+from .. import pipeline
+from ..remuxer import RemuxError
+from .corpus import CorpusOptions, generate_corpus, xing_frame
+
+DEFAULT_BASELINES = Path(__file__).with_name("baselines.json")
+
+# relative slowdown of a metric that counts as a regression
+DEFAULT_THRESHOLD = 0.15
+
+# differences below this are timer noise, whatever the ratio
+NOISE_FLOOR_MS = 0.25
+
+# stages of the add path that are reported per song
+ADD_STAGES = (
+    "add_song", "plan", "validate_payload", "process_new_tags", "prepare", "inspect_source", "remux",
+    "set_tags", "get_audio_hash", "build_payload", "engrave_payload", "write_output", "commit",
+)
+
+
+def standin_remux(file_path: str, new_path: str) -> None:
+    """
+    What the ffmpeg remux does to a synthetic song: the ID3v2 tag is kept, junk and an ID3v1 tag
+    are dropped and the frames are written behind a fresh Xing/Info header.
+    """
+    start, end = read_audio_bounds(file_path)
+    with open(file_path, "rb") as file:
+        data = file.read()
+
+    frames: list[bytes] = []
+    first = None
+    bitrates: set[int] = set()
+    position = start
+    while position + 4 <= end:
+        frame = parse_header(struct.unpack_from(">I", data, position)[0])
+        if frame is None:
+            position += 1
+            continue
+        # a previous Xing/Info header is replaced
+        tag_offset = position + 4 + frame.side_info_size
+        if not frames and data[tag_offset:tag_offset + 4] in (b"Xing", b"Info"):
+            position += frame.length
+            continue
+        first = first or frame
+        bitrates.add(frame.bitrate)
+        frames.append(data[position:position + frame.length])
+        position += frame.length
+
+    if first is None:
+        raise RemuxError(f"No MPEG frames in {file_path}")
+
+    audio = b"".join(frames)
+    header = xing_frame(len(frames), len(audio), first.bitrate // 1000, first.sample_rate, first.channels, len(bitrates) > 1)
+    with open(new_path, "wb") as file:
+        file.write(data[:start])
+        file.write(header)
+        file.write(audio)
+
+
+def _per_song(recorder: Recorder) -> dict[str, float]:
+    """Mean ms per song of every add stage, over the songs that went through it."""
+    totals = recorder.stage_totals()
+    return {stage: totals[stage]["total_ms"] / totals[stage]["count"] for stage in ADD_STAGES if stage in totals}
+
+def _archive_reads(archive: str, workers: int) -> None:
+    with span("scan_archive"):
+        list(iter_files(archive))
+
+    cache = PayloadCache()
+    with span("read_payloads_cold"):
+        list(iter_payloads(iter_files(archive), cache=cache, workers=workers))
+    with span("read_payloads_warm"):
+        list(iter_payloads(iter_files(archive), cache=cache, workers=workers))
+    with span("read_catalogue_cold"):
+        list(iter_catalogue(archive, cache=PayloadCache(), workers=workers))
+
+def run_once(sources: list[str], archive: str, workers: int, recorder: Recorder) -> dict[str, float]:
+    recorder.spans.clear()
+    start = time.perf_counter()
+    report = pipeline.add_batch(sources, archive, workers=workers)
+    batch_ms = (time.perf_counter() - start) * 1000
+    if report.failed:
+        raise RuntimeError(f"{len(report.failed)} songs failed:\n{report.summary()}")
+
+    metrics = {f"{stage} per song": ms for stage, ms in _per_song(recorder).items()}
+    metrics["batch"] = batch_ms
+
+    recorder.spans.clear()
+    _archive_reads(archive, workers)
+    for stage, totals in recorder.stage_totals().items():
+        metrics[stage] = totals["total_ms"]
+    return metrics
+
+def run_benchmark(options: CorpusOptions, runs: int, workers: int, work_dir: str) -> dict[str, float]:
+    corpus = os.path.join(work_dir, "corpus")
+    sources = sorted(generate_corpus(corpus, options))
+    recorder = enable_instrumentation()
+
+    results: dict[str, list[float]] = {}
+    for run in range(runs):
+        archive = os.path.join(work_dir, f"archive_{run}")
+        os.makedirs(archive)
+        for metric, value in run_once(sources, archive, workers, recorder).items():
+            results.setdefault(metric, []).append(value)
+        shutil.rmtree(archive)
+
+    return {metric: statistics.median(values) for metric, values in results.items()}
+
+
+def load_baselines(path: Path) -> dict[str, Any]:
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+def save_baseline(path: Path, name: str, settings: dict[str, Any], metrics: dict[str, float]) -> None:
+    baselines = load_baselines(path)
+    baselines[name] = {
+        "settings": settings,
+        "metrics": {metric: round(value, 4) for metric, value in metrics.items()},
+        "python": platform.python_version(),
+        "recorded": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    temp_path = path.with_name(path.name + ".tmp")
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump(baselines, file, indent=2, sort_keys=True)
+    os.replace(temp_path, path)
+
+def compare(metrics: dict[str, float], baseline: (dict[str, float] | None), threshold: float) -> list[str]:
+    """Prints the results next to the baseline, returns the regressed metrics."""
+    regressions: list[str] = []
+    print(f"  {'metric':<34}{'ms':>10}{'baseline':>10}{'change':>9}")
+    for metric, value in metrics.items():
+        line = f"  {metric:<34}{value:>10.2f}"
+        previous = baseline.get(metric) if baseline else None
+        if previous:
+            change = value / previous - 1
+            line += f"{previous:>10.2f}{change:>+9.1%}"
+            if change > threshold and value - previous > NOISE_FLOOR_MS:
+                regressions.append(metric)
+                line += "  REGRESSION"
+        print(line)
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Time the add pipeline and archive reads on a synthetic corpus")
+    parser.add_argument("--songs", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=30.0, help="Length of every song")
+    parser.add_argument("--max-cover-kb", type=int, default=512)
+    parser.add_argument("--xing-ratio", type=float, default=0.5, help="Share of songs that skip the remux")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--runs", type=int, default=3, help="The median of the runs is reported")
+    parser.add_argument("--workers", type=int, default=1, help="Songs added in parallel, and parallel reads")
+    parser.add_argument("--standin-remux", action="store_true", help="Use the remux stand-in even with ffmpeg present")
+    parser.add_argument("--baselines", type=Path, default=DEFAULT_BASELINES, help="JSON file of stored baselines")
+    parser.add_argument("--name", default=platform.node() or "default", help="Baseline to compare with (default: the host name)")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Relative slowdown counted as a regression")
+    parser.add_argument("--keep", metavar="DIR", help="Work in DIR and keep the corpus instead of a temporary folder")
+    args = parser.parse_args()
+
+    remux = "ffmpeg"
+    if args.standin_remux or shutil.which("ffmpeg") is None:
+        remux = "standin"
+        pipeline.remux_song = standin_remux
+
+    options = CorpusOptions(songs=args.songs, seconds=args.seconds, max_cover_kb=args.max_cover_kb,
+                            xing_ratio=args.xing_ratio, seed=args.seed)
+    settings = {**options.as_dict(), "runs": args.runs, "workers": args.workers, "remux": remux}
+    print(f"{args.songs} songs of {args.seconds:g}s, {args.runs} runs, {args.workers} workers, {remux} remux")
+
+    if args.keep:
+        os.makedirs(args.keep, exist_ok=True)
+        metrics = run_benchmark(options, args.runs, args.workers, args.keep)
+    else:
+        with tempfile.TemporaryDirectory(prefix="song_adder_bench_") as work_dir:
+            metrics = run_benchmark(options, args.runs, args.workers, work_dir)
+
+    stored = load_baselines(args.baselines).get(args.name)
+    baseline = None
+    if stored is not None and stored["settings"] != settings:
+        print(f"Baseline '{args.name}' was recorded with other settings, not comparing")
+    elif stored is not None:
+        baseline = stored["metrics"]
+    elif not args.save_baseline:
+        print(f"No baseline '{args.name}' in {args.baselines}, record one with --save-baseline")
+
+    regressions = compare(metrics, baseline, args.threshold)
+
+    if args.save_baseline:
+        save_baseline(args.baselines, args.name, settings, metrics)
+        print(f"Baseline '{args.name}' saved to {args.baselines}")
+
+    if regressions:
+        print(f"{len(regressions)} regressions over {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
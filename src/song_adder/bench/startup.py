@@ -0,0 +1,93 @@
+"""
+Startup benchmark.
+
+    python -m song_adder.bench.startup [--runs N] [--window]
+
+Reports the slowest imports of the GUI module from `-X importtime`, the median cold
+import time over several fresh interpreters and, with --window, the median time until
+the main window is built and shown (needs a display).
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+GUI_MODULE = "song_adder.Song_Adder"
+
+# starts the GUI like `python -m song_adder` and closes it once the deferred UI is built
+WINDOW_SCRIPT = """
+import runpy
+from song_adder.Song_Adder import App
+
+build_deferred_ui = App.build_deferred_ui
+
+def build_and_close(self):
+    build_deferred_ui(self)
+    self.main_window.after_idle(self.closing_protocol)
+
+App.build_deferred_ui = build_and_close
+runpy.run_module("song_adder", run_name="__main__", alter_sys=True)
+"""
+
+
+def _child_env(**extra: str) -> dict[str, str]:
+    env = dict(os.environ)
+    # the children must resolve song_adder and metadata_utils the same way we do
+    env["PYTHONPATH"] = os.pathsep.join(p for p in sys.path if p)
+    env.update(extra)
+    return env
+
+def import_profile(module: str = GUI_MODULE, top: int = 15) -> list[tuple[int, int, str]]:
+    """(self µs, cumulative µs, module) of the slowest imports, by cumulative time."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=_child_env(), check=True
+    )
+
+    rows: list[tuple[int, int, str]] = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(self_us), int(cumulative_us), name.rstrip()))
+
+    rows.sort(key=lambda row: -row[1])
+    return rows[:top]
+
+def time_command(command: list[str], runs: int, **env: str) -> list[float]:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, env=_child_env(**env), check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure the cold start of the Song Adder")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--window", action="store_true", help="Also time the start up to a shown window")
+    args = parser.parse_args()
+
+    print(f"Slowest imports of {GUI_MODULE} (-X importtime):")
+    print(f"  {'self ms':>8} {'cumul. ms':>10}  module")
+    for self_us, cumulative_us, name in import_profile():
+        print(f"  {self_us / 1000:>8.1f} {cumulative_us / 1000:>10.1f}  {name}")
+
+    baseline = time_command([sys.executable, "-c", "pass"], args.runs)
+    imports = time_command([sys.executable, "-c", f"import {GUI_MODULE}"], args.runs)
+    print(f"\nInterpreter start: median {statistics.median(baseline) * 1000:.1f} ms")
+    print(f"Import {GUI_MODULE}: median {statistics.median(imports) * 1000:.1f} ms "
+          f"({(statistics.median(imports) - statistics.median(baseline)) * 1000:.1f} ms over the interpreter)")
+
+    if args.window:
+        window = time_command([sys.executable, "-c", WINDOW_SCRIPT], args.runs)
+        print(f"Start to shown window: median {statistics.median(window) * 1000:.1f} ms")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
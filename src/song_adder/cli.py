@@ -0,0 +1,434 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+from metadata_utils.catalogue import EXPORT_FORMATS, default_cache_path, export_catalogue, runtime_totals
+from metadata_utils.fingerprint import (
+    MATCH_THRESHOLD,
+    FingerprintError,
+    FingerprintIndex,
+    Match,
+    default_fingerprint_path,
+)
+from metadata_utils.filename_planner import COLLISION_POLICIES, WINDOWS_MAX_PATH
+from metadata_utils.hjson_export import extract_sidecars
+from metadata_utils.hjson_import import default_hjson_cache_path, import_sidecars
+from metadata_utils.instrumentation import enable_instrumentation
+from metadata_utils.loudness import default_loudness_cache_path, replaygain_archive
+from metadata_utils.scanner import iter_mp3
+from metadata_utils.search import IndexedSong, build_index
+from metadata_utils.snapshots import SnapshotStore, new_label
+
+from .pipeline import FolderInUseError, add_batch, collect_sources
+from .service import DEFAULT_PORT, ArchiveService
+from .transcoder import DEFAULT_TRANSCODE_WORKERS
+from .watcher import POLL_INTERVAL, SETTLE_TIME, InboxWatcher
+
+logger = logging.getLogger(__name__)
+
+
+def _format_song(song: IndexedSong) -> str:
+    data = song.song_data
+    return (
+        f"{data.get('Date', '')} | {data.get('CoverArtist', '')} | "
+        f"{data.get('Artist', '')} - {data.get('Title', '')} (v{data.get('Version', '')}) | {song.path}"
+    )
+
+def _cache_path(args: argparse.Namespace) -> (str | None):
+    if args.no_cache:
+        return None
+    return args.cache or str(default_cache_path(args.archive))
+
+def search_command(args: argparse.Namespace) -> int:
+    index = build_index(args.archive, cache_path=_cache_path(args), workers=args.workers)
+
+    start = time.perf_counter()
+    results = index.search(
+        text=" ".join(args.query) if args.query else None,
+        title=args.title,
+        artist=args.artist,
+        cover_artist=args.cover_artist,
+        date_from=args.date_from,
+        date_to=args.date_to,
+        version=args.version,
+        limit=args.limit
+    )
+    elapsed = time.perf_counter() - start
+
+    for song in results:
+        if args.json:
+            print(json.dumps({"path": song.path, **song.song_data}, ensure_ascii=False))
+        else:
+            print(_format_song(song))
+
+    logger.debug(f"Search over {len(index)} songs took {elapsed * 1000:.3f} ms")
+    return 0
+
+def export_command(args: argparse.Namespace) -> int:
+    start = time.perf_counter()
+    try:
+        count = export_catalogue(
+            args.archive, args.output,
+            export_format=args.format,
+            workers=args.workers,
+            cache_path=_cache_path(args)
+        )
+    except (ValueError, RuntimeError) as e:
+        logger.error(e)
+        return 1
+
+    print(f"Exported {count} songs to {args.output} in {time.perf_counter() - start:.2f}s")
+    return 0
+
+def _format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02}:{seconds:02}"
+
+def _disc_sort_key(disc: str) -> tuple[int, str]:
+    return (int(disc), "") if disc.isdigit() else (1 << 30, disc)
+
+def runtime_command(args: argparse.Namespace) -> int:
+    totals = runtime_totals(args.archive, workers=args.workers, cache_path=_cache_path(args))
+
+    for disc in sorted(totals, key=_disc_sort_key):
+        songs, seconds = totals[disc]
+        print(f"Disc {disc:<8}{songs:>6} songs  {_format_duration(seconds):>10}")
+
+    songs = sum(songs for songs, _ in totals.values())
+    seconds = sum(seconds for _, seconds in totals.values())
+    print(f"{'Archive':<13}{songs:>6} songs  {_format_duration(seconds):>10}")
+    return 0
+
+def _snapshot_store(args: argparse.Namespace, operation: str) -> (SnapshotStore | None):
+    if not args.snapshot or args.dry_run:
+        return None
+    store = SnapshotStore(args.archive, new_label(operation))
+    print(f"Snapshotting overwritten tags as '{store.label}', undo with: restore {args.archive} --label {store.label}")
+    return store
+
+def import_command(args: argparse.Namespace) -> int:
+    report = import_sidecars(
+        args.source, args.archive,
+        workers=args.workers,
+        dry_run=args.dry_run,
+        cache_path=None if args.no_cache else default_hjson_cache_path(args.source),
+        snapshot_store=_snapshot_store(args, "import")
+    )
+    print(report.summary())
+    return 1 if (report.invalid or report.unmatched or report.failed) else 0
+
+def extract_command(args: argparse.Namespace) -> int:
+    report = extract_sidecars(
+        args.archive, args.output,
+        per_disc=args.per_disc,
+        workers=args.workers,
+        force=args.force
+    )
+    print(report.summary())
+    return 1 if report.failed else 0
+
+def add_command(args: argparse.Namespace) -> int:
+    if not os.path.isdir(args.save_folder):
+        logger.error(f"{args.save_folder} is not a folder")
+        return 1
+
+    try:
+        report = add_batch(
+            collect_sources(args.sources), args.save_folder,
+            workers=args.workers,
+            on_collision=args.on_collision,
+            max_path=args.max_path,
+            transcode_workers=args.transcode_workers
+        )
+    except FolderInUseError as e:
+        logger.error(e)
+        return 1
+    print(report.summary())
+    return 1 if report.failed else 0
+
+def watch_command(args: argparse.Namespace) -> int:
+    for folder in (args.inbox, args.save_folder):
+        if not os.path.isdir(folder):
+            logger.error(f"{folder} is not a folder")
+            return 1
+
+    watcher = InboxWatcher(
+        args.inbox, args.save_folder,
+        quarantine=args.quarantine,
+        processed=args.processed,
+        workers=args.workers,
+        poll_interval=args.interval,
+        settle_time=args.settle,
+        on_collision=args.on_collision,
+        max_path=args.max_path,
+        transcode_workers=args.transcode_workers
+    )
+    try:
+        report = watcher.run(once=args.once)
+    except FolderInUseError as e:
+        logger.error(e)
+        return 1
+    except KeyboardInterrupt:
+        logger.info("Watch stopped")
+        report = watcher.report
+
+    print(report.summary())
+    return 1 if report.failed else 0
+
+def serve_command(args: argparse.Namespace) -> int:
+    if not os.path.isdir(args.save_folder):
+        logger.error(f"{args.save_folder} is not a folder")
+        return 1
+    if args.socket and not hasattr(asyncio, "start_unix_server"):
+        logger.error("Unix sockets aren't available on this platform, use --port")
+        return 1
+
+    service = ArchiveService(
+        args.save_folder,
+        workers=args.workers,
+        on_collision=args.on_collision,
+        max_path=args.max_path
+    )
+    try:
+        asyncio.run(service.serve(args.port, args.socket, ready=lambda address: print(f"Serving on {address}", flush=True)))
+    except FolderInUseError as e:
+        logger.error(e)
+        return 1
+    except KeyboardInterrupt:
+        logger.info("Service stopped")
+    return 0
+
+def _format_match(match: Match) -> str:
+    return f"{match.score:.3f}  {match.offset_seconds:+8.1f}s  {match.path}"
+
+def _load_fingerprint_index(args: argparse.Namespace) -> FingerprintIndex:
+    index = FingerprintIndex(default_fingerprint_path(args.archive))
+    updated, removed = index.update(args.archive, workers=args.workers)
+    if updated or removed:
+        index.save()
+    logger.debug(f"Fingerprint index: {len(index)} songs, {updated} updated, {removed} removed")
+    return index
+
+def similar_command(args: argparse.Namespace) -> int:
+    try:
+        index = _load_fingerprint_index(args)
+        matches = index.similar_to(os.path.abspath(args.song), limit=args.limit, threshold=args.threshold)
+    except (RuntimeError, FingerprintError, OSError) as e:
+        logger.error(e)
+        return 1
+
+    for match in matches:
+        print(_format_match(match))
+    return 0
+
+def duplicates_command(args: argparse.Namespace) -> int:
+    try:
+        index = _load_fingerprint_index(args)
+    except RuntimeError as e:
+        logger.error(e)
+        return 1
+
+    pairs = index.duplicates(threshold=args.threshold)
+    for path, match in pairs:
+        print(f"{path}\n    {_format_match(match)}")
+    print(f"{len(pairs)} near-duplicate pairs among {len(index)} songs")
+    return 0
+
+def replaygain_command(args: argparse.Namespace) -> int:
+    try:
+        report = replaygain_archive(
+            args.archive,
+            workers=args.workers,
+            dry_run=args.dry_run,
+            cache_path=None if args.no_cache else default_loudness_cache_path(args.archive),
+            snapshot_store=_snapshot_store(args, "replaygain")
+        )
+    except RuntimeError as e:
+        logger.error(e)
+        return 1
+
+    if args.dry_run:
+        for path, values in sorted(report.values.items()):
+            print(f"{values['REPLAYGAIN_TRACK_GAIN']:>10} {values['REPLAYGAIN_ALBUM_GAIN']:>10}  {path}")
+    print(report.summary())
+    return 1 if report.failed else 0
+
+def snapshot_command(args: argparse.Namespace) -> int:
+    store = SnapshotStore(args.archive, args.label or new_label("snapshot"))
+    count = store.snapshot_all(iter_mp3(args.archive))
+    print(f"Snapshotted the tags of {count} songs as '{store.label}'")
+    return 0
+
+def restore_command(args: argparse.Namespace) -> int:
+    store = SnapshotStore(args.archive)
+    labels = store.labels()
+    if args.list:
+        for label in labels:
+            print(f"{label}: {len(store.entries(label))} songs")
+        return 0
+
+    label = args.label or (labels[-1] if labels else None)
+    if label not in labels:
+        logger.error(f"No snapshot '{label}' in {store.root}" if label else f"No snapshots in {store.root}")
+        return 1
+
+    report = store.restore(label, args.paths or None)
+    print(f"Snapshot '{label}'")
+    print(report.summary())
+    return 1 if report.failed else 0
+
+def _add_archive_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("archive", help="Archive folder")
+    parser.add_argument("--workers", type=int, default=min(32, (os.cpu_count() or 1) * 4),
+                        help="Number of parallel file reads")
+    parser.add_argument("--cache", help="Payload cache file (default: .song_adder_cache.json inside the archive)")
+    parser.add_argument("--no-cache", action="store_true", help="Reopen every file instead of using the payload cache")
+
+def _add_filename_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--on-collision", choices=COLLISION_POLICIES, default="rename",
+                        help="When a target name is already in the archive, in any case: number the new song ' (2)', "
+                             "fail it, or overwrite the archive file (default: rename)")
+    parser.add_argument("--max-path", type=int, default=WINDOWS_MAX_PATH,
+                        help="Fail songs whose archive path would reach this many characters, 0 to disable (default: the Windows MAX_PATH)")
+
+def _add_transcode_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--transcode-workers", type=int, default=DEFAULT_TRANSCODE_WORKERS,
+                        help="ffmpeg encoders run in parallel for the songs that aren't MP3s (default: one per core)")
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="song_adder", description="Neuro Karaoke Archive tools. Run without a command to open the GUI.")
+    parser.add_argument("--trace", metavar="FILE", help="Record timing spans, as a Chrome trace (.json) or JSON lines (any other suffix)")
+    parser.add_argument("--timing", action="store_true", help="Print a per-song and per-stage timing report")
+    # handled by __main__ so the GUI can be profiled too, listed here for --help
+    parser.add_argument("--profile", action="store_true",
+                        help="Run under cProfile and tracemalloc, writing song_adder.prof next to song_adder.log")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    search_parser = subparsers.add_parser("search", help="Query the archive by its COMM::ved payloads")
+    _add_archive_arguments(search_parser)
+    search_parser.add_argument("query", nargs="*", help="Free text matched against Title, Artist and CoverArtist")
+    search_parser.add_argument("--title")
+    search_parser.add_argument("--artist")
+    search_parser.add_argument("--cover-artist")
+    search_parser.add_argument("--from", dest="date_from", metavar="YYYY-MM-DD")
+    search_parser.add_argument("--to", dest="date_to", metavar="YYYY-MM-DD")
+    search_parser.add_argument("--version")
+    search_parser.add_argument("--limit", type=int)
+    search_parser.add_argument("--json", action="store_true", help="Print one JSON object per result")
+    search_parser.set_defaults(func=search_command)
+
+    export_parser = subparsers.add_parser("export", help="Export the archive catalogue in one streaming pass")
+    _add_archive_arguments(export_parser)
+    export_parser.add_argument("output", help="Catalogue file, the format is inferred from its suffix")
+    export_parser.add_argument("--format", choices=EXPORT_FORMATS)
+    export_parser.set_defaults(func=export_command)
+
+    runtime_parser = subparsers.add_parser("runtime", help="Total runtime per disc and for the whole archive")
+    _add_archive_arguments(runtime_parser)
+    runtime_parser.set_defaults(func=runtime_command)
+
+    import_parser = subparsers.add_parser("import", help="Engrave payloads from HJSON sidecars into the archive")
+    import_parser.add_argument("source", help="Folder of HJSON sidecars, or one HJSON file holding an array of records")
+    import_parser.add_argument("archive", help="Archive folder holding the matching MP3s")
+    import_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    import_parser.add_argument("--dry-run", action="store_true", help="Only match and validate, don't engrave")
+    import_parser.add_argument("--no-cache", action="store_true", help="Reparse every sidecar instead of using the parse cache")
+    import_parser.add_argument("--snapshot", action="store_true", help="Keep the tag blocks overwritten, for the restore command")
+    import_parser.set_defaults(func=import_command)
+
+    extract_parser = subparsers.add_parser("extract", help="Dump the engraved payloads to HJSON sidecars for bulk editing")
+    extract_parser.add_argument("archive", help="Archive folder")
+    extract_parser.add_argument("output", help="Folder receiving the sidecars")
+    extract_parser.add_argument("--per-disc", action="store_true", help="Write one HJSON array per disc instead of one file per song")
+    extract_parser.add_argument("--workers", type=int, default=min(32, (os.cpu_count() or 1) * 4))
+    extract_parser.add_argument("--force", action="store_true", help="Rewrite every sidecar, ignoring the manifest")
+    extract_parser.set_defaults(func=extract_command)
+
+    add_parser = subparsers.add_parser("add", help="Add songs to the archive in one batch")
+    add_parser.add_argument("sources", nargs="+", help="MP3, FLAC, WAV, Opus or M4A files, or folders. Payloads come from '<name>.hjson' "
+                                                       "sidecars or the songs themselves, other formats than MP3 need a sidecar")
+    add_parser.add_argument("--save-folder", required=True, help="Archive folder receiving the new songs")
+    add_parser.add_argument("--workers", type=int, default=1, help="Songs processed in parallel")
+    _add_transcode_argument(add_parser)
+    _add_filename_arguments(add_parser)
+    add_parser.set_defaults(func=add_command)
+
+    similar_parser = subparsers.add_parser("similar", help="List the archive songs whose audio is close to a song")
+    similar_parser.add_argument("archive", help="Archive folder")
+    similar_parser.add_argument("song", help="MP3 to compare, inside the archive or not")
+    similar_parser.add_argument("--limit", type=int, default=10)
+    similar_parser.add_argument("--threshold", type=float, default=MATCH_THRESHOLD,
+                                help="Highest fingerprint bit error rate still considered a match")
+    similar_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Songs fingerprinted in parallel")
+    similar_parser.set_defaults(func=similar_command)
+
+    duplicates_parser = subparsers.add_parser("duplicates", help="List near-duplicate songs, re-encodes and trims included")
+    duplicates_parser.add_argument("archive", help="Archive folder")
+    duplicates_parser.add_argument("--threshold", type=float, default=MATCH_THRESHOLD,
+                                   help="Highest fingerprint bit error rate still considered a match")
+    duplicates_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Songs fingerprinted in parallel")
+    duplicates_parser.set_defaults(func=duplicates_command)
+
+    replaygain_parser = subparsers.add_parser("replaygain", help="Measure EBU R128 loudness and write ReplayGain track and album (disc) tags")
+    replaygain_parser.add_argument("archive", help="Archive folder")
+    replaygain_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Songs analysed in parallel processes")
+    replaygain_parser.add_argument("--dry-run", action="store_true", help="Print the gains without tagging")
+    replaygain_parser.add_argument("--no-cache", action="store_true", help="Analyse every song again, ignoring the cache keyed by xxHash")
+    replaygain_parser.add_argument("--snapshot", action="store_true", help="Keep the tag blocks overwritten, for the restore command")
+    replaygain_parser.set_defaults(func=replaygain_command)
+
+    snapshot_parser = subparsers.add_parser("snapshot", help="Store the ID3v2 tag blocks of the archive, megabytes instead of a full backup")
+    snapshot_parser.add_argument("archive", help="Archive folder")
+    snapshot_parser.add_argument("--label", help="Name of the snapshot (default: the date and time)")
+    snapshot_parser.set_defaults(func=snapshot_command)
+
+    restore_parser = subparsers.add_parser("restore", help="Put the tag blocks of a snapshot back on songs whose audio is unchanged")
+    restore_parser.add_argument("archive", help="Archive folder")
+    restore_parser.add_argument("paths", nargs="*", help="Only restore these songs")
+    restore_parser.add_argument("--label", help="Snapshot to restore (default: the latest)")
+    restore_parser.add_argument("--list", action="store_true", help="List the snapshots instead")
+    restore_parser.set_defaults(func=restore_command)
+
+    watch_parser = subparsers.add_parser("watch", help="Continuously add the songs dropped into an inbox folder")
+    watch_parser.add_argument("inbox", help="Folder receiving songs and their '<name>.hjson' sidecars")
+    watch_parser.add_argument("--save-folder", required=True, help="Archive folder receiving the new songs")
+    watch_parser.add_argument("--quarantine", help="Folder receiving failed songs (default: <inbox>/quarantine)")
+    watch_parser.add_argument("--processed", help="Folder receiving added songs (default: <inbox>/processed)")
+    watch_parser.add_argument("--workers", type=int, default=2, help="Songs processed in parallel")
+    _add_transcode_argument(watch_parser)
+    watch_parser.add_argument("--interval", type=float, default=POLL_INTERVAL, help="Seconds between inbox scans")
+    watch_parser.add_argument("--settle", type=float, default=SETTLE_TIME,
+                              help="Seconds a song must stay unchanged before it's picked up")
+    _add_filename_arguments(watch_parser)
+    watch_parser.add_argument("--once", action="store_true", help="Exit once the songs already in the inbox are handled")
+    watch_parser.set_defaults(func=watch_command)
+
+    serve_parser = subparsers.add_parser("serve", help="Run a local HTTP service adding, previewing, searching and verifying songs, with caches kept warm")
+    serve_parser.add_argument("--save-folder", required=True, help="Archive folder receiving the new songs")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port on 127.0.0.1, 0 picks a free one")
+    serve_parser.add_argument("--socket", help="Listen on this Unix socket instead of a port")
+    serve_parser.add_argument("--workers", type=int, default=2, help="Jobs run in parallel")
+    _add_filename_arguments(serve_parser)
+    serve_parser.set_defaults(func=serve_command)
+
+    return parser
+
+def run_cli(argv: list[str]) -> int:
+    args = build_parser().parse_args(argv)
+
+    if not (args.trace or args.timing):
+        return args.func(args)
+
+    recorder = enable_instrumentation()
+    try:
+        return args.func(args)
+    finally:
+        if args.trace:
+            recorder.write(args.trace)
+        if args.timing:
+            print(recorder.report(), file=sys.stderr)
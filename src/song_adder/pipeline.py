@@ -0,0 +1,670 @@
+import json
+import logging
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import IO, Any, Callable
+
+from mutagen.id3 import ID3, ID3NoHeaderError
+
+from metadata_utils.CF_Program import Song, apply_tags, get_song_data, pattern_defaults, process_new_tags, set_tags
+from metadata_utils.data_verification import validate_payload
+from metadata_utils.engraver import add_payload_frame, build_payload, engrave_payload
+from metadata_utils.filename_planner import WINDOWS_MAX_PATH, FilenameConflictError, FilenamePlanner
+from metadata_utils.hash_mutagen import get_audio_hash, hash_bytes, hash_file_range
+from metadata_utils.hjson_import import iter_sidecar_records
+from metadata_utils.instrumentation import file_size, song_scope, span
+from metadata_utils.output_writer import serialize_tags, write_output
+from metadata_utils.scanner import iter_files
+from metadata_utils.stream_info import SourceInspection, inspect_source, read_audio_bounds
+
+from .remuxer import remux_song
+from .transcoder import (
+    ARCHIVE_PROFILE,
+    DEFAULT_TRANSCODE_WORKERS,
+    SOURCE_SUFFIXES,
+    embedded_cover,
+    needs_transcode,
+    progress_logger,
+    transcode_song,
+)
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_FILENAME = ".song_adder_journal.jsonl"
+
+JOB_STATE_FILENAME = ".song_adder_jobs.json"
+
+LOCK_FILENAME = ".song_adder.lock"
+
+# bump whenever add_song changes what it writes, so every song is reprocessed once
+PIPELINE_VERSION = 1
+
+TEMP_SUFFIX = ".part"
+
+# the encoder's output, before it's tagged into the temporary file
+ENCODED_SUFFIX = ".encoded"
+
+# Payload field -> build_payload/validate_payload argument
+ARG_MAP = {
+    "Date": "date",
+    "Title": "title",
+    "Artist": "artist",
+    "CoverArtist": "cover_artist",
+    "Version": "version",
+    "Discnumber": "disc_number",
+    "Track": "track",
+    "Comment": "comment",
+    "Special": "special",
+}
+
+COVER_SUFFIXES = {".jpg": "jpeg", ".jpeg": "jpeg", ".png": "png"}
+
+
+class PipelineError(Exception):
+    pass
+
+
+class FolderInUseError(PipelineError):
+    pass
+
+
+def temp_path_for(final_path: str) -> str:
+    """Hidden temporary file in the same folder, so the final rename stays atomic."""
+    folder, name = os.path.split(final_path)
+    return os.path.join(folder, f".{name}.{os.getpid()}.{threading.get_ident()}{TEMP_SUFFIX}")
+
+def _fsync_folder(folder: str) -> None:
+    # directories can't be opened on Windows, NTFS journals the rename itself
+    if os.name == "nt":
+        return
+    fd = os.open(folder, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def commit_file(temp_path: str, final_path: str) -> None:
+    """Flushes a finished temporary file to disk and atomically moves it into place."""
+    with open(temp_path, "rb+") as file:
+        os.fsync(file.fileno())
+    os.replace(temp_path, final_path)
+    _fsync_folder(os.path.dirname(final_path) or ".")
+
+def remove_stale_temp_files(folder: str, filename: str) -> None:
+    prefix = f".{filename}."
+    for entry in os.scandir(folder):
+        if entry.name.startswith(prefix) and entry.name.endswith(TEMP_SUFFIX):
+            logger.debug(f"Removing leftover temporary file {entry.path}")
+            os.remove(entry.path)
+
+def remove_case_variant(save_folder: str, replaced: (str | None), filename: str) -> None:
+    """
+    Removes the archive file replaced by filename when their names only differ in case. On a
+    case-sensitive filesystem both would stay, and collide on the Windows mirrors.
+    """
+    if not replaced or replaced == filename:
+        return
+    replaced_path = os.path.join(save_folder, replaced)
+    try:
+        # on a case-insensitive filesystem it's the file just written
+        if os.path.samefile(replaced_path, os.path.join(save_folder, filename)):
+            return
+        os.remove(replaced_path)
+    except FileNotFoundError:
+        return
+    logger.info(f"Removed {replaced}, it was replaced by {filename}")
+
+def payload_kwargs_from_song_data(song_data: dict[str, Any], filename: str) -> dict[str, str]:
+    payload_kwargs = {ARG_MAP[field]: str(song_data.get(field, "")) for field in ARG_MAP}
+    payload_kwargs["filename"] = filename
+    return payload_kwargs
+
+def _remux_and_tag(song: Song, payload_kwargs: dict[str, str], temp_path: str,
+                   image_type: (str | None), image_data: (bytes | None)) -> None:
+    with span("remux") as timing:
+        remux_song(file_path=str(song.path), new_path=temp_path)
+        if timing:
+            timing.bytes_read = file_size(str(song.path))
+            timing.bytes_written = file_size(temp_path)
+    logger.debug(f"Remuxed song created at {temp_path}")
+
+    with span("set_tags") as timing:
+        set_tags(temp_path, song, image_type, image_data)
+        if timing:
+            timing.bytes_written = file_size(temp_path)
+    logger.debug("ID3v2 tags added")
+
+    with span("get_audio_hash") as timing:
+        temp_hash = get_audio_hash(temp_path)
+        if timing:
+            timing.bytes_read = file_size(temp_path)
+    if temp_hash is None:
+        raise PipelineError("The program was unable to generate a hash!")
+
+    with span("build_payload"):
+        new_payload = build_payload(**{**payload_kwargs, "xxhash": temp_hash})
+
+    with span("engrave_payload") as timing:
+        engrave_payload(temp_path, new_payload)
+        if timing:
+            timing.bytes_written = file_size(temp_path)
+    logger.debug("Json payload added")
+
+def _write_clean_source(song: Song, payload_kwargs: dict[str, str], temp_path: str, inspection: SourceInspection,
+                        image_type: (str | None), image_data: (bytes | None), encoded: (str | None) = None) -> None:
+    """The frames come from the source song, or from encoded, a transcode of it without tags."""
+    source = encoded or str(song.path)
+
+    with span("set_tags"):
+        try:
+            tags = ID3() if encoded else ID3(source)
+        except ID3NoHeaderError:
+            tags = ID3()
+        apply_tags(tags, song, image_type, image_data)
+
+    with span("get_audio_hash") as timing:
+        # the frames are copied untouched, so their hash is the hash of the output's audio
+        temp_hash = hash_file_range(source, inspection.audio_start, inspection.audio_end)
+        if timing:
+            timing.bytes_read = inspection.audio_end - inspection.audio_start
+
+    with span("build_payload"):
+        new_payload = build_payload(**{**payload_kwargs, "xxhash": temp_hash})
+        add_payload_frame(tags, new_payload)
+
+    with span("write_output") as timing:
+        tag_block = serialize_tags(tags)
+        write_output(temp_path, tag_block, source, inspection.audio_start, inspection.audio_end)
+        if timing:
+            timing.bytes_read = inspection.audio_end - inspection.audio_start
+            timing.bytes_written = len(tag_block) + timing.bytes_read
+    logger.debug(f"Tagged and engraved song written to {temp_path}")
+
+def _transcode_and_tag(song: Song, payload_kwargs: dict[str, str], temp_path: str, image_type: (str | None),
+                       image_data: (bytes | None), progress: (Callable[[float], None] | None)) -> None:
+    encoded_path = temp_path[:-len(TEMP_SUFFIX)] + ENCODED_SUFFIX + TEMP_SUFFIX
+    if image_data is None:
+        # the encode drops attached pictures, the source's is carried over like an MP3's is by the remux
+        image_type, image_data = embedded_cover(str(song.path))
+    try:
+        with span("transcode") as timing:
+            transcode_song(str(song.path), encoded_path, progress)
+            if timing:
+                timing.bytes_read = file_size(str(song.path))
+                timing.bytes_written = file_size(encoded_path)
+
+        # the encoder writes what the remux would, so the song goes down the clean-source path
+        audio_start, audio_end = read_audio_bounds(encoded_path)
+        inspection = SourceInspection(False, "transcoded", audio_start, audio_end)
+        _write_clean_source(song, payload_kwargs, temp_path, inspection, image_type, image_data, encoded_path)
+    finally:
+        if os.path.exists(encoded_path):
+            os.remove(encoded_path)
+
+def add_song(song: Song, payload_kwargs: dict[str, str], save_folder: str,
+             image_type: (str | None) = None, image_data: (bytes | None) = None,
+             progress: (Callable[[float], None] | None) = None) -> str:
+    """
+    Remuxes, tags, hashes and engraves a song into the save folder and returns the new path.
+    Sources that aren't MP3s are transcoded first, progress following the encoder.
+    Everything is written to a temporary file that only replaces the final path once complete,
+    so a failure never leaves a partial song in the archive.
+    """
+    new_path = os.path.join(save_folder, song.filename)
+    temp_path = temp_path_for(new_path)
+
+    try:
+        with song_scope(os.path.basename(str(song.path))), span("add_song"):
+            if needs_transcode(str(song.path)):
+                logger.debug(f"Transcoding {song.path}")
+                _transcode_and_tag(song, payload_kwargs, temp_path, image_type, image_data, progress)
+            else:
+                with span("inspect_source"):
+                    inspection = inspect_source(str(song.path))
+
+                if inspection.needs_remux:
+                    logger.debug(f"Remuxing {song.path}: {inspection.reason}")
+                    _remux_and_tag(song, payload_kwargs, temp_path, image_type, image_data)
+                else:
+                    # the source already is what the remux would produce, so the tags are built in
+                    # memory and the song written once, tag block first and then the source's frames
+                    _write_clean_source(song, payload_kwargs, temp_path, inspection, image_type, image_data)
+
+            with span("commit"):
+                commit_file(temp_path, new_path)
+
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return new_path
+
+
+class Journal:
+    """
+    Append-only record of a batch in the save folder. Every song is marked as begun before
+    it's first write and as committed after it's rename, so the leftovers of an interrupted
+    batch can be cleaned up before it's rerun.
+    """
+    def __init__(self, save_folder: str):
+        self.path = os.path.join(save_folder, JOURNAL_FILENAME)
+        self.save_folder = save_folder
+        self._lock = threading.Lock()
+        self.committed: dict[str, str] = {}
+        self.begun: dict[str, str] = {}
+
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # a torn last line from a crash mid-write
+                    logger.debug(f"Ignoring corrupted journal line: {line!r}")
+                    continue
+                if entry["event"] == "begin":
+                    self.begun[entry["source"]] = entry["target"]
+                    self.committed.pop(entry["source"], None)
+                elif entry["event"] == "commit":
+                    self.committed[entry["source"]] = entry["target"]
+
+    def _append(self, entry: dict[str, str]) -> None:
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+
+    def begin(self, source: str, target: str) -> None:
+        self._append({"event": "begin", "source": source, "target": target})
+
+    def commit(self, source: str, target: str) -> None:
+        self._append({"event": "commit", "source": source, "target": target})
+        with self._lock:
+            self.committed[source] = target
+
+    def recover(self) -> None:
+        """Removes the temporary files of songs that were begun but never committed."""
+        for source, target in self.begun.items():
+            if self.committed.get(source) != target:
+                logger.info(f"Cleaning up interrupted write of {target}")
+                remove_stale_temp_files(self.save_folder, target)
+
+    def close(self) -> None:
+        """The batch finished cleanly, nothing to resume."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class FolderLock:
+    """
+    Exclusive lock on a save folder, held while an add, watch or service writes to it. The
+    journal and job state of a folder are only read at startup, and the journal's recovery
+    would remove the temporary files of another process's writes.
+    """
+    def __init__(self, save_folder: str):
+        self.path = os.path.join(save_folder, LOCK_FILENAME)
+        self.save_folder = save_folder
+        self._file: (IO[bytes] | None) = None
+
+    def acquire(self) -> None:
+        file = open(self.path, "a+b")
+        try:
+            if sys.platform == "win32":
+                import msvcrt
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            file.close()
+            raise FolderInUseError(f"{self.save_folder} is in use by another song_adder process")
+        self._file = file
+
+    def release(self) -> None:
+        # the lock file stays, removing it would race with the next process locking it
+        if self._file is None:
+            return
+        if sys.platform == "win32":
+            import msvcrt
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        # closing releases the flock
+        self._file.close()
+        self._file = None
+
+    def __enter__(self) -> "FolderLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.release()
+
+
+def get_pattern_version() -> str:
+    patterns = json.dumps(pattern_defaults, sort_keys=True)
+    return hash_bytes(f"{PIPELINE_VERSION}:{patterns}".encode())
+
+def source_version(source: str, pattern_version: str) -> str:
+    """The pattern version, plus the encoder profile for sources that are transcoded."""
+    if needs_transcode(source):
+        return hash_bytes(f"{pattern_version}:{' '.join(ARCHIVE_PROFILE)}".encode())
+    return pattern_version
+
+def _hash_bytes(data: (bytes | None)) -> str:
+    return hash_bytes(data) if data else ""
+
+def job_key(source_hash: str, payload_kwargs: dict[str, str], image_data: (bytes | None), pattern_version: str) -> str:
+    payload = json.dumps(payload_kwargs, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return f"{source_hash}:{_hash_bytes(payload)}:{_hash_bytes(image_data)}:{pattern_version}"
+
+
+class JobState:
+    """
+    Content keys of every song added to the save folder, so reruns skip songs whose
+    source audio, payload, cover and filename patterns are unchanged.
+    Source hashes are remembered by mtime and size so unchanged sources aren't rehashed either.
+    Jobs are looked up by source path, but a job only belongs to the song at that path while
+    it's audio hash matches: inboxes and upload folders reuse the same names for other songs.
+    """
+    def __init__(self, save_folder: str):
+        self.path = os.path.join(save_folder, JOB_STATE_FILENAME)
+        self.save_folder = save_folder
+        self._lock = threading.Lock()
+        self.jobs: dict[str, dict[str, Any]] = {}
+        # source -> ([mtime_ns, size], hash) of sources hashed since their last job
+        self._hashed: dict[str, tuple[list[int], str]] = {}
+
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as file:
+                    self.jobs = json.load(file)
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning("Ignoring unreadable job state, every song will be reprocessed")
+                logger.debug(e)
+
+    def source_hash(self, source: str) -> str:
+        stat = os.stat(source)
+        source_stat = [stat.st_mtime_ns, stat.st_size]
+        job = self.jobs.get(source)
+        if job and job.get("source_stat") == source_stat:
+            return job["source_hash"]
+        hashed = self._hashed.get(source)
+        if hashed and hashed[0] == source_stat:
+            return hashed[1]
+
+        source_hash = get_audio_hash(source)
+        if source_hash is None:
+            raise PipelineError(f"Unable to hash {source}")
+        self._hashed[source] = (source_stat, source_hash)
+        return source_hash
+
+    def _job_of(self, source: str) -> (dict[str, Any] | None):
+        """The job of the song last added from source, None when another song took it's path."""
+        job = self.jobs.get(source)
+        if not job:
+            return None
+        try:
+            source_hash = self.source_hash(source)
+        except (OSError, PipelineError):
+            return None
+        return job if job["source_hash"] == source_hash else None
+
+    def target_of(self, source: str) -> (str | None):
+        job = self._job_of(source)
+        return job["target"] if job else None
+
+    def is_up_to_date(self, source: str, key: str, target: str) -> bool:
+        job = self.jobs.get(source)
+        if not job or job["key"] != key or job["target"] != target:
+            return False
+
+        try:
+            stat = os.stat(os.path.join(self.save_folder, target))
+        except OSError:
+            return False
+        return job["output_stat"] == [stat.st_mtime_ns, stat.st_size]
+
+    def remove_previous_output(self, source: str, target: str) -> None:
+        """
+        A changed payload can rename the song, the output of the previous run is then obsolete.
+        Only the output of the same audio is, a different song at the same path keeps it's own.
+        """
+        job = self._job_of(source)
+        if not job or job["target"] == target:
+            return
+
+        previous_path = os.path.join(self.save_folder, job["target"])
+        try:
+            stat = os.stat(previous_path)
+            # on a case-insensitive filesystem a name differing in case only is the file just written
+            if os.path.samefile(previous_path, os.path.join(self.save_folder, target)):
+                return
+        except OSError:
+            return
+
+        # only remove it if nobody touched it since we wrote it
+        if job["output_stat"] == [stat.st_mtime_ns, stat.st_size]:
+            logger.info(f"Removing {job['target']}, it was renamed to {target}")
+            os.remove(previous_path)
+
+    def record(self, source: str, source_hash: str, key: str, target: str) -> None:
+        source_stat = os.stat(source)
+        output_stat = os.stat(os.path.join(self.save_folder, target))
+        with self._lock:
+            self.jobs[source] = {
+                "key": key,
+                "target": target,
+                "source_hash": source_hash,
+                "source_stat": [source_stat.st_mtime_ns, source_stat.st_size],
+                "output_stat": [output_stat.st_mtime_ns, output_stat.st_size],
+            }
+            self._hashed.pop(source, None)
+            self._save()
+
+    def _save(self) -> None:
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(self.jobs, file, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+
+
+class BatchReport:
+    def __init__(self) -> None:
+        self.added: list[str] = []
+        self.unchanged: list[str] = []
+        self.failed: dict[str, str] = {}
+        # source -> numbered name it was saved as, it's own name being taken
+        self.renamed: dict[str, str] = {}
+
+    def summary(self) -> str:
+        lines = [
+            f"Added: {len(self.added)}",
+            f"Unchanged (skipped): {len(self.unchanged)}",
+            f"Failed: {len(self.failed)}",
+        ]
+        if self.renamed:
+            lines.append(f"Renamed (name taken): {len(self.renamed)}")
+            lines.extend(f"  {source} -> {filename}" for source, filename in self.renamed.items())
+        lines.extend(f"  {source}: {error}" for source, error in self.failed.items())
+        return "\n".join(lines)
+
+
+def _find_cover(source: str) -> tuple[(str | None), (bytes | None)]:
+    """A cover next to the source, or the one attached to a source that's transcoded."""
+    for suffix, image_type in COVER_SUFFIXES.items():
+        cover_path = Path(source).with_suffix(suffix)
+        if cover_path.is_file():
+            return image_type, cover_path.read_bytes()
+    if needs_transcode(source):
+        # part of the job key, so a changed cover is added again
+        return embedded_cover(source)
+    return None, None
+
+def load_source_song_data(source: str) -> dict[str, Any]:
+    """The payload of a source song, from a '<name>.hjson' sidecar or the song itself."""
+    sidecar_path = Path(source).with_suffix(".hjson")
+    if sidecar_path.is_file():
+        for record in iter_sidecar_records(sidecar_path):
+            if record.error:
+                raise PipelineError(record.error)
+            return record.data
+
+    if needs_transcode(source):
+        raise PipelineError(f"No {sidecar_path.name} sidecar, it's required for {Path(source).suffix} sources")
+
+    _, song_data, _ = get_song_data(source)
+    if not song_data:
+        raise PipelineError("No payload found, add a .hjson sidecar next to the song")
+    return song_data
+
+def prepare_song(source: str, song_data: (dict[str, Any] | None) = None) -> tuple[Song, dict[str, str]]:
+    """Validates the payload of a source, song_data replacing the one of it's sidecar or tags."""
+    if song_data is None:
+        song_data = load_source_song_data(source)
+    payload_kwargs = payload_kwargs_from_song_data(song_data, os.path.basename(source))
+    with span("validate_payload"):
+        validate_payload(payload_kwargs)
+
+    song = Song(source)
+    with span("process_new_tags"):
+        process_new_tags(song, {field: payload_kwargs[arg] for field, arg in ARG_MAP.items()})
+    return song, payload_kwargs
+
+def collect_sources(paths: list[str]) -> list[str]:
+    sources: list[str] = []
+    for path in paths:
+        if os.path.isdir(path):
+            sources.extend(sorted(entry.path for entry in iter_files(path, SOURCE_SUFFIXES)))
+        else:
+            sources.append(path)
+    return sources
+
+def reserve_target(source: str, song: Song, planner: FilenamePlanner, job_state: JobState) -> bool:
+    """Reserves the target name of a prepared song, True when it had to be numbered."""
+    filename = planner.reserve(source, song.filename, job_state.target_of(source))
+    renamed = filename != song.filename
+    song.filename = filename
+    return renamed
+
+def _plan_song(source: str) -> tuple[Song, dict[str, str]]:
+    with song_scope(os.path.basename(source)), span("plan"):
+        return prepare_song(source)
+
+def plan_source(source: str, planner: FilenamePlanner, job_state: JobState) -> tuple[Song, dict[str, str]]:
+    song, payload_kwargs = _plan_song(source)
+    reserve_target(source, song, planner, job_state)
+    return song, payload_kwargs
+
+def process_source(source: str, save_folder: str, journal: Journal, job_state: JobState, pattern_version: str,
+                   planner: FilenamePlanner, planned: (tuple[Song, dict[str, str]] | None) = None) -> bool:
+    """
+    Adds one source song, returns False when it's output was already up to date. Raises on failure.
+    The target name is planned here unless the batch already did.
+    """
+    try:
+        if planned is None:
+            song, payload_kwargs = plan_source(source, planner, job_state)
+        else:
+            song, payload_kwargs = planned
+
+        with song_scope(os.path.basename(source)), span("prepare"):
+            image_type, image_data = _find_cover(source)
+            source_hash = job_state.source_hash(source)
+
+        key = job_key(source_hash, payload_kwargs, image_data, source_version(source, pattern_version))
+        if job_state.is_up_to_date(source, key, song.filename):
+            logger.debug(f"{song.filename} is up to date, skipping")
+            return False
+
+        # an archive file the planner let this song replace, in another case
+        replaced = planner.existing_name(song.filename)
+        journal.begin(source, song.filename)
+        add_song(song, payload_kwargs, save_folder, image_type, image_data, progress_logger(os.path.basename(source)))
+    except BaseException:
+        planner.release(source)
+        raise
+
+    journal.commit(source, song.filename)
+    job_state.remove_previous_output(source, song.filename)
+    remove_case_variant(save_folder, replaced, song.filename)
+    job_state.record(source, source_hash, key, song.filename)
+    logger.info(f"Finished processing of {song.filename}!")
+    return True
+
+def add_batch(sources: list[str], save_folder: str, workers: int = 1,
+              on_collision: str = "rename", max_path: int = WINDOWS_MAX_PATH,
+              transcode_workers: int = DEFAULT_TRANSCODE_WORKERS) -> BatchReport:
+    """
+    Adds every source song to the save folder. The target names of the whole batch are planned
+    before anything is written, so a name collision can't overwrite a song halfway through.
+    Sources that aren't MP3s go through their own pool of transcode_workers encoders alongside
+    the MP3s. Songs whose inputs didn't change since they were last added are skipped, the
+    journal is removed once the whole batch succeeded. Raises FolderInUseError when another
+    add, watch or service is writing to the save folder.
+    """
+    with FolderLock(save_folder):
+        report = BatchReport()
+        journal = Journal(save_folder)
+        journal.recover()
+        job_state = JobState(save_folder)
+        pattern_version = get_pattern_version()
+        planner = FilenamePlanner(save_folder, on_collision, max_path)
+
+        def fail(source: str, e: Exception) -> None:
+            report.failed[source] = str(e)
+            logger.error(f"Failed adding {source}: {e}")
+            logger.debug(e, exc_info=True)
+
+        def plan(source: str) -> (tuple[Song, dict[str, str]] | Exception):
+            try:
+                return _plan_song(source)
+            except Exception as e:
+                return e
+
+        def process(source: str) -> None:
+            try:
+                added = process_source(source, save_folder, journal, job_state, pattern_version, planner, planned[source])
+            except Exception as e:
+                fail(source, e)
+                return
+
+            if added:
+                report.added.append(source)
+            else:
+                report.unchanged.append(source)
+
+        planned: dict[str, tuple[Song, dict[str, str]]] = {}
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor, \
+             ThreadPoolExecutor(max_workers=max(1, transcode_workers), thread_name_prefix="transcode") as transcoder:
+            # reserved in source order, so which song of a collision keeps it's name doesn't depend on timing
+            for source, result in zip(sources, executor.map(plan, sources)):
+                if isinstance(result, Exception):
+                    fail(source, result)
+                    continue
+                try:
+                    if reserve_target(source, result[0], planner, job_state):
+                        report.renamed[source] = result[0].filename
+                except FilenameConflictError as e:
+                    fail(source, e)
+                    continue
+                planned[source] = result
+
+            # the encoders are the slow part, they start first
+            futures = [transcoder.submit(process, source) for source in planned if needs_transcode(source)]
+            futures.extend(executor.submit(process, source) for source in planned if not needs_transcode(source))
+            for future in futures:
+                future.result()
+
+        if not report.failed:
+            journal.close()
+
+        return report
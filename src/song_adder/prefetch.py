@@ -0,0 +1,103 @@
+import io
+import logging
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, cast
+
+from metadata_utils.CF_Program import get_song_data
+
+if TYPE_CHECKING:
+    from mutagen.id3 import APIC, ID3
+    from PIL.Image import Image
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = (300, 300)
+
+
+class PrefetchedSong:
+    def __init__(self, path: str, song_data: dict[str, str], audio_tags: "ID3", thumbnail: "Image | None"):
+        self.path = path
+        self.song_data = song_data
+        self.audio_tags = audio_tags
+        self.thumbnail = thumbnail
+
+
+def decode_thumbnail(audio_tags: "ID3") -> "Image | None":
+    """Decodes and resizes the embedded cover, safe to call outside the Tk thread."""
+    from PIL import Image
+
+    apic_frames = cast("list[APIC]", audio_tags.getall("APIC"))
+    if not apic_frames:
+        return None
+
+    img = Image.open(io.BytesIO(getattr(apic_frames[0], "data")))
+    return img.resize(THUMBNAIL_SIZE)
+
+def load_song_preview(path: str) -> PrefetchedSong:
+    _, song_data, audio_tags = get_song_data(path)
+
+    try:
+        thumbnail = decode_thumbnail(audio_tags)
+    except Exception as e:
+        logger.debug(f"Failed decoding the cover of {path}: {e}")
+        thumbnail = None
+
+    return PrefetchedSong(path, song_data, audio_tags, thumbnail)
+
+
+class Prefetcher:
+    """
+    Background thread loading the payload, tags and cover thumbnail of the songs the
+    operator is about to open into a small LRU cache.
+    """
+    def __init__(self, capacity: int = 8):
+        self.capacity = capacity
+        self._cache: OrderedDict[str, PrefetchedSong] = OrderedDict()
+        self._wanted: list[str] = []
+        self._condition = threading.Condition()
+        self._stopped = False
+
+        self._thread = threading.Thread(target=self._run, name="prefetcher", daemon=True)
+        self._thread.start()
+
+    def prefetch(self, paths: list[str]) -> None:
+        """Replaces the songs waiting to be loaded, the first one is loaded first."""
+        with self._condition:
+            self._wanted = [path for path in paths[:self.capacity] if path not in self._cache]
+            self._condition.notify()
+
+    def get(self, path: str) -> (PrefetchedSong | None):
+        with self._condition:
+            song = self._cache.get(path)
+            if song is not None:
+                self._cache.move_to_end(path)
+            return song
+
+    def stop(self) -> None:
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._wanted and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                path = self._wanted.pop(0)
+                if path in self._cache:
+                    continue
+
+            try:
+                song = load_song_preview(path)
+            except Exception as e:
+                logger.debug(f"Prefetching {path} failed: {e}")
+                continue
+
+            with self._condition:
+                self._cache[path] = song
+                self._cache.move_to_end(path)
+                while len(self._cache) > self.capacity:
+                    self._cache.popitem(last=False)
@@ -0,0 +1,70 @@
+import cProfile
+import io
+import logging
+import pstats
+import sys
+import tracemalloc
+from pathlib import Path
+from typing import Callable, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+PROFILE_FILENAME = "song_adder.prof"
+ALLOCATIONS_FILENAME = "song_adder_allocations.txt"
+
+TOP_FUNCTIONS = 20
+TOP_ALLOCATIONS = 30
+
+
+def run_profiled(func: Callable[[], T], output_dir: Path) -> T:
+    """
+    Runs func under cProfile and tracemalloc. The .prof file and the top allocations are
+    written next to song_adder.log, and the hottest functions are summarised at exit.
+    """
+    profile_path = output_dir / PROFILE_FILENAME
+    allocations_path = output_dir / ALLOCATIONS_FILENAME
+
+    tracemalloc.start(25)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        return func()
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        profiler.dump_stats(profile_path)
+        _write_allocations(snapshot, peak, allocations_path)
+
+        summary = io.StringIO()
+        stats = pstats.Stats(profiler, stream=summary)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_FUNCTIONS)
+
+        message = (
+            f"Profile written to {profile_path}, allocations to {allocations_path}\n"
+            f"Peak traced memory: {peak / 1_048_576:.1f} MB\n{summary.getvalue()}"
+        )
+        logger.info(message)
+        # the windowed build has no console
+        if sys.__stderr__ is not None:
+            print(message, file=sys.__stderr__)
+
+def _write_allocations(snapshot: tracemalloc.Snapshot, peak: int, path: Path) -> None:
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    top_stats = snapshot.statistics("traceback")
+
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(f"Peak traced memory: {peak / 1_048_576:.1f} MB\n")
+        file.write(f"Top {TOP_ALLOCATIONS} allocation sites still alive at exit:\n\n")
+        for index, stat in enumerate(top_stats[:TOP_ALLOCATIONS], 1):
+            file.write(f"#{index}: {stat.size / 1024:.1f} KiB in {stat.count} blocks\n")
+            for line in stat.traceback.format(limit=5):
+                file.write(f"    {line}\n")
+            file.write("\n")
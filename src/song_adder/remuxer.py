@@ -5,6 +5,10 @@ import sys
 logger = logging.getLogger(__name__)
 
 
+class RemuxError(Exception):
+    pass
+
+
 def remux_song(file_path: str, new_path: str) -> None:
 
     if sys.platform == "win32":
@@ -22,6 +26,8 @@ def remux_song(file_path: str, new_path: str) -> None:
                 "-map_metadata", "0", 
                 "-c:a", "copy",
                 "-write_xing", "1",
+                # explicit format, the output may be a temporary file without the .mp3 suffix
+                "-f", "mp3",
                 new_path
             ],
             shell=False,
@@ -30,11 +36,12 @@ def remux_song(file_path: str, new_path: str) -> None:
             encoding='utf-8',
             creationflags=cf_flag
         )
-        if result.returncode != 0:
-            logger.critical(f"ffmpeg encountered an issue. Stderr: {result.stderr}")
-            
     except Exception as e:
         logger.exception(e)
+        raise RemuxError(f"ffmpeg couldn't be run for {file_path}") from e
 
-    else:
-        logger.debug("Remuxing process run succesufully")
+    if result.returncode != 0:
+        logger.critical(f"ffmpeg encountered an issue. Stderr: {result.stderr}")
+        raise RemuxError(f"ffmpeg failed remuxing {file_path}")
+
+    logger.debug("Remuxing process run succesufully")
@@ -0,0 +1,486 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+from urllib.parse import parse_qs, urlsplit
+
+from metadata_utils.catalogue import PayloadCache, default_cache_path, iter_archive, iter_hash_checks
+from metadata_utils.data_verification import ValidationError, validate_payload
+from metadata_utils.filename_planner import WINDOWS_MAX_PATH, FilenamePlanner
+from metadata_utils.scanner import iter_files
+from metadata_utils.search import SongIndex
+
+from .pipeline import (
+    FolderLock,
+    Journal,
+    JobState,
+    PipelineError,
+    get_pattern_version,
+    payload_kwargs_from_song_data,
+    prepare_song,
+    process_source,
+    reserve_target,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8765
+
+# requests only carry paths and payloads, covers are read next to the sources
+MAX_BODY_SIZE = 1 << 20
+
+MAX_HEADER_COUNT = 100
+
+# finished jobs kept for GET /jobs/<id>, the oldest are forgotten first
+MAX_FINISHED_JOBS = 1000
+
+# the index is rebuilt after this long to pick up songs other tools put in the archive,
+# with the warm cache that's a listing and a stat per song
+INDEX_MAX_AGE = 60.0
+
+# Host names the service answers to, anything else is a DNS rebinding attempt
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "[::1]")
+
+REASONS = {
+    200: "OK", 202: "Accepted", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+    405: "Method Not Allowed", 413: "Payload Too Large", 415: "Unsupported Media Type", 500: "Internal Server Error",
+}
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class Job:
+    def __init__(self, job_id: str, kind: str, params: dict[str, Any]):
+        self.id = job_id
+        self.kind = kind
+        self.params = params
+        # 'queued', 'running', 'done' or 'failed'
+        self.status = "queued"
+        self.result: Any = None
+        self.error: (str | None) = None
+        self.created = time.time()
+        self.finished: (float | None) = None
+        self.done = asyncio.Event()
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "id": self.id, "kind": self.kind, "status": self.status, "params": self.params,
+            "result": self.result, "error": self.error, "created": self.created, "finished": self.finished,
+        }
+
+
+class Request:
+    def __init__(self, method: str, target: str, headers: dict[str, str], body: bytes):
+        self.method = method
+        url = urlsplit(target)
+        self.path = url.path.rstrip("/") or "/"
+        self.query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        self.headers = headers
+        self.body = body
+
+    def json(self) -> dict[str, Any]:
+        if not self.body:
+            return {}
+        try:
+            data = json.loads(self.body)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            raise HttpError(400, f"Invalid JSON: {e}")
+        if not isinstance(data, dict):
+            raise HttpError(400, "The body must be a JSON object")
+        return data
+
+    def check_local(self) -> None:
+        """
+        Browsers can reach localhost too, so requests from web pages are refused: they carry an
+        Origin, or a Host of the page's domain when it's name was rebound to 127.0.0.1.
+        A JSON content type can't be sent cross-origin without a preflight, which is never answered.
+        """
+        if "origin" in self.headers:
+            raise HttpError(403, "Cross-origin requests aren't allowed")
+        host = self.headers.get("host")
+        if host is not None:
+            hostname = host if host.endswith("]") else host.rsplit(":", 1)[0]
+            if hostname.lower() not in LOCAL_HOSTS:
+                raise HttpError(403, f"Requests for {host} aren't allowed")
+        if self.method == "POST":
+            content_type = self.headers.get("content-type", "").partition(";")[0].strip().lower()
+            if content_type != "application/json":
+                raise HttpError(415, "Bodies must be sent as application/json")
+
+    @property
+    def keep_alive(self) -> bool:
+        return self.headers.get("connection", "").lower() != "close"
+
+
+async def read_request(reader: asyncio.StreamReader) -> (Request | None):
+    """None once the client closed the connection between requests."""
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    try:
+        method, target, _ = request_line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise HttpError(400, "Malformed request line")
+
+    headers: dict[str, str] = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        if len(headers) >= MAX_HEADER_COUNT:
+            raise HttpError(400, "Too many headers")
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length", "0"))
+    except ValueError:
+        raise HttpError(400, "Invalid Content-Length")
+    if length > MAX_BODY_SIZE:
+        raise HttpError(413, f"Bodies are limited to {MAX_BODY_SIZE} bytes")
+    body = await reader.readexactly(length) if length > 0 else b""
+    return Request(method.upper(), target, headers, body)
+
+def encode_response(status: int, payload: Any, keep_alive: bool) -> bytes:
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    head = (
+        f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+        "Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    return head.encode("latin-1") + body
+
+
+def _required(params: dict[str, Any], name: str) -> Any:
+    if name not in params:
+        raise HttpError(400, f"Missing '{name}'")
+    return params[name]
+
+def _song_data_param(params: dict[str, Any]) -> (dict[str, Any] | None):
+    song_data = params.get("song_data")
+    if song_data is not None and not isinstance(song_data, dict):
+        raise HttpError(400, "'song_data' must be an object of payload fields")
+    return song_data
+
+
+class ArchiveService:
+    """
+    Long-running process adding songs to one archive. Payloads, audio hashes, the search
+    index, the job state and the filename reservations stay in memory between requests,
+    so a request costs the work of it's own songs only.
+    Adds and verifications are queued jobs run by a pool of workers, the rest is answered directly.
+    """
+    def __init__(self, save_folder: str, workers: int = 2, read_workers: int = 8,
+                 on_collision: str = "rename", max_path: int = WINDOWS_MAX_PATH):
+        self.save_folder = os.path.abspath(save_folder)
+        self.workers = max(1, workers)
+        self.read_workers = max(1, read_workers)
+
+        self.cache = PayloadCache(default_cache_path(self.save_folder))
+        self.journal = Journal(self.save_folder)
+        self.job_state = JobState(self.save_folder)
+        self.pattern_version = get_pattern_version()
+        self.planner = FilenamePlanner(self.save_folder, on_collision, max_path)
+        self.folder_lock = FolderLock(self.save_folder)
+
+        # job workers plus the direct requests and the archive reads
+        self.executor = ThreadPoolExecutor(max_workers=self.workers + 2)
+        # the payload cache isn't thread safe, archive walks take turns
+        self._archive_lock = threading.Lock()
+
+        self.jobs: OrderedDict[str, Job] = OrderedDict()
+        self._job_ids = itertools.count(1)
+        self._queue: (asyncio.Queue[Job] | None) = None
+        self._index: (SongIndex | None) = None
+        self._index_time = 0.0
+        self._index_lock: (asyncio.Lock | None) = None
+        # a failed add may have left temporary files for the journal's recovery
+        self._add_failed = False
+
+        self.routes: dict[tuple[str, str], Callable[[Request], Any]] = {
+            ("GET", "/health"): self.health,
+            ("POST", "/validate"): self.validate,
+            ("POST", "/preview"): self.preview,
+            ("GET", "/search"): self.search,
+            ("POST", "/add"): self.add,
+            ("POST", "/verify"): self.verify,
+            ("GET", "/jobs"): self.list_jobs,
+        }
+
+    async def _run(self, function: Callable[..., Any], *args: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    # archive knowledge
+
+    def _build_index(self) -> SongIndex:
+        index = SongIndex()
+        with self._archive_lock:
+            for path, song_data in iter_archive(self.save_folder, cache=self.cache, workers=self.read_workers):
+                index.add(path, song_data)
+            self.cache.save()
+        logger.info(f"Indexed {len(index)} songs from {self.save_folder}")
+        return index
+
+    async def index(self) -> SongIndex:
+        assert self._index_lock is not None
+        async with self._index_lock:
+            if self._index is None or time.monotonic() - self._index_time > INDEX_MAX_AGE:
+                self._index = await self._run(self._build_index)
+                self._index_time = time.monotonic()
+            return self._index
+
+    def _invalidate_index(self) -> None:
+        # added songs may have replaced indexed ones, the next search rebuilds from the warm cache
+        self._index = None
+
+    # direct requests
+
+    async def health(self, request: Request) -> tuple[int, Any]:
+        queued = sum(1 for job in self.jobs.values() if job.status in ("queued", "running"))
+        return 200, {"status": "ok", "archive": self.save_folder, "pending_jobs": queued}
+
+    async def validate(self, request: Request) -> tuple[int, Any]:
+        song_data = _song_data_param(request.json()) or {}
+        payload_kwargs = payload_kwargs_from_song_data(song_data, "request")
+        try:
+            validate_payload(payload_kwargs)
+        except ValidationError as e:
+            return 200, {"valid": False, "error": str(e)}
+        return 200, {"valid": True, "error": None}
+
+    def _preview(self, params: dict[str, Any]) -> dict[str, Any]:
+        source = params.get("source") or ""
+        song_data = _song_data_param(params)
+        if not source and song_data is None:
+            raise HttpError(400, "Expected 'source', 'song_data' or both")
+        try:
+            song, _ = prepare_song(source, song_data)
+        except (ValidationError, PipelineError) as e:
+            raise HttpError(400, str(e))
+        return {
+            "filename": song.filename, "title": song.title, "artist": song.artist, "album": song.album,
+            "track": song.track, "date": song.date, "comment": song.comment,
+            "existing": self.planner.existing_name(song.filename),
+            "length_error": self.planner.length_error(song.filename),
+        }
+
+    async def preview(self, request: Request) -> tuple[int, Any]:
+        return 200, await self._run(self._preview, request.json())
+
+    async def search(self, request: Request) -> tuple[int, Any]:
+        query = request.query
+        try:
+            limit = int(query["limit"]) if "limit" in query else None
+        except ValueError:
+            raise HttpError(400, "'limit' must be an integer")
+
+        index = await self.index()
+        results = index.search(
+            text=query.get("q"),
+            title=query.get("title"),
+            artist=query.get("artist"),
+            cover_artist=query.get("cover_artist"),
+            date_from=query.get("date_from"),
+            date_to=query.get("date_to"),
+            version=query.get("version"),
+            limit=limit
+        )
+        return 200, {"count": len(results), "songs": [{"path": song.path, **song.song_data} for song in results]}
+
+    # jobs
+
+    def _add(self, params: dict[str, Any]) -> dict[str, Any]:
+        source = os.path.abspath(params["source"])
+        if not os.path.isfile(source):
+            raise PipelineError(f"{source} doesn't exist")
+
+        song, payload_kwargs = prepare_song(source, params.get("song_data"))
+        # songs other tools put in the archive since the service started
+        self.planner.refresh()
+        reserve_target(source, song, self.planner, self.job_state)
+        added = process_source(source, self.save_folder, self.journal, self.job_state,
+                               self.pattern_version, self.planner, (song, payload_kwargs))
+        if added:
+            self._invalidate_index()
+        return {"added": added, "path": os.path.join(self.save_folder, song.filename)}
+
+    def _verify(self, params: dict[str, Any]) -> dict[str, Any]:
+        walk = not params.get("paths")
+        paths = [entry.path for entry in iter_files(self.save_folder)] if walk else params["paths"]
+        checked = 0
+        mismatches: list[dict[str, Any]] = []
+        with self._archive_lock:
+            for check in iter_hash_checks(paths, self.cache, self.read_workers):
+                checked += 1
+                if not check.ok:
+                    mismatches.append({"path": check.path, "expected": check.expected, "actual": check.actual})
+            if walk:
+                self.cache.prune(paths)
+            self.cache.save()
+        return {"checked": checked, "mismatches": mismatches}
+
+    async def _submit(self, request: Request, kind: str, params: dict[str, Any]) -> tuple[int, Any]:
+        assert self._queue is not None
+        job = Job(str(next(self._job_ids)), kind, params)
+        self.jobs[job.id] = job
+        self._forget_finished_jobs()
+        await self._queue.put(job)
+
+        if request.query.get("wait") not in (None, "0", "false"):
+            await job.done.wait()
+            return 200, job.as_dict()
+        return 202, job.as_dict()
+
+    async def add(self, request: Request) -> tuple[int, Any]:
+        params = request.json()
+        if not isinstance(_required(params, "source"), str):
+            raise HttpError(400, "'source' must be a path")
+        _song_data_param(params)
+        return await self._submit(request, "add", params)
+
+    async def verify(self, request: Request) -> tuple[int, Any]:
+        params = request.json()
+        paths = params.get("paths")
+        if paths is not None and not (isinstance(paths, list) and all(isinstance(p, str) for p in paths)):
+            raise HttpError(400, "'paths' must be a list of song paths")
+        return await self._submit(request, "verify", params)
+
+    async def list_jobs(self, request: Request) -> tuple[int, Any]:
+        status = request.query.get("status")
+        return 200, [job.as_dict() for job in self.jobs.values() if status is None or job.status == status]
+
+    async def get_job(self, request: Request, job_id: str) -> tuple[int, Any]:
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise HttpError(404, f"No job {job_id}")
+        if request.query.get("wait") not in (None, "0", "false"):
+            await job.done.wait()
+        return 200, job.as_dict()
+
+    def _forget_finished_jobs(self) -> None:
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished is not None]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+
+    async def job_worker(self) -> None:
+        assert self._queue is not None
+        handlers = {"add": self._add, "verify": self._verify}
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            try:
+                job.result = await self._run(handlers[job.kind], job.params)
+                job.status = "done"
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+                if job.kind == "add":
+                    self._add_failed = True
+                logger.error(f"Job {job.id} ({job.kind}) failed: {e}")
+                logger.debug(e, exc_info=True)
+            finally:
+                job.finished = time.time()
+                job.done.set()
+                self._queue.task_done()
+
+    # HTTP
+
+    async def dispatch(self, request: Request) -> tuple[int, Any]:
+        request.check_local()
+        if request.path.startswith("/jobs/"):
+            if request.method != "GET":
+                raise HttpError(405, f"{request.method} isn't allowed on {request.path}")
+            return await self.get_job(request, request.path.removeprefix("/jobs/"))
+
+        handler = self.routes.get((request.method, request.path))
+        if handler is None:
+            if any(path == request.path for _, path in self.routes):
+                raise HttpError(405, f"{request.method} isn't allowed on {request.path}")
+            raise HttpError(404, f"No endpoint {request.path}")
+        return await handler(request)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                keep_alive = False
+                try:
+                    request = await read_request(reader)
+                    if request is None:
+                        break
+                    keep_alive = request.keep_alive
+                    status, payload = await self.dispatch(request)
+                except HttpError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except Exception as e:
+                    logger.exception(e)
+                    status, payload = 500, {"error": str(e)}
+
+                writer.write(encode_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, port: int = DEFAULT_PORT, socket_path: (str | None) = None,
+                    ready: (Callable[[str], None] | None) = None) -> None:
+        """
+        Serves until cancelled, on localhost only or on a Unix socket. Raises FolderInUseError
+        when another add, watch or service is writing to the save folder.
+        """
+        self._queue = asyncio.Queue()
+        self._index_lock = asyncio.Lock()
+        self.folder_lock.acquire()
+        try:
+            await self._serve(port, socket_path, ready)
+        finally:
+            self.folder_lock.release()
+
+    async def _serve(self, port: int, socket_path: (str | None), ready: (Callable[[str], None] | None)) -> None:
+        self.journal.recover()
+
+        if socket_path:
+            server = await asyncio.start_unix_server(self.handle_connection, path=socket_path)
+            address = socket_path
+        else:
+            server = await asyncio.start_server(self.handle_connection, host="127.0.0.1", port=port)
+            address = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+
+        workers = [asyncio.create_task(self.job_worker()) for _ in range(self.workers)]
+        logger.info(f"Serving {self.save_folder} on {address}")
+        if ready is not None:
+            ready(address)
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            pending = self._queue.qsize()
+            if pending:
+                logger.warning(f"Stopped with {pending} queued jobs that never ran")
+            # waits for the songs being written, so the journal can be closed
+            self.executor.shutdown(wait=True)
+            with self._archive_lock:
+                self.cache.save()
+            # like add_batch, the journal is kept for the next start's recovery unless every add went through
+            if not self._add_failed:
+                self.journal.close()
+            if socket_path and os.path.exists(socket_path):
+                os.remove(socket_path)
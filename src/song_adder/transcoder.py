@@ -0,0 +1,170 @@
+import base64
+import logging
+import os
+import re
+import subprocess
+import sys
+from collections import deque
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+# sources encoded to MP3 instead of remuxed
+TRANSCODE_SUFFIXES = (".flac", ".wav", ".opus", ".m4a")
+
+SOURCE_SUFFIXES = (".mp3", *TRANSCODE_SUFFIXES)
+
+# the archive's MP3 profile, part of the job key so a profile change re-encodes every transcoded song
+ARCHIVE_PROFILE = ("-c:a", "libmp3lame", "-b:a", "320k", "-ar", "44100")
+
+# libmp3lame is single threaded, one encoder per core keeps the machine busy
+DEFAULT_TRANSCODE_WORKERS = os.cpu_count() or 1
+
+# ffmpeg's last stderr lines kept for the error message
+STDERR_TAIL = 20
+
+DURATION_PATTERN = re.compile(r"Duration: (\d+):(\d{2}):(\d{2}(?:\.\d+)?)")
+
+# attached picture MIME type -> image type of the APIC frame, the archive only holds these
+COVER_MIME_TYPES = {"image/jpeg": "jpeg", "image/jpg": "jpeg", "image/png": "png"}
+
+# picture type of a front cover, in FLAC and Vorbis pictures as in ID3
+FRONT_COVER = 3
+
+
+class TranscodeError(Exception):
+    pass
+
+
+def needs_transcode(path: str) -> bool:
+    return path.lower().endswith(TRANSCODE_SUFFIXES)
+
+def _seconds(hours: str, minutes: str, seconds: str) -> float:
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+def progress_logger(name: str, step: float = 0.25) -> Callable[[float], None]:
+    """Progress callback logging every step of a transcode."""
+    logged = [0.0]
+
+    def log(fraction: float) -> None:
+        if fraction - logged[0] >= step or (fraction >= 1.0 > logged[0]):
+            logged[0] = fraction
+            logger.info(f"Transcoding {name}: {fraction:.0%}")
+    return log
+
+def embedded_cover(file_path: str) -> tuple[(str | None), (bytes | None)]:
+    """
+    The image type and data of the picture attached to a source that's transcoded, the front
+    cover if there are several. The encode drops it, like every other tag.
+    """
+    from mutagen import File, MutagenError
+    from mutagen.flac import Picture
+    from mutagen.mp4 import MP4Cover
+
+    try:
+        audio = File(file_path)
+    except (MutagenError, OSError) as e:
+        logger.debug(f"Couldn't read the tags of {file_path}: {e}")
+        return None, None
+    if audio is None:
+        return None, None
+    tags = audio.tags if audio.tags is not None else {}
+
+    # (picture type, mime, data) of every attached picture
+    pictures: list[tuple[int, str, bytes]] = []
+    # FLAC
+    pictures.extend((picture.type, picture.mime, picture.data) for picture in getattr(audio, "pictures", []))
+    if hasattr(tags, "getall"):
+        # ID3 tags of WAV files
+        pictures.extend((frame.type, frame.mime, frame.data) for frame in tags.getall("APIC"))
+    elif "covr" in tags:
+        # M4A, without picture types
+        for cover in tags["covr"]:
+            mime = "image/png" if cover.imageformat == MP4Cover.FORMAT_PNG else "image/jpeg"
+            pictures.append((FRONT_COVER, mime, bytes(cover)))
+    elif "metadata_block_picture" in tags:
+        # Opus and Vorbis comments hold base64 encoded FLAC pictures
+        for value in tags["metadata_block_picture"]:
+            try:
+                picture = Picture(base64.b64decode(value))
+            except (ValueError, MutagenError):
+                continue
+            pictures.append((picture.type, picture.mime, picture.data))
+
+    pictures = [picture for picture in pictures if picture[1].lower() in COVER_MIME_TYPES and picture[2]]
+    if not pictures:
+        return None, None
+    _, mime, data = next((picture for picture in pictures if picture[0] == FRONT_COVER), pictures[0])
+    logger.debug(f"Using the cover embedded in {file_path}")
+    return COVER_MIME_TYPES[mime.lower()], data
+
+def transcode_song(file_path: str, new_path: str, progress: (Callable[[float], None] | None) = None) -> None:
+    """
+    Encodes any audio ffmpeg reads to the archive's MP3 profile, with a Xing header and without
+    tags, those are written by the pipeline. progress is called with the encoded fraction as
+    ffmpeg reports it.
+    """
+    if sys.platform == "win32":
+        # Windows-specific flag to hide the console
+        cf_flag = 0x08000000
+    else:
+        cf_flag = 0
+
+    command = [
+        "ffmpeg", "-y", "-hide_banner", "-nostdin", "-nostats",
+        # key=value progress blocks, interleaved with the log on stderr
+        "-progress", "pipe:2",
+        "-i", file_path,
+        "-map", "0:a:0",
+        "-map_metadata", "-1",
+        *ARCHIVE_PROFILE,
+        "-write_xing", "1",
+        "-id3v2_version", "0",
+        # explicit format, the output is a temporary file without the .mp3 suffix
+        "-f", "mp3",
+        new_path
+    ]
+
+    try:
+        process = subprocess.Popen(
+            command,
+            shell=False,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            creationflags=cf_flag
+        )
+    except Exception as e:
+        logger.exception(e)
+        raise TranscodeError(f"ffmpeg couldn't be run for {file_path}") from e
+
+    duration = 0.0
+    tail: deque[str] = deque(maxlen=STDERR_TAIL)
+    assert process.stderr is not None
+    with process:
+        for line in process.stderr:
+            line = line.strip()
+            key, separator, value = line.partition("=")
+            if separator and key.isidentifier():
+                # a progress line
+                if progress is None:
+                    continue
+                if key == "out_time_us" and value.isdigit() and duration:
+                    progress(min(1.0, int(value) / 1_000_000 / duration))
+                elif key == "progress" and value == "end":
+                    progress(1.0)
+                continue
+            if not duration:
+                match = DURATION_PATTERN.search(line)
+                if match:
+                    duration = _seconds(*match.groups())
+            tail.append(line)
+
+    if process.returncode != 0:
+        stderr = "\n".join(tail)
+        logger.critical(f"ffmpeg encountered an issue. Stderr: {stderr}")
+        raise TranscodeError(f"ffmpeg failed transcoding {file_path}")
+
+    logger.debug(f"Transcoded {file_path} in {duration:.1f}s of audio")
@@ -0,0 +1,236 @@
+import logging
+import os
+import shutil
+import threading
+import time
+import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+from metadata_utils.filename_planner import WINDOWS_MAX_PATH, FilenamePlanner
+
+from .pipeline import (COVER_SUFFIXES, BatchReport, FolderLock, Journal, JobState, PipelineError, get_pattern_version,
+                       process_source)
+from .transcoder import DEFAULT_TRANSCODE_WORKERS, SOURCE_SUFFIXES, needs_transcode
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 1.0
+
+# a song is only picked up once it and it's companions stopped changing for this long
+SETTLE_TIME = 2.0
+
+QUARANTINE_FOLDER = "quarantine"
+PROCESSED_FOLDER = "processed"
+
+COMPANION_SUFFIXES = (".hjson", *COVER_SUFFIXES)
+
+# (size, mtime_ns) of every file of the inbox
+Snapshot = dict[str, tuple[int, int]]
+
+# the stats of a song and of it's companions, None for the missing ones
+Signature = tuple[tuple[int, int] | None, ...]
+
+
+def _unique_destination(folder: Path, name: str) -> Path:
+    destination = folder / name
+    stem, suffix = os.path.splitext(name)
+    count = 2
+    while destination.exists():
+        destination = folder / f"{stem} ({count}){suffix}"
+        count += 1
+    return destination
+
+
+class InboxWatcher:
+    """
+    Polls an inbox folder and adds every new song to the save folder once it's fully written,
+    along with it's '<name>.hjson' sidecar and cover. FLAC, WAV, Opus and M4A songs are
+    transcoded by their own pool of encoders, they need a sidecar. Polling needs no extra service and works
+    the same on every platform and on network shares.
+    Added songs are moved to the processed folder, failed ones to the quarantine folder
+    with a '<name>.error.txt' explaining why.
+    """
+    def __init__(self, inbox: str, save_folder: str, quarantine: (str | None) = None,
+                 processed: (str | None) = None, workers: int = 2,
+                 poll_interval: float = POLL_INTERVAL, settle_time: float = SETTLE_TIME,
+                 on_collision: str = "rename", max_path: int = WINDOWS_MAX_PATH,
+                 transcode_workers: int = DEFAULT_TRANSCODE_WORKERS):
+        self.inbox = Path(inbox)
+        self.save_folder = save_folder
+        self.quarantine = Path(quarantine) if quarantine else self.inbox / QUARANTINE_FOLDER
+        self.processed = Path(processed) if processed else self.inbox / PROCESSED_FOLDER
+        self.workers = max(1, workers)
+        self.transcode_workers = max(1, transcode_workers)
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time
+
+        self.report = BatchReport()
+        self.journal = Journal(save_folder)
+        self.job_state = JobState(save_folder)
+        self.pattern_version = get_pattern_version()
+        self.planner = FilenamePlanner(save_folder, on_collision, max_path)
+
+        # source -> (signature, monotonic time it was first seen with it)
+        self._pending: dict[str, tuple[Signature, float]] = {}
+        self._in_flight: dict[str, Future[bool]] = {}
+        # source -> signature of the handled songs that couldn't be moved out of the inbox,
+        # they're only picked up again once they change
+        self._stranded: dict[str, Signature] = {}
+
+    def snapshot(self) -> Snapshot:
+        files: Snapshot = {}
+        try:
+            with os.scandir(self.inbox) as entries:
+                for entry in entries:
+                    # hidden files are temporary files of downloads and of the pipeline itself
+                    if entry.name.startswith("."):
+                        continue
+                    try:
+                        if not entry.is_file():
+                            continue
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    files[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        except OSError as e:
+            logger.error(f"Failed listing {self.inbox}")
+            logger.debug(e)
+        return files
+
+    @staticmethod
+    def _signature(name: str, files: Snapshot) -> Signature:
+        stem = os.path.splitext(name)[0]
+        return (files[name], *(files.get(stem + suffix) for suffix in COMPANION_SUFFIXES))
+
+    def poll(self, now: float) -> list[str]:
+        """
+        Returns the songs that are ready, a changed song or companion restarts it's wait.
+        A song still empty once settled is returned too, to be quarantined. Songs stranded
+        in the inbox are skipped until they change.
+        """
+        files = self.snapshot()
+        ready: list[str] = []
+        seen: set[str] = set()
+
+        for name in files:
+            if not name.lower().endswith(SOURCE_SUFFIXES):
+                continue
+            source = str(self.inbox / name)
+            seen.add(source)
+            if source in self._in_flight:
+                continue
+
+            signature = self._signature(name, files)
+            if source in self._stranded:
+                if self._stranded[source] == signature:
+                    continue
+                del self._stranded[source]
+
+            previous = self._pending.get(source)
+            if previous is None or previous[0] != signature:
+                self._pending[source] = (signature, now)
+            elif now - previous[1] >= self.settle_time:
+                ready.append(source)
+
+        for source in self._pending.keys() - seen:
+            del self._pending[source]
+        for source in self._stranded.keys() - seen:
+            del self._stranded[source]
+
+        return ready
+
+    def _companions(self, source: str) -> list[Path]:
+        stem = Path(source).with_suffix("")
+        paths = [Path(source)]
+        paths.extend(p for p in (stem.with_name(stem.name + suffix) for suffix in COMPANION_SUFFIXES) if p.exists())
+        return paths
+
+    def _move_all(self, source: str, folder: Path) -> Path:
+        folder.mkdir(parents=True, exist_ok=True)
+        destination = folder
+        for path in self._companions(source):
+            destination = _unique_destination(folder, path.name)
+            shutil.move(path, destination)
+        return destination
+
+    def _quarantine(self, source: str, error: BaseException) -> bool:
+        try:
+            self.quarantine.mkdir(parents=True, exist_ok=True)
+            error_path = _unique_destination(self.quarantine, f"{Path(source).stem}.error.txt")
+            with open(error_path, "w", encoding="utf-8") as file:
+                file.write(f"{source}\n{error}\n\n")
+                file.write("".join(traceback.format_exception(error)))
+            self._move_all(source, self.quarantine)
+        except OSError as e:
+            logger.error(f"Failed quarantining {source}, it's retried once it changes")
+            logger.debug(e)
+            return False
+        return True
+
+    def _process(self, source: str) -> bool:
+        """Adds source and moves it out of the inbox, returns False when it couldn't be moved."""
+        try:
+            if os.path.getsize(source) == 0:
+                raise PipelineError(f"{source} is empty")
+            added = process_source(source, self.save_folder, self.journal, self.job_state, self.pattern_version, self.planner)
+        except Exception as e:
+            self.report.failed[source] = str(e)
+            logger.error(f"Failed adding {source}, moving it to {self.quarantine}: {e}")
+            logger.debug(e, exc_info=True)
+            return self._quarantine(source, e)
+
+        if added:
+            self.report.added.append(source)
+        else:
+            self.report.unchanged.append(source)
+
+        try:
+            self._move_all(source, self.processed)
+        except OSError as e:
+            logger.error(f"Failed moving {source} out of the inbox, it's added again once it changes")
+            logger.debug(e)
+            return False
+        return True
+
+    def run(self, stop_event: (threading.Event | None) = None, once: bool = False) -> BatchReport:
+        """
+        Watches until stop_event is set. With once, returns as soon as every song
+        that was in the inbox has been handled, songs that couldn't be moved out of it included.
+        """
+        stop_event = stop_event or threading.Event()
+        with FolderLock(self.save_folder):
+            self.journal.recover()
+            logger.info(f"Watching {self.inbox}, adding to {self.save_folder}")
+
+            with ThreadPoolExecutor(max_workers=self.workers) as executor, \
+                 ThreadPoolExecutor(max_workers=self.transcode_workers, thread_name_prefix="transcode") as transcoder:
+                while True:
+                    for source, future in list(self._in_flight.items()):
+                        if future.done():
+                            del self._in_flight[source]
+                            signature, _ = self._pending.pop(source, (None, 0.0))
+                            if not future.result() and signature is not None:
+                                self._stranded[source] = signature
+
+                    ready = self.poll(time.monotonic())
+                    if ready:
+                        # songs other tools put in the archive since the last pick up
+                        self.planner.refresh()
+                    for source in ready:
+                        # bounded, the rest are picked up by the next polls
+                        if len(self._in_flight) >= (self.workers + self.transcode_workers) * 2:
+                            break
+                        logger.debug(f"Picked up {source}")
+                        pool = transcoder if needs_transcode(source) else executor
+                        self._in_flight[source] = pool.submit(self._process, source)
+
+                    if once and not self._pending and not self._in_flight:
+                        break
+                    if stop_event.wait(self.poll_interval):
+                        break
+
+            # like add_batch, the journal is kept for the next run's recovery unless everything went through
+            if not self.report.failed and not self._stranded:
+                self.journal.close()
+            return self.report
@@ -0,0 +1,20 @@
+import shutil
+
+import pytest
+
+from song_adder import pipeline
+from song_adder.bench.corpus import CorpusOptions, generate_corpus
+from song_adder.bench.e2e import standin_remux
+
+
+@pytest.fixture(autouse=True)
+def remux_without_ffmpeg(monkeypatch: pytest.MonkeyPatch) -> None:
+    if shutil.which("ffmpeg") is None:
+        monkeypatch.setattr(pipeline, "remux_song", standin_remux)
+
+
+@pytest.fixture
+def corpus(tmp_path_factory: pytest.TempPathFactory) -> list[str]:
+    """Short synthetic songs with their '.hjson' sidecars, song i holds song_data_for(i)."""
+    folder = tmp_path_factory.mktemp("corpus")
+    return generate_corpus(str(folder), CorpusOptions(songs=4, seconds=1.0, max_cover_kb=8, seed=1))
@@ -0,0 +1,47 @@
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+from metadata_utils import catalogue
+from metadata_utils.catalogue import PayloadCache, export_catalogue, iter_archive
+from song_adder.pipeline import add_batch
+
+
+def test_export_rows_are_sorted_by_path(corpus: list[str], tmp_path: Path) -> None:
+    archive = tmp_path / "archive"
+    archive.mkdir()
+    assert not add_batch(corpus, str(archive)).failed
+
+    output = tmp_path / "catalogue.jsonl"
+    assert export_catalogue(archive, output) == len(corpus)
+
+    paths = [json.loads(line)["Path"] for line in output.read_text(encoding="utf-8").splitlines()]
+    assert paths == sorted(paths)
+
+def test_walks_prune_deleted_songs_and_failed_reads_are_retried(corpus: list[str], tmp_path: Path,
+                                                              monkeypatch: pytest.MonkeyPatch) -> None:
+    archive = tmp_path / "archive"
+    archive.mkdir()
+    assert not add_batch(corpus, str(archive)).failed
+    songs = sorted(str(path) for path in archive.glob("*.mp3"))
+
+    cache = PayloadCache()
+    assert len(list(iter_archive(archive, cache=cache))) == len(songs)
+    assert sorted(cache.entries) == songs
+
+    os.remove(songs[0])
+    list(iter_archive(archive, cache=cache))
+    assert sorted(cache.entries) == songs[1:]
+
+    def unreadable(path: str) -> str:
+        raise OSError("locked by another program")
+
+    cache = PayloadCache()
+    monkeypatch.setattr(catalogue, "get_raw_json", unreadable)
+    assert list(iter_archive(archive, cache=cache)) == []
+    assert all("payload" not in entry for entry in cache.entries.values())
+
+    monkeypatch.undo()
+    assert len(list(iter_archive(archive, cache=cache))) == len(songs) - 1
@@ -0,0 +1,11 @@
+import pytest
+
+from song_adder.cli import run_cli
+
+
+def test_options_without_a_command_are_a_usage_error(capsys: pytest.CaptureFixture[str]) -> None:
+    with pytest.raises(SystemExit) as exit_info:
+        run_cli(["--timing"])
+
+    assert exit_info.value.code == 2
+    assert "required: command" in capsys.readouterr().err
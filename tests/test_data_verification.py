@@ -0,0 +1,67 @@
+import random
+
+import pytest
+
+from metadata_utils.data_verification import FIELD_VALIDATORS, ValidationError, validate_fields, validate_payload
+from song_adder.bench.corpus import song_data_for
+from song_adder.pipeline import payload_kwargs_from_song_data
+
+
+def _payload(**fields: str) -> dict[str, str]:
+    payload = {
+        "disc_number": "1",
+        "track": "3/12",
+        "date": "2024-02-10",
+        "version": "3.2",
+        "cover_artist": "Neuro",
+        "special": "0",
+    }
+    payload.update(fields)
+    return payload
+
+
+@pytest.mark.parametrize("field, value", [("track", "1/2/3"), ("version", "3.2.1"), ("track", "/"), ("version", ".")])
+def test_malformed_values_are_field_errors(field: str, value: str) -> None:
+    payload = _payload(**{field: value})
+
+    errors = validate_fields(payload, [field])
+    assert errors[field]
+    with pytest.raises(ValidationError):
+        validate_payload(payload)
+
+def test_valid_payload_has_no_errors() -> None:
+    payload = _payload()
+
+    assert validate_payload(payload)
+    assert not any(validate_fields(payload, payload).values())
+
+def test_corpus_payloads_are_valid() -> None:
+    for index in range(50):
+        payload = payload_kwargs_from_song_data(song_data_for(index), f"{index}.mp3")
+        assert validate_payload(payload)
+        assert not any(validate_fields(payload, FIELD_VALIDATORS).values())
+
+def test_edits_validated_one_at_a_time_match_a_full_validation() -> None:
+    values = {
+        "disc_number": ["1", "9", "66", "0", "10", ""],
+        "track": ["1", "3/12", "12/3", "0/4", "a", "1/2/3", ""],
+        "date": ["2023-02-01", "2023-05-30", "2024-01-01", "2099-01-01", "2020-01-01", "2024-13-01", "2024/01/01"],
+        "version": ["1", "2", "3", "3.2", "3.5", "4", "3.2.1", ""],
+        "cover_artist": ["Neuro", "Evil", "Neuro & Evil", "Evil & Neuro"],
+        "special": ["0", "1", "2"],
+    }
+    rng = random.Random(0)
+    payload = payload_kwargs_from_song_data(song_data_for(0), "0.mp3")
+    errors = validate_fields(payload, FIELD_VALIDATORS)
+
+    for _ in range(2000):
+        field = rng.choice(list(values))
+        payload[field] = rng.choice(values[field])
+        errors.update(validate_fields(payload, [field]))
+
+        assert errors == validate_fields(payload, FIELD_VALIDATORS)
+        if any(errors.values()):
+            with pytest.raises(ValidationError):
+                validate_payload(payload)
+        else:
+            assert validate_payload(payload)
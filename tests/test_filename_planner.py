@@ -0,0 +1,78 @@
+import json
+import shutil
+from pathlib import Path
+
+import pytest
+
+from metadata_utils.filename_planner import FilenameConflictError, FilenamePlanner, name_key
+from song_adder.bench.corpus import song_data_for
+from song_adder.pipeline import add_batch, prepare_song
+
+
+def _filename(source: str) -> str:
+    song, _ = prepare_song(source)
+    return song.filename
+
+
+def test_batch_collisions_are_numbered(corpus: list[str], tmp_path: Path) -> None:
+    planner = FilenamePlanner(str(tmp_path))
+    filename = _filename(corpus[0])
+
+    assert planner.reserve(corpus[0], filename) == filename
+    # reserving again for the same source keeps it's name
+    assert planner.reserve(corpus[0], filename) == filename
+    assert planner.reserve(corpus[1], filename.upper()) == filename.upper().replace(".MP3", " (2).MP3")
+
+    planner.release(corpus[0])
+    assert planner.reserve(corpus[2], filename) == filename
+
+def test_archive_names_collide_in_any_case(corpus: list[str], tmp_path: Path) -> None:
+    filename = _filename(corpus[0])
+    (tmp_path / filename.lower()).touch()
+    planner = FilenamePlanner(str(tmp_path))
+
+    assert planner.existing_name(filename) == filename.lower()
+    assert planner.reserve(corpus[0], filename).endswith(" (2).mp3")
+    # the file the source wrote last time may be replaced
+    assert planner.reserve(corpus[0], filename, owned=filename.lower()) == filename
+
+    with pytest.raises(FilenameConflictError):
+        FilenamePlanner(str(tmp_path), on_collision="fail").reserve(corpus[1], filename)
+    assert FilenamePlanner(str(tmp_path), on_collision="overwrite").reserve(corpus[1], filename) == filename
+
+def test_names_too_long_for_the_mirrors_are_rejected(corpus: list[str], tmp_path: Path) -> None:
+    planner = FilenamePlanner(str(tmp_path), max_path=len(str(tmp_path)) + 60)
+    filename = _filename(corpus[0])
+
+    assert planner.length_error(filename)
+    with pytest.raises(FilenameConflictError):
+        planner.reserve(corpus[0], filename)
+    assert FilenamePlanner(str(tmp_path), max_path=0).length_error(filename) is None
+
+def test_overwriting_a_case_variant_leaves_one_file(corpus: list[str], tmp_path: Path) -> None:
+    filename = _filename(corpus[0])
+    variant = filename.removesuffix(".mp3").upper() + ".mp3"
+    (tmp_path / variant).write_bytes(b"older song")
+
+    report = add_batch(corpus[:1], str(tmp_path), on_collision="overwrite")
+
+    assert not report.failed
+    assert sorted(path.name for path in tmp_path.glob("*.mp3")) == [filename]
+
+def test_renaming_in_another_case_replaces_the_previous_output(corpus: list[str], tmp_path: Path) -> None:
+    inbox, save_folder = tmp_path / "inbox", tmp_path / "archive"
+    inbox.mkdir()
+    save_folder.mkdir()
+    source = inbox / "upload.mp3"
+    shutil.copyfile(corpus[0], source)
+    song_data = song_data_for(0)
+    source.with_suffix(".hjson").write_text(json.dumps(song_data), encoding="utf-8")
+    assert not add_batch([str(source)], str(save_folder)).failed
+    first = [path.name for path in save_folder.glob("*.mp3")]
+
+    source.with_suffix(".hjson").write_text(json.dumps({**song_data, "Title": song_data["Title"].upper()}), encoding="utf-8")
+    assert not add_batch([str(source)], str(save_folder)).failed
+
+    songs = [path.name for path in save_folder.glob("*.mp3")]
+    assert len(songs) == 1
+    assert songs != first and name_key(songs[0]) == name_key(first[0])
@@ -0,0 +1,52 @@
+from pathlib import Path
+
+import hjson
+import pytest
+
+from metadata_utils.hjson_export import MANIFEST_FILENAME, extract_sidecars
+from metadata_utils.hjson_import import import_sidecars
+from song_adder.pipeline import add_batch
+
+
+@pytest.fixture
+def archive(tmp_path: Path, corpus: list[str]) -> Path:
+    archive = tmp_path / "archive"
+    archive.mkdir()
+    assert not add_batch(corpus, str(archive)).failed
+    return archive
+
+
+@pytest.mark.parametrize("per_disc", [False, True])
+def test_extracted_sidecars_import_back_unchanged(tmp_path: Path, archive: Path, per_disc: bool) -> None:
+    output = tmp_path / "sidecars"
+    assert extract_sidecars(archive, output, per_disc=per_disc).written == 4
+
+    report = import_sidecars(output, archive)
+    assert report.records == 4
+    assert report.unchanged == 4
+    assert not (report.engraved or report.unmatched or report.invalid or report.failed)
+
+def test_a_song_moved_to_another_disc_leaves_its_old_disc(tmp_path: Path, archive: Path) -> None:
+    output = tmp_path / "sidecars"
+    extract_sidecars(archive, output, per_disc=True)
+
+    records = hjson.loads((output / "Disc 1.hjson").read_text(encoding="utf-8"))
+    records[0]["Discnumber"] = "2"
+    edited = tmp_path / "edited.hjson"
+    edited.write_text(hjson.dumps(records), encoding="utf-8")
+    assert import_sidecars(edited, archive).engraved == 1
+
+    extract_sidecars(archive, output, per_disc=True)
+    assert not (output / "Disc 1.hjson").exists()
+    assert len(hjson.loads((output / "Disc 2.hjson").read_text(encoding="utf-8"))) == 2
+
+def test_sidecars_of_deleted_songs_are_removed(tmp_path: Path, archive: Path) -> None:
+    output = tmp_path / "sidecars"
+    extract_sidecars(archive, output)
+    deleted = sorted(archive.glob("*.mp3"))[0]
+    deleted.unlink()
+
+    extract_sidecars(archive, output)
+    assert not (output / deleted.with_suffix(".hjson").name).exists()
+    assert len(list(output.glob("*.hjson"))) == 3
+    assert str(deleted) not in (output / MANIFEST_FILENAME).read_text(encoding="utf-8")
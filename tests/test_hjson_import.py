@@ -0,0 +1,13 @@
+from pathlib import Path
+
+from metadata_utils.hjson_import import iter_sidecar_records
+
+
+def test_non_object_record_is_reported_alone(tmp_path: Path) -> None:
+    sidecar = tmp_path / "songs.hjson"
+    sidecar.write_text('[{"Title": "First"}, "oops", {"Title": "Third"}]', encoding="utf-8")
+
+    records = list(iter_sidecar_records(sidecar))
+
+    assert [record.data.get("Title") for record in records] == ["First", None, "Third"]
+    assert [record.error for record in records] == [None, "Record is not an object", None]
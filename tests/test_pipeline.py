@@ -0,0 +1,105 @@
+import json
+import os
+import shutil
+from pathlib import Path
+
+from song_adder.bench.corpus import song_data_for
+from song_adder.pipeline import JOB_STATE_FILENAME, JobState, Journal, add_batch, temp_path_for
+
+
+def _upload(song: str, inbox: Path, name: str = "upload") -> str:
+    """Copies a corpus song and it's sidecar to a fixed name, like an inbox or an upload folder."""
+    target = inbox / f"{name}.mp3"
+    shutil.copyfile(song, target)
+    shutil.copyfile(Path(song).with_suffix(".hjson"), target.with_suffix(".hjson"))
+    return str(target)
+
+def _archive_songs(save_folder: Path) -> list[str]:
+    return sorted(path.name for path in save_folder.glob("*.mp3"))
+
+
+def test_other_song_at_same_path_keeps_previous_output(corpus: list[str], tmp_path: Path) -> None:
+    inbox, save_folder = tmp_path / "inbox", tmp_path / "archive"
+    inbox.mkdir()
+    save_folder.mkdir()
+
+    source = _upload(corpus[0], inbox)
+    assert not add_batch([source], str(save_folder)).failed
+    first = _archive_songs(save_folder)
+
+    _upload(corpus[1], inbox)
+    assert not add_batch([source], str(save_folder)).failed
+
+    songs = _archive_songs(save_folder)
+    assert len(songs) == 2
+    assert set(first) < set(songs)
+    assert any(song_data_for(1)["Title"] in song for song in songs)
+
+def test_renamed_song_replaces_previous_output(corpus: list[str], tmp_path: Path) -> None:
+    inbox, save_folder = tmp_path / "inbox", tmp_path / "archive"
+    inbox.mkdir()
+    save_folder.mkdir()
+
+    source = _upload(corpus[0], inbox)
+    assert not add_batch([source], str(save_folder)).failed
+
+    song_data = {**song_data_for(0), "Title": "Renamed Song"}
+    Path(source).with_suffix(".hjson").write_text(json.dumps(song_data), encoding="utf-8")
+    assert not add_batch([source], str(save_folder)).failed
+
+    songs = _archive_songs(save_folder)
+    assert len(songs) == 1
+    assert "Renamed Song" in songs[0]
+
+def test_rerun_skips_unchanged_songs(corpus: list[str], tmp_path: Path) -> None:
+    save_folder = tmp_path / "archive"
+    save_folder.mkdir()
+
+    report = add_batch(corpus, str(save_folder))
+    assert sorted(report.added) == sorted(corpus)
+    assert not os.path.exists(save_folder / ".song_adder_journal.jsonl")
+
+    report = add_batch(corpus, str(save_folder))
+    assert not report.added
+    assert sorted(report.unchanged) == sorted(corpus)
+
+
+def test_journal_recovers_interrupted_writes(corpus: list[str], tmp_path: Path) -> None:
+    journal = Journal(str(tmp_path))
+    journal.begin(corpus[0], "first.mp3")
+    journal.commit(corpus[0], "first.mp3")
+    journal.begin(corpus[1], "second.mp3")
+    # the batch stopped mid-write, after a torn line
+    leftover = Path(temp_path_for(str(tmp_path / "second.mp3")))
+    leftover.touch()
+    with open(journal.path, "a", encoding="utf-8") as file:
+        file.write('{"event": "comm')
+
+    journal = Journal(str(tmp_path))
+    assert journal.committed == {corpus[0]: "first.mp3"}
+    assert journal.begun == {corpus[0]: "first.mp3", corpus[1]: "second.mp3"}
+
+    journal.recover()
+    assert not leftover.exists()
+    journal.close()
+    assert not os.path.exists(journal.path)
+
+def test_job_state_is_kept_between_runs(corpus: list[str], tmp_path: Path) -> None:
+    save_folder = tmp_path / "archive"
+    save_folder.mkdir()
+    assert not add_batch(corpus[:1], str(save_folder)).failed
+    target = _archive_songs(save_folder)[0]
+
+    job_state = JobState(str(save_folder))
+    job = job_state.jobs[corpus[0]]
+    assert job["target"] == target
+    assert job_state.source_hash(corpus[0]) == job["source_hash"]
+    assert job_state.is_up_to_date(corpus[0], job["key"], target)
+    assert not job_state.is_up_to_date(corpus[0], "another key", target)
+
+    # an output touched since it was written is processed again
+    (save_folder / target).write_bytes(b"")
+    assert not job_state.is_up_to_date(corpus[0], job["key"], target)
+
+    (save_folder / JOB_STATE_FILENAME).write_text("{", encoding="utf-8")
+    assert JobState(str(save_folder)).jobs == {}
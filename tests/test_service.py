@@ -0,0 +1,70 @@
+import asyncio
+import json
+from pathlib import Path
+
+import pytest
+
+from song_adder.pipeline import FolderInUseError, FolderLock, Journal, add_batch, prepare_song
+from song_adder.service import ArchiveService, HttpError, Request
+
+LOCAL = {"host": "127.0.0.1:8765", "content-type": "application/json"}
+
+
+def _dispatch(service: ArchiveService, method: str, path: str, headers: dict[str, str], body: bytes = b"") -> tuple[int, object]:
+    return asyncio.run(service.dispatch(Request(method, path, headers, body)))
+
+
+@pytest.fixture
+def service(tmp_path: Path) -> ArchiveService:
+    return ArchiveService(str(tmp_path))
+
+
+@pytest.mark.parametrize("headers", [
+    {**LOCAL, "origin": "http://127.0.0.1:8765"},
+    {**LOCAL, "host": "attacker.example:8765"},
+    {**LOCAL, "host": "attacker.example"},
+])
+def test_requests_from_web_pages_are_refused(service: ArchiveService, headers: dict[str, str]) -> None:
+    with pytest.raises(HttpError) as error:
+        _dispatch(service, "GET", "/health", headers)
+    assert error.value.status == 403
+
+@pytest.mark.parametrize("content_type", [None, "text/plain", "application/x-www-form-urlencoded"])
+def test_posts_need_a_json_content_type(service: ArchiveService, content_type: (str | None)) -> None:
+    headers = {"host": "localhost"}
+    if content_type:
+        headers["content-type"] = content_type
+    with pytest.raises(HttpError) as error:
+        _dispatch(service, "POST", "/validate", headers, b"{}")
+    assert error.value.status == 415
+
+@pytest.mark.parametrize("host", ["localhost", "localhost:8765", "127.0.0.1:8765", "[::1]:8765"])
+def test_local_requests_are_answered(service: ArchiveService, host: str) -> None:
+    headers = {**LOCAL, "host": host, "content-type": "application/json; charset=utf-8"}
+    body = json.dumps({"song_data": {}}).encode()
+    status, payload = _dispatch(service, "POST", "/validate", headers, body)
+    assert status == 200
+    assert payload["valid"] is False
+
+def test_adds_see_songs_written_after_startup(service: ArchiveService, corpus: list[str]) -> None:
+    song, _ = prepare_song(corpus[0])
+    # put there by another tool while the service was running
+    (Path(service.save_folder) / song.filename).write_bytes(b"")
+
+    result = service._add({"source": corpus[0]})
+    assert result["added"]
+    assert Path(result["path"]).name != song.filename
+    assert (Path(service.save_folder) / song.filename).read_bytes() == b""
+
+def test_a_folder_in_use_is_refused(service: ArchiveService, corpus: list[str]) -> None:
+    # the temporary file of another process's write in progress
+    Journal(service.save_folder).begin(corpus[0], "0.mp3")
+    temp_file = Path(service.save_folder) / ".0.mp3.1.1.part"
+    temp_file.write_bytes(b"")
+
+    with FolderLock(service.save_folder):
+        with pytest.raises(FolderInUseError):
+            asyncio.run(service.serve(port=0))
+        with pytest.raises(FolderInUseError):
+            add_batch(corpus[:1], service.save_folder)
+    assert temp_file.exists()
@@ -0,0 +1,82 @@
+import random
+import struct
+from pathlib import Path
+
+import pytest
+from mutagen.id3 import ID3, TIT2
+
+from metadata_utils.hash_mutagen import get_audio_hash, hash_file_range
+from metadata_utils.output_writer import serialize_tags, write_output
+from metadata_utils.stream_info import StreamInfoError, inspect_source, read_stream_info
+from song_adder.bench.corpus import audio_frames, id3v1_tag, side_info_size, xing_frame
+
+
+def _clean_song(corpus: list[str]) -> tuple[bytes, int]:
+    """The bytes of a corpus song with a Xing/Info header, and where it's first frame starts."""
+    inspection = inspect_source(corpus[0])
+    assert not inspection.needs_remux, inspection.reason
+    return Path(corpus[0]).read_bytes(), inspection.audio_start
+
+def _write(tmp_path: Path, data: bytes) -> str:
+    path = tmp_path / "variant.mp3"
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_songs_without_a_xing_header_need_the_remux(corpus: list[str]) -> None:
+    inspection = inspect_source(corpus[2])
+    assert inspection.needs_remux
+    assert inspection.reason == "no Xing/Info header"
+
+def test_junk_before_the_first_frame_needs_the_remux(corpus: list[str], tmp_path: Path) -> None:
+    data, start = _clean_song(corpus)
+    inspection = inspect_source(_write(tmp_path, data[:start] + b"\x00" * 10 + data[start:]))
+    assert inspection.needs_remux
+    assert inspection.reason == "10 bytes of junk before the first frame"
+
+def test_bytes_after_the_last_frame_need_the_remux(corpus: list[str], tmp_path: Path) -> None:
+    data, _ = _clean_song(corpus)
+    inspection = inspect_source(_write(tmp_path, data + b"\x00" * 100))
+    assert inspection.needs_remux
+    assert inspection.reason == "100 bytes after the last frame"
+
+def test_a_wrong_frame_count_needs_the_remux(corpus: list[str], tmp_path: Path) -> None:
+    data, start = _clean_song(corpus)
+    field = start + 4 + side_info_size(2) + 8
+    frames = struct.unpack_from(">I", data, field)[0]
+    inspection = inspect_source(_write(tmp_path, data[:field] + struct.pack(">I", frames + 1) + data[field + 4:]))
+    assert inspection.needs_remux
+    assert inspection.reason == f"the header announces {frames + 1} frames, the stream has {frames}"
+
+def test_a_file_ending_in_the_xing_header_is_an_error(corpus: list[str], tmp_path: Path) -> None:
+    data, start = _clean_song(corpus)
+    # the frame header, the side info and the magic
+    path = _write(tmp_path, data[start:start + 4 + side_info_size(2) + 4])
+
+    assert inspect_source(path).needs_remux
+    with pytest.raises(StreamInfoError):
+        read_stream_info(path)
+
+@pytest.mark.parametrize("id3v1", [False, True])
+def test_written_audio_hashes_like_the_source_range(corpus: list[str], tmp_path: Path, id3v1: bool) -> None:
+    data, _ = _clean_song(corpus)
+    source = _write(tmp_path, data + (id3v1_tag("Title", "Artist") if id3v1 else b""))
+    inspection = inspect_source(source)
+    assert not inspection.needs_remux, inspection.reason
+
+    tags = ID3()
+    tags.add(TIT2(encoding=3, text="Title"))
+    target = str(tmp_path / "output.mp3")
+    write_output(target, serialize_tags(tags), source, inspection.audio_start, inspection.audio_end)
+
+    assert hash_file_range(source, inspection.audio_start, inspection.audio_end) == get_audio_hash(target)
+
+def test_a_switch_between_stereo_and_mono_needs_the_remux(tmp_path: Path) -> None:
+    rng = random.Random(0)
+    stereo = audio_frames(rng, 10, [128] * 10, 44100, 2)
+    mono = audio_frames(rng, 10, [128] * 10, 44100, 1)
+    header = xing_frame(20, len(stereo) + len(mono), 128, 44100, 2, vbr=False)
+
+    inspection = inspect_source(_write(tmp_path, header + stereo + mono))
+    assert inspection.needs_remux
+    assert inspection.reason == "the format changes along the stream"
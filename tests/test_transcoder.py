@@ -0,0 +1,38 @@
+import struct
+from pathlib import Path
+
+from mutagen.flac import FLAC, Picture
+
+from song_adder.pipeline import _find_cover
+from song_adder.transcoder import embedded_cover
+
+
+def _flac(path: Path, *pictures: tuple[int, str, bytes]) -> str:
+    """A FLAC holding only it's metadata, enough for the tags to be read and written."""
+    # 4096 samples per block, 44100 Hz, 2 channels, 16 bits, 44100 samples
+    streaminfo = struct.pack(">HH", 4096, 4096) + bytes(6) + (44100 << 44 | 1 << 41 | 15 << 36 | 44100).to_bytes(8, "big") + bytes(16)
+    path.write_bytes(b"fLaC" + bytes([0x80]) + len(streaminfo).to_bytes(3, "big") + streaminfo)
+
+    audio = FLAC(path)
+    for picture_type, mime, data in pictures:
+        picture = Picture()
+        picture.type, picture.mime, picture.data = picture_type, mime, data
+        audio.add_picture(picture)
+    audio.save()
+    return str(path)
+
+
+def test_front_cover_is_taken_from_the_source(tmp_path: Path) -> None:
+    source = _flac(tmp_path / "song.flac", (4, "image/png", b"back"), (3, "image/jpeg", b"front"))
+    assert embedded_cover(source) == ("jpeg", b"front")
+
+def test_sibling_cover_wins_over_the_embedded_one(tmp_path: Path) -> None:
+    source = _flac(tmp_path / "song.flac", (3, "image/jpeg", b"front"))
+    assert _find_cover(source) == ("jpeg", b"front")
+
+    (tmp_path / "song.png").write_bytes(b"sibling")
+    assert _find_cover(source) == ("png", b"sibling")
+
+def test_source_without_cover(tmp_path: Path) -> None:
+    assert embedded_cover(_flac(tmp_path / "song.flac")) == (None, None)
+    assert embedded_cover(str(tmp_path / "missing.flac")) == (None, None)
@@ -0,0 +1,52 @@
+import shutil
+import threading
+from pathlib import Path
+
+from song_adder.pipeline import JOURNAL_FILENAME
+from song_adder.watcher import InboxWatcher
+
+
+def test_once_quarantines_empty_songs_and_exits(corpus: list[str], tmp_path: Path) -> None:
+    inbox, save_folder = tmp_path / "inbox", tmp_path / "archive"
+    inbox.mkdir()
+    save_folder.mkdir()
+    shutil.copyfile(corpus[0], inbox / "song.mp3")
+    shutil.copyfile(Path(corpus[0]).with_suffix(".hjson"), inbox / "song.hjson")
+    (inbox / "empty.mp3").touch()
+
+    watcher = InboxWatcher(str(inbox), str(save_folder), poll_interval=0.01, settle_time=0.05)
+    report = watcher.run(once=True)
+
+    assert len(report.added) == 1
+    assert list(report.failed) == [str(inbox / "empty.mp3")]
+    assert (inbox / "quarantine" / "empty.mp3").exists()
+    assert (inbox / "quarantine" / "empty.error.txt").exists()
+    # the failure keeps the journal for the next run's recovery
+    assert (save_folder / JOURNAL_FILENAME).exists()
+
+def test_once_skips_songs_that_cant_leave_the_inbox(corpus: list[str], tmp_path: Path) -> None:
+    inbox, save_folder = tmp_path / "inbox", tmp_path / "archive"
+    inbox.mkdir()
+    save_folder.mkdir()
+    shutil.copyfile(corpus[0], inbox / "song.mp3")
+    shutil.copyfile(Path(corpus[0]).with_suffix(".hjson"), inbox / "song.hjson")
+    (inbox / "empty.mp3").touch()
+    # files where the folders should be, moving anything there fails
+    (tmp_path / "quarantine").touch()
+    (tmp_path / "processed").touch()
+
+    watcher = InboxWatcher(str(inbox), str(save_folder), quarantine=str(tmp_path / "quarantine"),
+                           processed=str(tmp_path / "processed"), poll_interval=0.01, settle_time=0.05)
+    stop_event = threading.Event()
+    timeout = threading.Timer(5.0, stop_event.set)
+    timeout.start()
+    try:
+        report = watcher.run(stop_event, once=True)
+    finally:
+        timeout.cancel()
+
+    assert not stop_event.is_set()
+    assert len(report.added) == 1
+    assert not report.unchanged
+    assert list(report.failed) == [str(inbox / "empty.mp3")]
+    assert (inbox / "song.mp3").exists() and (inbox / "empty.mp3").exists()